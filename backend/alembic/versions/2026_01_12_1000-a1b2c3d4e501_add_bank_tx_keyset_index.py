@@ -0,0 +1,33 @@
+"""add_bank_tx_keyset_index
+
+Revision ID: a1b2c3d4e501
+Revises: 468aaa6ee01f
+Create Date: 2026-01-12 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1b2c3d4e501'
+down_revision: Union[str, None] = '468aaa6ee01f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Составной индекс под keyset-пагинацию списка транзакций
+    # (ORDER BY transaction_date DESC, id DESC), только активные записи
+    op.create_index(
+        'ix_bank_tx_active_date_id',
+        'bank_transactions',
+        ['transaction_date', 'id'],
+        postgresql_where=sa.text('is_active = true')
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bank_tx_active_date_id', table_name='bank_transactions')
@@ -0,0 +1,46 @@
+"""add_bank_tx_trigram_search
+
+Revision ID: a1b2c3d4e502
+Revises: a1b2c3d4e501
+Create Date: 2026-01-12 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1b2c3d4e502'
+down_revision: Union[str, None] = 'a1b2c3d4e501'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TRGM_INDEXES = {
+    'ix_bank_tx_counterparty_name_trgm': 'counterparty_name',
+    'ix_bank_tx_counterparty_inn_trgm': 'counterparty_inn',
+    'ix_bank_tx_payment_purpose_trgm': 'payment_purpose',
+    'ix_bank_tx_document_number_trgm': 'document_number',
+}
+
+
+def upgrade() -> None:
+    # pg_trgm: GIN-индексы обслуживают ILIKE '%term%' и word_similarity()
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    for index_name, column in TRGM_INDEXES.items():
+        op.create_index(
+            index_name,
+            'bank_transactions',
+            [column],
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'}
+        )
+
+
+def downgrade() -> None:
+    # Расширение не удаляем - оно может использоваться другими объектами
+    for index_name in TRGM_INDEXES:
+        op.drop_index(index_name, table_name='bank_transactions')
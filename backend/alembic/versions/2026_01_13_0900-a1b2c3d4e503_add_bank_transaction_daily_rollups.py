@@ -0,0 +1,86 @@
+"""add_bank_transaction_daily_rollups
+
+Revision ID: a1b2c3d4e503
+Revises: a1b2c3d4e502
+Create Date: 2026-01-13 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1b2c3d4e503'
+down_revision: Union[str, None] = 'a1b2c3d4e502'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add daily rollup table for bank transactions and backfill it."""
+    # Enum-типы уже существуют (созданы для bank_transactions)
+    transaction_type_enum = postgresql.ENUM(
+        'DEBIT', 'CREDIT', name='banktransactiontypeenum', create_type=False)
+    status_enum = postgresql.ENUM(
+        'NEW', 'CATEGORIZED', 'MATCHED', 'APPROVED', 'NEEDS_REVIEW', 'IGNORED',
+        name='banktransactionstatusenum', create_type=False)
+    payment_source_enum = postgresql.ENUM(
+        'BANK', 'CASH', name='paymentsourceenum', create_type=False)
+
+    op.create_table(
+        'bank_transaction_daily_rollups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('organization_id', sa.Integer(), nullable=True),
+        sa.Column('account_number', sa.String(length=20), nullable=True),
+        sa.Column('our_bank_name', sa.String(length=500), nullable=True),
+        sa.Column('our_bank_bik', sa.String(length=20), nullable=True),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('transaction_type', transaction_type_enum, nullable=True),
+        sa.Column('status', status_enum, nullable=True),
+        sa.Column('payment_source', payment_source_enum, nullable=True),
+        sa.Column('transaction_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_amount', sa.Numeric(18, 2), nullable=False, server_default='0'),
+        sa.Column('confidence_sum', sa.Numeric(18, 4), nullable=False, server_default='0'),
+        sa.Column('confidence_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_bank_transaction_daily_rollups_id', 'bank_transaction_daily_rollups', ['id'], unique=False)
+    op.create_index('ix_bt_daily_rollup_day', 'bank_transaction_daily_rollups', ['day'], unique=False)
+    op.create_index('ix_bt_daily_rollup_org_day', 'bank_transaction_daily_rollups', ['organization_id', 'day'], unique=False)
+    op.create_index('ix_bt_daily_rollup_account_day', 'bank_transaction_daily_rollups', ['account_number', 'day'], unique=False)
+
+    # Первичное заполнение из существующих транзакций
+    op.execute("""
+        INSERT INTO bank_transaction_daily_rollups (
+            day, organization_id, account_number, our_bank_name, our_bank_bik, category_id,
+            transaction_type, status, payment_source,
+            transaction_count, total_amount, confidence_sum, confidence_count
+        )
+        SELECT
+            transaction_date::date,
+            organization_id, account_number, our_bank_name, our_bank_bik, category_id,
+            transaction_type, status, payment_source,
+            COUNT(*),
+            COALESCE(SUM(amount), 0),
+            COALESCE(SUM(category_confidence) FILTER (WHERE category_confidence <> 0), 0),
+            COUNT(*) FILTER (WHERE category_confidence <> 0)
+        FROM bank_transactions
+        WHERE is_active = true
+        GROUP BY
+            transaction_date::date, organization_id, account_number, our_bank_name, our_bank_bik,
+            category_id, transaction_type, status, payment_source
+    """)
+
+
+def downgrade() -> None:
+    """Remove daily rollup table."""
+    op.drop_index('ix_bt_daily_rollup_account_day', table_name='bank_transaction_daily_rollups')
+    op.drop_index('ix_bt_daily_rollup_org_day', table_name='bank_transaction_daily_rollups')
+    op.drop_index('ix_bt_daily_rollup_day', table_name='bank_transaction_daily_rollups')
+    op.drop_index('ix_bank_transaction_daily_rollups_id', table_name='bank_transaction_daily_rollups')
+    op.drop_table('bank_transaction_daily_rollups')
@@ -0,0 +1,81 @@
+"""add_bank_account_summaries
+
+Revision ID: a1b2c3d4e504
+Revises: a1b2c3d4e503
+Create Date: 2026-01-13 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1b2c3d4e504'
+down_revision: Union[str, None] = 'a1b2c3d4e503'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add per-account summary table for /account-grouping and backfill it."""
+    op.create_table(
+        'bank_account_summaries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('account_number', sa.String(length=20), nullable=True),
+        sa.Column('organization_id', sa.Integer(), nullable=True),
+        sa.Column('our_bank_name', sa.String(length=500), nullable=True),
+        sa.Column('our_bank_bik', sa.String(length=20), nullable=True),
+        sa.Column('total_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('credit_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('debit_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('needs_processing_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('approved_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_credit_amount', sa.Numeric(18, 2), nullable=False, server_default='0'),
+        sa.Column('total_debit_amount', sa.Numeric(18, 2), nullable=False, server_default='0'),
+        sa.Column('last_transaction_date', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_bank_account_summaries_id', 'bank_account_summaries', ['id'], unique=False)
+    op.create_index('ix_bank_account_summaries_account_number', 'bank_account_summaries', ['account_number'], unique=False)
+    # Одна строка на ключ - цель ON CONFLICT при добавлении дельт.
+    # NULLS NOT DISTINCT (PostgreSQL 15+): группа без счета/банка - тоже одна строка
+    op.create_index(
+        'uq_bank_account_summaries_key',
+        'bank_account_summaries',
+        ['account_number', 'organization_id', 'our_bank_name', 'our_bank_bik'],
+        unique=True,
+        postgresql_nulls_not_distinct=True
+    )
+
+    # Первичное заполнение из существующих транзакций
+    op.execute("""
+        INSERT INTO bank_account_summaries (
+            account_number, organization_id, our_bank_name, our_bank_bik,
+            total_count, credit_count, debit_count, needs_processing_count, approved_count,
+            total_credit_amount, total_debit_amount, last_transaction_date
+        )
+        SELECT
+            account_number, organization_id, our_bank_name, our_bank_bik,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE transaction_type = 'CREDIT'),
+            COUNT(*) FILTER (WHERE transaction_type = 'DEBIT'),
+            COUNT(*) FILTER (WHERE status IN ('NEW', 'NEEDS_REVIEW')),
+            COUNT(*) FILTER (WHERE status = 'APPROVED'),
+            COALESCE(SUM(amount) FILTER (WHERE transaction_type = 'CREDIT'), 0),
+            COALESCE(SUM(amount) FILTER (WHERE transaction_type = 'DEBIT'), 0),
+            MAX(transaction_date)
+        FROM bank_transactions
+        WHERE is_active = true
+        GROUP BY account_number, organization_id, our_bank_name, our_bank_bik
+    """)
+
+
+def downgrade() -> None:
+    """Remove per-account summary table."""
+    op.drop_index('uq_bank_account_summaries_key', table_name='bank_account_summaries')
+    op.drop_index('ix_bank_account_summaries_account_number', table_name='bank_account_summaries')
+    op.drop_index('ix_bank_account_summaries_id', table_name='bank_account_summaries')
+    op.drop_table('bank_account_summaries')
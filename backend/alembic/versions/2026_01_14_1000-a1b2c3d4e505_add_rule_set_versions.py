@@ -0,0 +1,37 @@
+"""add_rule_set_versions
+
+Revision ID: a1b2c3d4e505
+Revises: a1b2c3d4e504
+Create Date: 2026-01-14 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1b2c3d4e505'
+down_revision: Union[str, None] = 'a1b2c3d4e504'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add version counter for the shared compiled rule set."""
+    op.create_table(
+        'rule_set_versions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Единственная строка счетчика
+    op.execute("INSERT INTO rule_set_versions (id, version) VALUES (1, 0)")
+
+
+def downgrade() -> None:
+    """Remove rule set version counter."""
+    op.drop_table('rule_set_versions')
@@ -0,0 +1,53 @@
+"""add_transaction_keywords
+
+Revision ID: a1b2c3d4e506
+Revises: a1b2c3d4e505
+Create Date: 2026-01-15 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1b2c3d4e506'
+down_revision: Union[str, None] = 'a1b2c3d4e505'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add inverted keyword index for payment purposes."""
+    op.create_table(
+        'transaction_keywords',
+        sa.Column('transaction_id', sa.Integer(), nullable=False),
+        sa.Column('keyword', sa.String(length=100), nullable=False),
+        sa.ForeignKeyConstraint(['transaction_id'], ['bank_transactions.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('transaction_id', 'keyword')
+    )
+    op.create_index(
+        'ix_transaction_keywords_keyword', 'transaction_keywords', ['keyword', 'transaction_id']
+    )
+
+    # Первичное заполнение - та же нормализация, что keyword_tokenizer.index_tokens():
+    # нижний регистр, без пунктуации по краям, длина 3..100, без чисел
+    op.execute(r"""
+        INSERT INTO transaction_keywords (transaction_id, keyword)
+        SELECT DISTINCT t.id, w.keyword
+        FROM bank_transactions t
+        CROSS JOIN LATERAL (
+            SELECT btrim(word, '.,;:!?()[]{}"''-') AS keyword
+            FROM regexp_split_to_table(lower(t.payment_purpose), '\s+') AS word
+        ) w
+        WHERE t.payment_purpose IS NOT NULL
+          AND length(w.keyword) BETWEEN 3 AND 100
+          AND w.keyword !~ '^[0-9]+$'
+    """)
+
+
+def downgrade() -> None:
+    """Remove payment purpose keyword index."""
+    op.drop_index('ix_transaction_keywords_keyword', table_name='transaction_keywords')
+    op.drop_table('transaction_keywords')
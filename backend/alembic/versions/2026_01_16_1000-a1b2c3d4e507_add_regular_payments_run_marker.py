@@ -0,0 +1,28 @@
+"""add_regular_payments_run_marker
+
+Revision ID: a1b2c3d4e507
+Revises: a1b2c3d4e506
+Create Date: 2026-01-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1b2c3d4e507'
+down_revision: Union[str, None] = 'a1b2c3d4e506'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add last run timestamp for incremental regular payments detection."""
+    op.add_column('sync_settings', sa.Column('last_regular_payments_run_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Remove regular payments run timestamp."""
+    op.drop_column('sync_settings', 'last_regular_payments_run_at')
@@ -0,0 +1,42 @@
+"""add_sync_watermarks
+
+Revision ID: a1b2c3d4e508
+Revises: a1b2c3d4e507
+Create Date: 2026-01-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1b2c3d4e508'
+down_revision: Union[str, None] = 'a1b2c3d4e507'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add per-collection watermarks and full sweep schedule for incremental 1C sync."""
+    op.create_table(
+        'sync_watermarks',
+        sa.Column('collection', sa.String(length=50), nullable=False),
+        sa.Column('last_document_date', sa.DateTime(), nullable=False),
+        sa.Column('last_ref_key', sa.String(length=36), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('collection')
+    )
+    op.add_column(
+        'sync_settings',
+        sa.Column('full_sync_interval_hours', sa.Integer(), server_default='24', nullable=False)
+    )
+    op.add_column('sync_settings', sa.Column('last_full_sync_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Remove incremental 1C sync watermarks."""
+    op.drop_column('sync_settings', 'last_full_sync_at')
+    op.drop_column('sync_settings', 'full_sync_interval_hours')
+    op.drop_table('sync_watermarks')
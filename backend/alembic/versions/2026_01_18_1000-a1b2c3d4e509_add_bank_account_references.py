@@ -0,0 +1,44 @@
+"""add_bank_account_references
+
+Revision ID: a1b2c3d4e509
+Revises: a1b2c3d4e508
+Create Date: 2026-01-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1b2c3d4e509'
+down_revision: Union[str, None] = 'a1b2c3d4e508'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add persisted 1C organization bank accounts catalog."""
+    op.create_table(
+        'bank_account_references',
+        sa.Column('ref_key', sa.String(length=36), nullable=False),
+        sa.Column('account_number', sa.String(length=20), nullable=True),
+        sa.Column('bank_key', sa.String(length=36), nullable=True),
+        sa.Column('bank_name', sa.String(length=500), nullable=True),
+        sa.Column('bank_bik', sa.String(length=20), nullable=True),
+        sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('ref_key')
+    )
+    op.create_index(
+        op.f('ix_bank_account_references_account_number'),
+        'bank_account_references', ['account_number']
+    )
+
+
+def downgrade() -> None:
+    """Remove 1C organization bank accounts catalog."""
+    op.drop_index(
+        op.f('ix_bank_account_references_account_number'), table_name='bank_account_references'
+    )
+    op.drop_table('bank_account_references')
@@ -0,0 +1,44 @@
+"""add_bank_tx_similarity_gist_indexes
+
+Revision ID: a1b2c3d4e510
+Revises: a1b2c3d4e509
+Create Date: 2026-01-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1b2c3d4e510'
+down_revision: Union[str, None] = 'a1b2c3d4e509'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+GIST_TRGM_INDEXES = {
+    'ix_bank_tx_counterparty_name_gist_trgm': 'counterparty_name',
+    'ix_bank_tx_payment_purpose_gist_trgm': 'payment_purpose',
+}
+
+
+def upgrade() -> None:
+    """Add GiST trigram indexes for KNN similar-transaction search."""
+    # Кандидаты похожих транзакций - только активные без категории
+    for index_name, column in GIST_TRGM_INDEXES.items():
+        op.create_index(
+            index_name,
+            'bank_transactions',
+            [column],
+            postgresql_using='gist',
+            postgresql_ops={column: 'gist_trgm_ops'},
+            postgresql_where=sa.text('is_active = true AND category_id IS NULL')
+        )
+
+
+def downgrade() -> None:
+    """Remove GiST trigram indexes."""
+    for index_name in GIST_TRGM_INDEXES:
+        op.drop_index(index_name, table_name='bank_transactions')
@@ -1,14 +1,18 @@
 """Bank transactions API endpoints - core module."""
-from typing import List, Optional
+import base64
+import binascii
+import json
+from collections import Counter
+from typing import List, Optional, Tuple
 from datetime import date, datetime, timedelta
 from decimal import Decimal
-from collections import defaultdict
 
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, or_, extract, case
+from sqlalchemy import func, or_, case, exists, select, tuple_
 from pydantic import BaseModel
 
+from app.core.config import settings
 from app.db.session import get_db
 from app.db.models import (
     BankTransaction, BudgetCategory, Organization, User, UserRoleEnum,
@@ -21,11 +25,6 @@ from app.schemas.bank_transaction import (
     BankTransactionBulkStatusUpdate, BankTransactionStats,
     BankTransactionImportResult, BankTransactionImportPreview,
     CategorySuggestion, BankTransactionList, BankTransactionAnalytics,
-    BankTransactionKPIs, MonthlyFlowData, DailyFlowData, CategoryBreakdown,
-    CounterpartyBreakdown, ProcessingFunnelData, ProcessingFunnelStage,
-    AIPerformanceData, ConfidenceBracket, LowConfidenceItem,
-    ActivityHeatmapPoint, StatusTimelinePoint, ConfidenceScatterPoint,
-    RegionalData, SourceDistribution, RegularPaymentSummary, ExhibitionData,
     RegularPaymentPattern, RegularPaymentPatternList,
     AccountGrouping, AccountGroupingList,
     RuleSuggestion, RuleSuggestionsResponse,
@@ -35,12 +34,48 @@ from app.schemas.bank_transaction import (
 from app.utils.auth import get_current_active_user
 from app.services.transaction_classifier import TransactionClassifier
 from app.services.bank_transaction_import import BankTransactionImporter
+from app.services.bank_transaction_analytics import BankTransactionAnalyticsService
+from app.services.cache import cache, CACHE_TTL
+from app.services.account_summary import (
+    get_account_grouping_delta, get_account_grouping_from_summary, rebuild_account_summary
+)
+from app.services.auto_matching import AutoMatchService
+from app.services.expense_matching import AutoMatchModeEnum
+from app.services.daily_rollup import rebuild_daily_rollup, rollup_query, rollup_stats
+from app.services.query_count import CountModeEnum, count_query, filter_signature
+from app.services.reclassification import ReclassificationService
+from app.services.similarity_search import find_similar_transactions
+from app.services.keyword_index import rebuild_keyword_index
+from app.services.keyword_tokenizer import count_keywords
+from app.services.transaction_search import build_search_filter, build_search_rank, contains_filter
 
 router = APIRouter(prefix="/bank-transactions", tags=["Bank Transactions"])
 
 
 # ==================== Helper Functions ====================
 
+def encode_transaction_cursor(transaction: BankTransaction) -> str:
+    """Кодирует позицию (transaction_date, id) в непрозрачный курсор."""
+    payload = json.dumps(
+        [transaction.transaction_date.isoformat(), transaction.id],
+        separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_transaction_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Декодирует курсор в (transaction_date, id). Бросает 400 при невалидном значении."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_date, raw_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(raw_date), int(raw_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
 def analyze_rule_suggestions(
     transactions: List[BankTransaction],
     category_id: int,
@@ -48,190 +83,107 @@ def analyze_rule_suggestions(
 ) -> RuleSuggestionsResponse:
     """
     Анализирует транзакции и возвращает предложения для создания правил.
+
+    Кандидаты (самые частые ИНН, название, операция и ключевое слово) считаются
+    в памяти, а флаги существующих правил, количество подходящих необработанных
+    транзакций и имя категории - одним запросом.
     """
     import logging
     logger = logging.getLogger(__name__)
 
     logger.info(f"🔍 Analyzing {len(transactions)} transactions for rule suggestions")
 
-    # Получаем имя категории
-    category = db.query(BudgetCategory).filter(BudgetCategory.id == category_id).first()
-    category_name = category.name if category else "Неизвестная категория"
-
-    suggestions_list = []
-
     # Собираем статистику по ИНН, названиям и операциям
-    inn_counter = {}
-    name_counter = {}
-    operation_counter = {}
-
-    for tx in transactions:
-        if tx.counterparty_inn:
-            inn_counter[tx.counterparty_inn] = inn_counter.get(tx.counterparty_inn, 0) + 1
-        if tx.counterparty_name:
-            name_counter[tx.counterparty_name] = name_counter.get(tx.counterparty_name, 0) + 1
-        if tx.business_operation:
-            operation_counter[tx.business_operation] = operation_counter.get(tx.business_operation, 0) + 1
+    inn_counter = Counter(tx.counterparty_inn for tx in transactions if tx.counterparty_inn)
+    name_counter = Counter(tx.counterparty_name for tx in transactions if tx.counterparty_name)
+    operation_counter = Counter(tx.business_operation for tx in transactions if tx.business_operation)
+    keyword_counter = count_keywords(tx.payment_purpose for tx in transactions)
 
     logger.info(f"📊 Stats: INNs={len(inn_counter)}, Names={len(name_counter)}, Operations={len(operation_counter)}")
 
-    # Анализируем ИНН
-    if inn_counter:
-        most_common_inn = max(inn_counter.items(), key=lambda x: x[1])
-
-        # Проверяем, нет ли уже такого правила
-        existing_rule = db.query(CategorizationRule).filter(
-            CategorizationRule.rule_type == CategorizationRuleTypeEnum.COUNTERPARTY_INN,
-            CategorizationRule.counterparty_inn == most_common_inn[0],
-            CategorizationRule.category_id == category_id,
-            CategorizationRule.is_active == True
-        ).first()
-
-        # Найдём имя контрагента для этого ИНН
-        counterparty_name = "Неизвестно"
-        for tx in transactions:
-            if tx.counterparty_inn == most_common_inn[0] and tx.counterparty_name:
-                counterparty_name = tx.counterparty_name
-                break
-
-        # Считаем, сколько существующих транзакций без категории подходят под это правило
-        matching_count = db.query(BankTransaction).filter(
-            BankTransaction.is_active == True,
-            BankTransaction.counterparty_inn == most_common_inn[0],
-            or_(
-                BankTransaction.category_id == None,
-                BankTransaction.status == BankTransactionStatusEnum.NEEDS_REVIEW
-            )
-        ).count()
+    T = BankTransaction
+    R = CategorizationRule
 
-        suggestions_list.append(RuleSuggestion(
-            rule_type="COUNTERPARTY_INN",
-            match_value=most_common_inn[0],
-            transaction_count=most_common_inn[1],
-            description=f"По ИНН контрагента: {counterparty_name} ({most_common_inn[0]})",
-            can_create=not existing_rule,
-            matching_existing_count=matching_count
-        ))
-
-    # Анализируем название контрагента
+    # (тип правила, значение, число транзакций, условие на транзакции, колонка правила)
+    candidates = []
+    if inn_counter:
+        value, count = max(inn_counter.items(), key=lambda x: x[1])
+        candidates.append((CategorizationRuleTypeEnum.COUNTERPARTY_INN, value, count,
+                           T.counterparty_inn == value, R.counterparty_inn))
     if name_counter:
-        most_common_name = max(name_counter.items(), key=lambda x: x[1])
-
-        existing_rule = db.query(CategorizationRule).filter(
-            CategorizationRule.rule_type == CategorizationRuleTypeEnum.COUNTERPARTY_NAME,
-            CategorizationRule.counterparty_name == most_common_name[0],
-            CategorizationRule.category_id == category_id,
-            CategorizationRule.is_active == True
-        ).first()
-
-        # Считаем подходящие транзакции
-        matching_count = db.query(BankTransaction).filter(
-            BankTransaction.is_active == True,
-            BankTransaction.counterparty_name == most_common_name[0],
-            or_(
-                BankTransaction.category_id == None,
-                BankTransaction.status == BankTransactionStatusEnum.NEEDS_REVIEW
-            )
-        ).count()
-
-        suggestions_list.append(RuleSuggestion(
-            rule_type="COUNTERPARTY_NAME",
-            match_value=most_common_name[0],
-            transaction_count=most_common_name[1],
-            description=f"По названию контрагента: {most_common_name[0]}",
-            can_create=not existing_rule,
-            matching_existing_count=matching_count
-        ))
-
-    # Анализируем хозяйственную операцию
+        value, count = max(name_counter.items(), key=lambda x: x[1])
+        candidates.append((CategorizationRuleTypeEnum.COUNTERPARTY_NAME, value, count,
+                           T.counterparty_name == value, R.counterparty_name))
     if operation_counter:
-        most_common_operation = max(operation_counter.items(), key=lambda x: x[1])
+        value, count = max(operation_counter.items(), key=lambda x: x[1])
+        candidates.append((CategorizationRuleTypeEnum.BUSINESS_OPERATION, value, count,
+                           T.business_operation == value, R.business_operation))
+    if keyword_counter:
+        # Ключевое слово - только если встречается в большинстве транзакций (>50%)
+        value, count = max(keyword_counter.items(), key=lambda x: x[1])
+        if count >= len(transactions) * 0.5:
+            candidates.append((CategorizationRuleTypeEnum.KEYWORD, value, count,
+                               contains_filter(T.payment_purpose, value), R.keyword))
+
+    # Один запрос: имя категории + по каждому кандидату флаг правила и счетчик транзакций
+    columns = [
+        select(BudgetCategory.name).where(BudgetCategory.id == category_id)
+        .scalar_subquery().label('category_name')
+    ]
+    for index, (rule_type, value, _, tx_condition, rule_column) in enumerate(candidates):
+        columns.append(exists().where(
+            R.rule_type == rule_type,
+            rule_column == value,
+            R.category_id == category_id,
+            R.is_active == True
+        ).label(f'rule_exists_{index}'))
+        columns.append(func.count(T.id).filter(tx_condition).label(f'matching_{index}'))
+
+    query = select(*columns)
+    if candidates:
+        query = query.select_from(T).where(
+            T.is_active == True,
+            or_(
+                T.category_id == None,
+                T.status == BankTransactionStatusEnum.NEEDS_REVIEW
+            ),
+            or_(*[candidate[3] for candidate in candidates])
+        )
+    row = db.execute(query).one()._mapping
 
-        existing_rule = db.query(CategorizationRule).filter(
-            CategorizationRule.rule_type == CategorizationRuleTypeEnum.BUSINESS_OPERATION,
-            CategorizationRule.business_operation == most_common_operation[0],
-            CategorizationRule.category_id == category_id,
-            CategorizationRule.is_active == True
-        ).first()
+    descriptions = {
+        CategorizationRuleTypeEnum.COUNTERPARTY_NAME: "По названию контрагента: {value}",
+        CategorizationRuleTypeEnum.BUSINESS_OPERATION: "По хозяйственной операции: {value}",
+        CategorizationRuleTypeEnum.KEYWORD: "По ключевому слову: '{value}'",
+    }
 
-        # Считаем подходящие транзакции
-        matching_count = db.query(BankTransaction).filter(
-            BankTransaction.is_active == True,
-            BankTransaction.business_operation == most_common_operation[0],
-            or_(
-                BankTransaction.category_id == None,
-                BankTransaction.status == BankTransactionStatusEnum.NEEDS_REVIEW
+    suggestions_list = []
+    for index, (rule_type, value, count, _, _) in enumerate(candidates):
+        if rule_type == CategorizationRuleTypeEnum.COUNTERPARTY_INN:
+            # Имя контрагента для этого ИНН
+            counterparty_name = next(
+                (tx.counterparty_name for tx in transactions
+                 if tx.counterparty_inn == value and tx.counterparty_name),
+                "Неизвестно"
             )
-        ).count()
+            description = f"По ИНН контрагента: {counterparty_name} ({value})"
+        else:
+            description = descriptions[rule_type].format(value=value)
 
         suggestions_list.append(RuleSuggestion(
-            rule_type="BUSINESS_OPERATION",
-            match_value=most_common_operation[0],
-            transaction_count=most_common_operation[1],
-            description=f"По хозяйственной операции: {most_common_operation[0]}",
-            can_create=not existing_rule,
-            matching_existing_count=matching_count
+            rule_type=rule_type.value,
+            match_value=value,
+            transaction_count=count,
+            description=description,
+            can_create=not row[f'rule_exists_{index}'],
+            matching_existing_count=row[f'matching_{index}']
         ))
 
-    # Анализируем ключевые слова из назначения платежа
-    stop_words = {
-        'для', 'при', 'или', 'без', 'под', 'над', 'перед', 'после',
-        'через', 'между', 'среди', 'вместо', 'кроме', 'около', 'вдоль',
-        'оплата', 'плата', 'платеж', 'счет', 'счёт', 'счету', 'договор',
-        'договору', 'номер', 'дата', 'период', 'услуги', 'услуг',
-        'работы', 'работ', 'товар', 'товара', 'товаров', 'включая',
-        'также', 'всего', 'итого', 'сумма', 'сумму', 'рублей', 'рубль',
-        'копеек', 'копейка', 'безналичный', 'наличный', 'перевод',
-        'перечисление', 'возврат', 'аванс', 'предоплата', 'доплата',
-        'числе', 'число', 'включительно',
-    }
-
-    keyword_counter = {}
-    for tx in transactions:
-        if tx.payment_purpose:
-            words = tx.payment_purpose.lower().split()
-            for word in words:
-                clean_word = word.strip('.,;:!?()[]{}"\'-')
-                if len(clean_word) >= 5 and clean_word not in stop_words:
-                    keyword_counter[clean_word] = keyword_counter.get(clean_word, 0) + 1
-
-    if keyword_counter:
-        # Берём самое частое ключевое слово
-        most_common_keyword = max(keyword_counter.items(), key=lambda x: x[1])
-
-        # Проверяем только если слово встречается в большинстве транзакций (>50%)
-        if most_common_keyword[1] >= len(transactions) * 0.5:
-            existing_rule = db.query(CategorizationRule).filter(
-                CategorizationRule.rule_type == CategorizationRuleTypeEnum.KEYWORD,
-                CategorizationRule.keyword == most_common_keyword[0],
-                CategorizationRule.category_id == category_id,
-                CategorizationRule.is_active == True
-            ).first()
-
-            # Считаем подходящие транзакции (ищем ключевое слово в назначении платежа)
-            matching_count = db.query(BankTransaction).filter(
-                BankTransaction.is_active == True,
-                BankTransaction.payment_purpose.ilike(f"%{most_common_keyword[0]}%"),
-                or_(
-                    BankTransaction.category_id == None,
-                    BankTransaction.status == BankTransactionStatusEnum.NEEDS_REVIEW
-                )
-            ).count()
-
-            suggestions_list.append(RuleSuggestion(
-                rule_type="KEYWORD",
-                match_value=most_common_keyword[0],
-                transaction_count=most_common_keyword[1],
-                description=f"По ключевому слову: '{most_common_keyword[0]}'",
-                can_create=not existing_rule,
-                matching_existing_count=matching_count
-            ))
-
     result = RuleSuggestionsResponse(
         suggestions=suggestions_list,
         total_transactions=len(transactions),
         category_id=category_id,
-        category_name=category_name
+        category_name=row['category_name'] or "Неизвестная категория"
     )
 
     logger.info(f"✅ Generated {len(suggestions_list)} rule suggestions")
@@ -284,6 +236,7 @@ def create_categorization_rule_from_suggestion(
 def get_bank_transactions(
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     status: Optional[BankTransactionStatusEnum] = None,
     transaction_type: Optional[BankTransactionTypeEnum] = None,
     payment_source: Optional[str] = None,
@@ -294,10 +247,25 @@ def get_bank_transactions(
     category_id: Optional[int] = None,
     organization_id: Optional[int] = None,
     only_unprocessed: bool = False,
+    count_mode: CountModeEnum = CountModeEnum.EXACT,
+    sort_by_relevance: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get bank transactions with filters."""
+    """
+    Get bank transactions with filters.
+
+    Два режима пагинации:
+    - offset (skip/limit) - для совместимости, глубокие страницы медленные;
+    - keyset (cursor/limit) - курсор берется из next_cursor предыдущего ответа,
+      skip при этом игнорируется.
+
+    count_mode: exact - точный COUNT(*), estimated - оценка планировщика,
+    cached - COUNT(*) из кэша по сигнатуре фильтров. Флаг total_is_exact в ответе.
+
+    sort_by_relevance: при заданном search сортировать по релевантности
+    (только offset-режим; keyset-курсор всегда идет по дате).
+    """
     base_query = db.query(BankTransaction).filter(BankTransaction.is_active == True)
 
     # Status filter
@@ -323,7 +291,7 @@ def get_bank_transactions(
     if date_from:
         base_query = base_query.filter(BankTransaction.transaction_date >= date_from)
     if date_to:
-        base_query = base_query.filter(BankTransaction.transaction_date <= date_to)
+        base_query = base_query.filter(BankTransaction.transaction_date < date_to + timedelta(days=1))
 
     # Category filter - special handling for null (no category)
     if category_id is not None:
@@ -345,30 +313,58 @@ def get_bank_transactions(
 
     # Search
     if search:
-        search_term = f"%{search}%"
-        base_query = base_query.filter(
-            or_(
-                BankTransaction.counterparty_name.ilike(search_term),
-                BankTransaction.counterparty_inn.ilike(search_term),
-                BankTransaction.payment_purpose.ilike(search_term),
-                BankTransaction.document_number.ilike(search_term)
-            )
-        )
+        base_query = base_query.filter(build_search_filter(search))
 
     # Get total count
-    total = base_query.count()
+    count_cache_key = None
+    if count_mode == CountModeEnum.CACHED:
+        count_cache_key = filter_signature("bank_tx:count", {
+            "status": status,
+            "transaction_type": transaction_type,
+            "payment_source": payment_source,
+            "account_number": account_number,
+            "date_from": date_from,
+            "date_to": date_to,
+            "search": search,
+            "category_id": category_id,
+            "organization_id": organization_id,
+            "only_unprocessed": only_unprocessed,
+        })
+    total, total_is_exact = count_query(db, base_query, count_mode, count_cache_key)
 
     # Order and paginate
     query = base_query.options(
         joinedload(BankTransaction.category_rel),
         joinedload(BankTransaction.organization_rel),
         joinedload(BankTransaction.suggested_category_rel)
-    ).order_by(
+    )
+
+    search_rank = None
+    if search and sort_by_relevance and not cursor:
+        search_rank = build_search_rank(db, search)
+    if search_rank is not None:
+        query = query.order_by(search_rank.desc())
+
+    query = query.order_by(
         BankTransaction.transaction_date.desc(),
         BankTransaction.id.desc()
-    ).offset(skip).limit(limit)
+    )
 
-    transactions = query.all()
+    if cursor:
+        # Keyset: строки строго "после" последней выданной в порядке (date desc, id desc)
+        cursor_date, cursor_id = decode_transaction_cursor(cursor)
+        query = query.filter(
+            tuple_(BankTransaction.transaction_date, BankTransaction.id)
+            < tuple_(cursor_date, cursor_id)
+        )
+    else:
+        query = query.offset(skip)
+
+    transactions = query.limit(limit).all()
+
+    next_cursor = None
+    if search_rank is None and limit > 0 and len(transactions) == limit:
+        next_cursor = encode_transaction_cursor(transactions[-1])
 
     # Add related names
     result = []
@@ -380,7 +376,8 @@ def get_bank_transactions(
         result.append(BankTransactionResponse(**t_dict))
 
     # Calculate pagination info
-    page = (skip // limit) + 1 if limit > 0 else 1
+    # В keyset-режиме номер страницы неизвестен - возвращаем 1
+    page = (skip // limit) + 1 if limit > 0 and not cursor else 1
     pages = (total + limit - 1) // limit if limit > 0 else 1
 
     return BankTransactionList(
@@ -388,7 +385,9 @@ def get_bank_transactions(
         items=result,
         page=page,
         page_size=limit,
-        pages=pages
+        pages=pages,
+        next_cursor=next_cursor,
+        total_is_exact=total_is_exact
     )
 
 
@@ -402,17 +401,54 @@ def get_stats(
     category_id: Optional[int] = None,
     organization_id: Optional[int] = None,
     search: Optional[str] = None,
+    use_cache: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get transaction statistics."""
+    """
+    Get transaction statistics.
+
+    use_cache: брать результат из короткоживущего кэша по сигнатуре фильтров.
+    """
+    stats_cache_key = None
+    if use_cache:
+        stats_cache_key = filter_signature("bank_tx:stats", {
+            "date_from": date_from,
+            "date_to": date_to,
+            "transaction_type": transaction_type,
+            "payment_source": payment_source,
+            "account_number": account_number,
+            "category_id": category_id,
+            "organization_id": organization_id,
+            "search": search,
+        })
+        cached_result = cache.get(stats_cache_key)
+        if cached_result is not None:
+            return BankTransactionStats(**cached_result)
+
+    if not search and settings.DAILY_ROLLUP_ENABLED:
+        # Без текстового поиска все фильтры покрываются дневными агрегатами
+        result = BankTransactionStats(**rollup_stats(rollup_query(
+            db,
+            date_from=date_from,
+            date_to=date_to,
+            transaction_type=transaction_type,
+            payment_source=payment_source,
+            account_number=account_number,
+            category_id=category_id,
+            organization_id=organization_id,
+        )))
+        if stats_cache_key:
+            cache.set(stats_cache_key, result.model_dump(), ttl=CACHE_TTL["bank_tx_stats"])
+        return result
+
     query = db.query(BankTransaction).filter(BankTransaction.is_active == True)
 
     # Date range
     if date_from:
         query = query.filter(BankTransaction.transaction_date >= date_from)
     if date_to:
-        query = query.filter(BankTransaction.transaction_date <= date_to)
+        query = query.filter(BankTransaction.transaction_date < date_to + timedelta(days=1))
 
     # Transaction type filter
     if transaction_type:
@@ -442,551 +478,167 @@ def get_stats(
 
     # Search
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                BankTransaction.counterparty_name.ilike(search_term),
-                BankTransaction.counterparty_inn.ilike(search_term),
-                BankTransaction.payment_purpose.ilike(search_term),
-                BankTransaction.document_number.ilike(search_term)
-            )
-        )
-
-    # Get counts by status
-    total = query.count()
-    new = query.filter(BankTransaction.status == BankTransactionStatusEnum.NEW).count()
-    categorized = query.filter(BankTransaction.status == BankTransactionStatusEnum.CATEGORIZED).count()
-    approved = query.filter(BankTransaction.status == BankTransactionStatusEnum.APPROVED).count()
-    # needs_review включает как NEEDS_REVIEW, так и NEW статусы (все необработанные транзакции)
-    needs_review = query.filter(
-        BankTransaction.status.in_([
+        query = query.filter(build_search_filter(search))
+
+    # Все счетчики и суммы - одним проходом: COUNT(*) FILTER / SUM(...) FILTER
+    status_col = BankTransaction.status
+    type_col = BankTransaction.transaction_type
+    row = query.with_entities(
+        func.count(BankTransaction.id).label('total'),
+        func.count(BankTransaction.id).filter(
+            status_col == BankTransactionStatusEnum.NEW).label('new'),
+        func.count(BankTransaction.id).filter(
+            status_col == BankTransactionStatusEnum.CATEGORIZED).label('categorized'),
+        func.count(BankTransaction.id).filter(
+            status_col == BankTransactionStatusEnum.APPROVED).label('approved'),
+        # needs_review включает как NEEDS_REVIEW, так и NEW статусы (все необработанные транзакции)
+        func.count(BankTransaction.id).filter(status_col.in_([
             BankTransactionStatusEnum.NEEDS_REVIEW,
             BankTransactionStatusEnum.NEW
-        ])
-    ).count()
-    ignored = query.filter(BankTransaction.status == BankTransactionStatusEnum.IGNORED).count()
-
-    # Get totals by type - use subquery for efficiency
-    total_debit = query.filter(
-        BankTransaction.transaction_type == BankTransactionTypeEnum.DEBIT
-    ).with_entities(func.coalesce(func.sum(BankTransaction.amount), 0)).scalar() or Decimal("0")
-
-    total_credit = query.filter(
-        BankTransaction.transaction_type == BankTransactionTypeEnum.CREDIT
-    ).with_entities(func.coalesce(func.sum(BankTransaction.amount), 0)).scalar() or Decimal("0")
-
-    return BankTransactionStats(
-        total=total,
-        new=new,
-        categorized=categorized,
-        approved=approved,
-        needs_review=needs_review,
-        ignored=ignored,
-        total_debit=total_debit,
-        total_credit=total_credit
+        ])).label('needs_review'),
+        func.count(BankTransaction.id).filter(
+            status_col == BankTransactionStatusEnum.IGNORED).label('ignored'),
+        func.coalesce(func.sum(BankTransaction.amount).filter(
+            type_col == BankTransactionTypeEnum.DEBIT), 0).label('total_debit'),
+        func.coalesce(func.sum(BankTransaction.amount).filter(
+            type_col == BankTransactionTypeEnum.CREDIT), 0).label('total_credit'),
+    ).one()
+
+    result = BankTransactionStats(
+        total=row.total,
+        new=row.new,
+        categorized=row.categorized,
+        approved=row.approved,
+        needs_review=row.needs_review,
+        ignored=row.ignored,
+        total_debit=row.total_debit or Decimal("0"),
+        total_credit=row.total_credit or Decimal("0")
     )
 
+    if stats_cache_key:
+        cache.set(stats_cache_key, result.model_dump(), ttl=CACHE_TTL["bank_tx_stats"])
 
-# ==================== Analytics ====================
+    return result
 
-@router.get("/analytics", response_model=BankTransactionAnalytics)
-def get_analytics(
+
+@router.post("/rebuild-daily-rollup")
+def rebuild_daily_rollup_endpoint(
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
-    year: Optional[int] = None,
-    month: Optional[int] = None,
-    transaction_type: Optional[BankTransactionTypeEnum] = None,
-    category_id: Optional[int] = None,
-    compare_previous_period: bool = Query(True, description="Include comparison with previous period"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get comprehensive analytics for bank transactions."""
-    MONTH_NAMES_RU = [
-        '', 'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
-        'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь'
-    ]
-
-    # Base query
-    query = db.query(BankTransaction).filter(BankTransaction.is_active == True)
-
-    # Apply date filters
-    if year and month:
-        query = query.filter(
-            extract('year', BankTransaction.transaction_date) == year,
-            extract('month', BankTransaction.transaction_date) == month
-        )
-    elif year:
-        query = query.filter(extract('year', BankTransaction.transaction_date) == year)
-
-    if date_from:
-        query = query.filter(BankTransaction.transaction_date >= date_from)
-    if date_to:
-        query = query.filter(BankTransaction.transaction_date <= date_to)
-
-    if transaction_type:
-        query = query.filter(BankTransaction.transaction_type == transaction_type)
-    if category_id:
-        query = query.filter(BankTransaction.category_id == category_id)
-
-    # Get all matching transactions
-    transactions = query.all()
-    total_count = len(transactions)
-
-    # ====== KPIs Calculation ======
-    debit_transactions = [t for t in transactions if t.transaction_type == BankTransactionTypeEnum.DEBIT]
-    credit_transactions = [t for t in transactions if t.transaction_type == BankTransactionTypeEnum.CREDIT]
-
-    total_debit = sum(t.amount for t in debit_transactions) if debit_transactions else Decimal(0)
-    total_credit = sum(t.amount for t in credit_transactions) if credit_transactions else Decimal(0)
-    net_flow = total_credit - total_debit
-
-    # Status counts
-    status_counts = {}
-    for status_enum in BankTransactionStatusEnum:
-        status_counts[status_enum.value] = len([t for t in transactions if t.status == status_enum])
-
-    # AI metrics
-    categorized_transactions = [t for t in transactions if t.category_id is not None]
-    auto_categorized = [t for t in categorized_transactions if t.category_confidence and float(t.category_confidence) >= 0.9]
-    regular_payments = [t for t in transactions if t.is_regular_payment]
-
-    avg_confidence = None
-    if categorized_transactions:
-        confidences = [float(t.category_confidence) for t in categorized_transactions if t.category_confidence]
-        if confidences:
-            avg_confidence = sum(confidences) / len(confidences)
-
-    # Previous period comparison
-    debit_change_percent = None
-    credit_change_percent = None
-    net_flow_change_percent = None
-    transactions_change = None
-
-    if compare_previous_period and date_from and date_to:
-        period_days = (date_to - date_from).days + 1
-        prev_date_from = date_from - timedelta(days=period_days)
-        prev_date_to = date_from - timedelta(days=1)
-
-        prev_query = db.query(BankTransaction).filter(
-            BankTransaction.is_active == True,
-            BankTransaction.transaction_date >= prev_date_from,
-            BankTransaction.transaction_date <= prev_date_to
+    """Полный пересчет дневных агрегатов за период (ADMIN only)."""
+    if current_user.role != UserRoleEnum.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only ADMIN can rebuild daily rollup"
         )
 
-        prev_transactions = prev_query.all()
-        prev_debit = sum(t.amount for t in prev_transactions if t.transaction_type == BankTransactionTypeEnum.DEBIT)
-        prev_credit = sum(t.amount for t in prev_transactions if t.transaction_type == BankTransactionTypeEnum.CREDIT)
-        prev_net_flow = prev_credit - prev_debit
-
-        if prev_debit > 0:
-            debit_change_percent = float((total_debit - prev_debit) / prev_debit * 100)
-        if prev_credit > 0:
-            credit_change_percent = float((total_credit - prev_credit) / prev_credit * 100)
-        if prev_net_flow != 0:
-            net_flow_change_percent = float((net_flow - prev_net_flow) / abs(prev_net_flow) * 100)
-        transactions_change = total_count - len(prev_transactions)
-
-    # Calculate needs_review as NEW + NEEDS_REVIEW (same logic as /stats endpoint)
-    needs_review_count = (
-        status_counts.get(BankTransactionStatusEnum.NEW.value, 0) +
-        status_counts.get(BankTransactionStatusEnum.NEEDS_REVIEW.value, 0)
-    )
-
-    kpis = BankTransactionKPIs(
-        total_debit_amount=total_debit,
-        total_credit_amount=total_credit,
-        net_flow=net_flow,
-        total_transactions=total_count,
-        debit_change_percent=debit_change_percent,
-        credit_change_percent=credit_change_percent,
-        net_flow_change_percent=net_flow_change_percent,
-        transactions_change=transactions_change,
-        new_count=status_counts.get(BankTransactionStatusEnum.NEW.value, 0),
-        categorized_count=status_counts.get(BankTransactionStatusEnum.CATEGORIZED.value, 0),
-        approved_count=status_counts.get(BankTransactionStatusEnum.APPROVED.value, 0),
-        needs_review_count=needs_review_count,
-        ignored_count=status_counts.get(BankTransactionStatusEnum.IGNORED.value, 0),
-        new_percent=float(status_counts.get(BankTransactionStatusEnum.NEW.value, 0) / total_count * 100) if total_count > 0 else 0,
-        categorized_percent=float(status_counts.get(BankTransactionStatusEnum.CATEGORIZED.value, 0) / total_count * 100) if total_count > 0 else 0,
-        approved_percent=float(status_counts.get(BankTransactionStatusEnum.APPROVED.value, 0) / total_count * 100) if total_count > 0 else 0,
-        needs_review_percent=float(needs_review_count / total_count * 100) if total_count > 0 else 0,
-        ignored_percent=float(status_counts.get(BankTransactionStatusEnum.IGNORED.value, 0) / total_count * 100) if total_count > 0 else 0,
-        avg_category_confidence=avg_confidence,
-        auto_categorized_count=len(auto_categorized),
-        auto_categorized_percent=float(len(auto_categorized) / total_count * 100) if total_count > 0 else 0,
-        regular_payments_count=len(regular_payments),
-        regular_payments_percent=float(len(regular_payments) / total_count * 100) if total_count > 0 else 0,
-    )
-
-    # ====== Monthly Flow Data ======
-    monthly_dict = defaultdict(lambda: {'debit': Decimal(0), 'credit': Decimal(0), 'count': 0, 'confidences': []})
-
-    for t in transactions:
-        key = (t.transaction_date.year, t.transaction_date.month)
-        if t.transaction_type == BankTransactionTypeEnum.DEBIT:
-            monthly_dict[key]['debit'] += t.amount
-        else:
-            monthly_dict[key]['credit'] += t.amount
-        monthly_dict[key]['count'] += 1
-        if t.category_confidence:
-            monthly_dict[key]['confidences'].append(float(t.category_confidence))
-
-    monthly_flow = []
-    for (year_val, month_val), data in sorted(monthly_dict.items()):
-        avg_conf = None
-        if data['confidences']:
-            avg_conf = sum(data['confidences']) / len(data['confidences'])
-
-        monthly_flow.append(MonthlyFlowData(
-            year=year_val,
-            month=month_val,
-            month_name=f"{MONTH_NAMES_RU[month_val]} {year_val}",
-            debit_amount=data['debit'],
-            credit_amount=data['credit'],
-            net_flow=data['credit'] - data['debit'],
-            transaction_count=data['count'],
-            avg_confidence=avg_conf
-        ))
-
-    # ====== Daily Flow Data ======
-    daily_dict = defaultdict(lambda: {'debit': Decimal(0), 'credit': Decimal(0), 'count': 0})
-
-    for t in transactions:
-        if t.transaction_type == BankTransactionTypeEnum.DEBIT:
-            daily_dict[t.transaction_date]['debit'] += t.amount
-        else:
-            daily_dict[t.transaction_date]['credit'] += t.amount
-        daily_dict[t.transaction_date]['count'] += 1
-
-    daily_flow = []
-    for day_key, values in sorted(daily_dict.items()):
-        daily_flow.append(DailyFlowData(
-            date=day_key.date() if hasattr(day_key, 'date') else day_key,
-            debit_amount=values['debit'],
-            credit_amount=values['credit'],
-            net_flow=values['credit'] - values['debit'],
-            transaction_count=values['count'],
-        ))
-
-    # ====== Category Breakdown ======
-    category_dict = defaultdict(lambda: {'count': 0, 'total': Decimal(0), 'confidences': [], 'type': None, 'name': ''})
+    days = rebuild_daily_rollup(db, date_from=date_from, date_to=date_to)
+    db.commit()
 
-    for t in transactions:
-        if t.category_id:
-            category_dict[t.category_id]['count'] += 1
-            category_dict[t.category_id]['total'] += t.amount
-            if t.category_confidence:
-                category_dict[t.category_id]['confidences'].append(float(t.category_confidence))
-            if t.category_rel:
-                category_dict[t.category_id]['name'] = t.category_rel.name
-                category_dict[t.category_id]['type'] = t.category_rel.type.value if t.category_rel.type else None
-
-    total_categorized_amount = sum(d['total'] for d in category_dict.values())
-
-    top_categories = []
-    for cat_id, data in sorted(category_dict.items(), key=lambda x: x[1]['total'], reverse=True)[:10]:
-        avg_conf = sum(data['confidences']) / len(data['confidences']) if data['confidences'] else None
-        top_categories.append(CategoryBreakdown(
-            category_id=cat_id,
-            category_name=data['name'],
-            category_type=data['type'],
-            transaction_count=data['count'],
-            total_amount=data['total'],
-            avg_amount=data['total'] / data['count'] if data['count'] > 0 else Decimal(0),
-            avg_confidence=avg_conf,
-            percent_of_total=float(data['total'] / total_categorized_amount * 100) if total_categorized_amount > 0 else 0
-        ))
+    return {"message": f"Daily rollup rebuilt for {days} days", "days": days}
 
-    # Category type distribution
-    category_type_distribution = []
 
-    # ====== Counterparty Breakdown ======
-    counterparty_dict = defaultdict(lambda: {
-        'count': 0, 'total': Decimal(0), 'first_date': None, 'last_date': None, 'is_regular': False, 'name': ''
-    })
+@router.post("/rebuild-account-summary")
+def rebuild_account_summary_endpoint(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Полный пересчет сводки по счетам (ADMIN only)."""
+    if current_user.role != UserRoleEnum.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only ADMIN can rebuild account summary"
+        )
 
-    for t in transactions:
-        if t.counterparty_inn:
-            key = t.counterparty_inn
-            counterparty_dict[key]['count'] += 1
-            counterparty_dict[key]['total'] += t.amount
-            counterparty_dict[key]['name'] = t.counterparty_name or 'Unknown'
-            if counterparty_dict[key]['first_date'] is None or t.transaction_date < counterparty_dict[key]['first_date']:
-                counterparty_dict[key]['first_date'] = t.transaction_date
-            if counterparty_dict[key]['last_date'] is None or t.transaction_date > counterparty_dict[key]['last_date']:
-                counterparty_dict[key]['last_date'] = t.transaction_date
-            if t.is_regular_payment:
-                counterparty_dict[key]['is_regular'] = True
-
-    top_counterparties = []
-    for cp_inn, data in sorted(counterparty_dict.items(), key=lambda x: x[1]['total'], reverse=True)[:20]:
-        top_counterparties.append(CounterpartyBreakdown(
-            counterparty_inn=cp_inn,
-            counterparty_name=data['name'],
-            transaction_count=data['count'],
-            total_amount=data['total'],
-            avg_amount=data['total'] / data['count'] if data['count'] > 0 else Decimal(0),
-            first_transaction_date=data['first_date'] or datetime.now(),
-            last_transaction_date=data['last_date'] or datetime.now(),
-            is_regular=data['is_regular']
-        ))
+    accounts = rebuild_account_summary(db)
+    db.commit()
 
-    # ====== Processing Funnel ======
-    funnel_stages = []
-    for status_enum in BankTransactionStatusEnum:
-        count = status_counts.get(status_enum.value, 0)
-        amount = sum(t.amount for t in transactions if t.status == status_enum)
-
-        funnel_stages.append(ProcessingFunnelStage(
-            status=status_enum.value,
-            count=count,
-            amount=amount,
-            percent_of_total=float(count / total_count * 100) if total_count > 0 else 0
-        ))
+    return {"message": f"Account summary rebuilt for {accounts} accounts", "accounts": accounts}
 
-    approved_count = status_counts.get(BankTransactionStatusEnum.APPROVED.value, 0)
-    processing_funnel = ProcessingFunnelData(
-        stages=funnel_stages,
-        total_count=total_count,
-        conversion_rate_to_approved=float(approved_count / total_count * 100) if total_count > 0 else 0
-    )
 
-    # ====== AI Performance ======
-    confidence_brackets = [
-        ('High (≥90%)', 0.9, 1.0),
-        ('Medium (70-90%)', 0.7, 0.9),
-        ('Low (50-70%)', 0.5, 0.7),
-        ('Very Low (<50%)', 0.0, 0.5),
-    ]
+@router.post("/rebuild-keyword-index")
+def rebuild_keyword_index_endpoint(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Полная переиндексация ключевых слов назначения платежа (ADMIN only)."""
+    if current_user.role != UserRoleEnum.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only ADMIN can rebuild keyword index"
+        )
 
-    confidence_distribution = []
-    for bracket_name, min_conf, max_conf in confidence_brackets:
-        bracket_transactions = [
-            t for t in categorized_transactions
-            if t.category_confidence and min_conf <= float(t.category_confidence) < max_conf
-        ]
-        count = len(bracket_transactions)
-        amount = sum(t.amount for t in bracket_transactions)
-
-        confidence_distribution.append(ConfidenceBracket(
-            bracket=bracket_name,
-            min_confidence=min_conf,
-            max_confidence=max_conf,
-            count=count,
-            total_amount=amount,
-            percent_of_total=float(count / len(categorized_transactions) * 100) if categorized_transactions else 0
-        ))
+    keywords = rebuild_keyword_index(db)
+    db.commit()
 
-    high_confidence_count = len([t for t in categorized_transactions if t.category_confidence and float(t.category_confidence) >= 0.9])
-    low_confidence_count = len([t for t in categorized_transactions if t.category_confidence and float(t.category_confidence) < 0.7])
+    return {"message": f"Keyword index rebuilt: {keywords} keywords", "keywords": keywords}
 
-    ai_performance = AIPerformanceData(
-        confidence_distribution=confidence_distribution,
-        avg_confidence=avg_confidence or 0.0,
-        high_confidence_count=high_confidence_count,
-        high_confidence_percent=float(high_confidence_count / len(categorized_transactions) * 100) if categorized_transactions else 0,
-        low_confidence_count=low_confidence_count,
-        low_confidence_percent=float(low_confidence_count / len(categorized_transactions) * 100) if categorized_transactions else 0
-    )
 
-    # ====== Low Confidence Items ======
-    low_confidence_items = []
-    for t in [t for t in transactions if t.category_confidence and float(t.category_confidence) < 0.7][:50]:
-        low_confidence_items.append(LowConfidenceItem(
-            transaction_id=t.id,
-            transaction_date=t.transaction_date,
-            counterparty_name=t.counterparty_name or 'Unknown',
-            amount=t.amount,
-            payment_purpose=t.payment_purpose,
-            suggested_category_name=t.suggested_category_rel.name if t.suggested_category_rel else None,
-            category_confidence=float(t.category_confidence),
-            status=t.status.value
-        ))
-
-    # ====== Activity Heatmap (Day of Week × Hour) ======
-    heatmap_dict = defaultdict(lambda: {'count': 0, 'total': Decimal(0)})
-    for t in transactions:
-        # Используем document_date (дата из 1С), если доступна, иначе transaction_date
-        dt = t.document_date if t.document_date else t.transaction_date
-        day_of_week = dt.weekday()  # 0=Monday, 6=Sunday
-        hour = dt.hour
-        key = (day_of_week, hour)
-        heatmap_dict[key]['count'] += 1
-        heatmap_dict[key]['total'] += t.amount
-
-    activity_heatmap = []
-    for (day, hour), data in sorted(heatmap_dict.items()):
-        activity_heatmap.append(ActivityHeatmapPoint(
-            day_of_week=day,
-            hour=hour,
-            transaction_count=data['count'],
-            total_amount=data['total'],
-            avg_amount=data['total'] / data['count'] if data['count'] > 0 else Decimal(0)
-        ))
+@router.post("/reclassify")
+async def start_reclassification(
+    statuses: Optional[List[BankTransactionStatusEnum]] = Query(None),
+    batch_size: int = Query(1000, ge=100, le=10000),
+    resume_task_id: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Повторная классификация NEW/NEEDS_REVIEW транзакций фоновой задачей (ADMIN, MANAGER).
 
-    # ====== Status Timeline ======
-    timeline_dict = defaultdict(lambda: {
-        'new': 0, 'categorized': 0, 'matched': 0, 'approved': 0, 'needs_review': 0, 'ignored': 0
-    })
-    for t in transactions:
-        day_key = t.transaction_date
-        if t.status == BankTransactionStatusEnum.NEW:
-            timeline_dict[day_key]['new'] += 1
-        elif t.status == BankTransactionStatusEnum.CATEGORIZED:
-            timeline_dict[day_key]['categorized'] += 1
-        elif t.status == BankTransactionStatusEnum.MATCHED:
-            timeline_dict[day_key]['matched'] += 1
-        elif t.status == BankTransactionStatusEnum.APPROVED:
-            timeline_dict[day_key]['approved'] += 1
-        elif t.status == BankTransactionStatusEnum.NEEDS_REVIEW:
-            timeline_dict[day_key]['needs_review'] += 1
-        elif t.status == BankTransactionStatusEnum.IGNORED:
-            timeline_dict[day_key]['ignored'] += 1
-
-    status_timeline = []
-    for day_key, counts in sorted(timeline_dict.items()):
-        status_timeline.append(StatusTimelinePoint(
-            date=day_key.date() if hasattr(day_key, 'date') else day_key,
-            new_count=counts['new'],
-            categorized_count=counts['categorized'],
-            matched_count=counts['matched'],
-            approved_count=counts['approved'],
-            needs_review_count=counts['needs_review'],
-            ignored_count=counts['ignored']
-        ))
+    Прогресс - /api/v1/tasks/{task_id} и /ws/tasks/{task_id}.
+    resume_task_id продолжает прерванный прогон с последнего обработанного id.
+    """
+    if current_user.role not in [UserRoleEnum.ADMIN, UserRoleEnum.MANAGER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins and managers can reclassify transactions"
+        )
 
-    # ====== Confidence Scatter (all categorized transactions) ======
-    confidence_scatter = []
-    for t in categorized_transactions[:500]:  # Limit to 500 points for performance
-        confidence_scatter.append(ConfidenceScatterPoint(
-            transaction_id=t.id,
-            transaction_date=t.transaction_date,
-            counterparty_name=t.counterparty_name,
-            amount=t.amount,
-            category_confidence=float(t.category_confidence) if t.category_confidence else None,
-            status=t.status.value,
-            transaction_type=t.transaction_type.value,
-            is_regular_payment=t.is_regular_payment
-        ))
+    try:
+        task_id = ReclassificationService.start_reclassification(
+            statuses=statuses,
+            batch_size=batch_size,
+            resume_task_id=resume_task_id,
+            user_id=current_user.id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
-    # ====== Regional Distribution ======
-    region_dict = defaultdict(lambda: {'count': 0, 'total': Decimal(0)})
-    total_with_region = 0
-    for t in transactions:
-        if t.region:
-            region_dict[t.region.value]['count'] += 1
-            region_dict[t.region.value]['total'] += t.amount
-            total_with_region += 1
-
-    regional_distribution = []
-    for region_key, data in sorted(region_dict.items(), key=lambda x: x[1]['total'], reverse=True):
-        regional_distribution.append(RegionalData(
-            region=region_key,
-            transaction_count=data['count'],
-            total_amount=data['total'],
-            avg_amount=data['total'] / data['count'] if data['count'] > 0 else Decimal(0),
-            percent_of_total=float(data['count'] / total_with_region * 100) if total_with_region > 0 else 0
-        ))
+    return {
+        "task_id": task_id,
+        "message": f"Reclassification started. Track progress at /api/v1/tasks/{task_id}"
+    }
 
-    # ====== Source Distribution ======
-    source_dict = defaultdict(lambda: {'count': 0, 'total': Decimal(0)})
-    for t in transactions:
-        source_key = t.payment_source.value if t.payment_source else 'BANK'
-        source_dict[source_key]['count'] += 1
-        source_dict[source_key]['total'] += t.amount
-
-    source_distribution = []
-    for source_key, data in sorted(source_dict.items()):
-        source_distribution.append(SourceDistribution(
-            source=source_key,
-            transaction_count=data['count'],
-            total_amount=data['total'],
-            percent_of_total=float(data['count'] / total_count * 100) if total_count > 0 else 0
-        ))
 
-    # ====== Regular Payments Summary ======
-    regular_dict = defaultdict(lambda: {
-        'count': 0, 'total': Decimal(0), 'first_date': None, 'last_date': None,
-        'name': '', 'category_id': None, 'category_name': None
-    })
-    for t in regular_payments:
-        key = t.counterparty_inn or t.counterparty_name or 'Unknown'
-        regular_dict[key]['count'] += 1
-        regular_dict[key]['total'] += t.amount
-        regular_dict[key]['name'] = t.counterparty_name or 'Unknown'
-        if t.category_id:
-            regular_dict[key]['category_id'] = t.category_id
-            regular_dict[key]['category_name'] = t.category_rel.name if t.category_rel else None
-        if regular_dict[key]['first_date'] is None or t.transaction_date < regular_dict[key]['first_date']:
-            regular_dict[key]['first_date'] = t.transaction_date
-        if regular_dict[key]['last_date'] is None or t.transaction_date > regular_dict[key]['last_date']:
-            regular_dict[key]['last_date'] = t.transaction_date
-
-    regular_payments_summary = []
-    for cp_key, data in sorted(regular_dict.items(), key=lambda x: x[1]['count'], reverse=True)[:20]:
-        if data['first_date'] and data['last_date'] and data['count'] > 1:
-            frequency_days = int((data['last_date'] - data['first_date']).days / (data['count'] - 1))
-        else:
-            frequency_days = 30
-
-        is_monthly = 25 <= frequency_days <= 35
-        is_quarterly = 85 <= frequency_days <= 95
-
-        regular_payments_summary.append(RegularPaymentSummary(
-            counterparty_inn=cp_key if len(cp_key) == 10 or len(cp_key) == 12 else None,
-            counterparty_name=data['name'],
-            category_id=data['category_id'],
-            category_name=data['category_name'],
-            avg_amount=data['total'] / data['count'] if data['count'] > 0 else Decimal(0),
-            frequency_days=frequency_days,
-            last_payment_date=data['last_date'] or date.today(),
-            transaction_count=data['count'],
-            is_monthly=is_monthly,
-            is_quarterly=is_quarterly
-        ))
+# ==================== Analytics ====================
 
-    # ====== Exhibition Spending ======
-    exhibition_dict = defaultdict(lambda: {
-        'count': 0, 'total': Decimal(0), 'first_date': None, 'last_date': None
-    })
-    for t in transactions:
-        if t.exhibition:
-            exhibition_dict[t.exhibition]['count'] += 1
-            exhibition_dict[t.exhibition]['total'] += t.amount
-            if exhibition_dict[t.exhibition]['first_date'] is None or t.transaction_date < exhibition_dict[t.exhibition]['first_date']:
-                exhibition_dict[t.exhibition]['first_date'] = t.transaction_date
-            if exhibition_dict[t.exhibition]['last_date'] is None or t.transaction_date > exhibition_dict[t.exhibition]['last_date']:
-                exhibition_dict[t.exhibition]['last_date'] = t.transaction_date
-
-    exhibitions = []
-    for exhibition_name, data in sorted(exhibition_dict.items(), key=lambda x: x[1]['total'], reverse=True):
-        exhibitions.append(ExhibitionData(
-            exhibition=exhibition_name,
-            transaction_count=data['count'],
-            total_amount=data['total'],
-            avg_amount=data['total'] / data['count'] if data['count'] > 0 else Decimal(0),
-            first_transaction_date=data['first_date'] or datetime.now(),
-            last_transaction_date=data['last_date'] or datetime.now()
-        ))
+@router.get("/analytics", response_model=BankTransactionAnalytics)
+def get_analytics(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    transaction_type: Optional[BankTransactionTypeEnum] = None,
+    category_id: Optional[int] = None,
+    compare_previous_period: bool = Query(True, description="Include comparison with previous period"),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get comprehensive analytics for bank transactions.
 
-    return BankTransactionAnalytics(
-        kpis=kpis,
-        monthly_flow=monthly_flow,
-        daily_flow=daily_flow,
-        top_categories=top_categories,
-        category_type_distribution=category_type_distribution,
-        top_counterparties=top_counterparties,
-        regional_distribution=regional_distribution,
-        source_distribution=source_distribution,
-        processing_funnel=processing_funnel,
-        ai_performance=ai_performance,
-        low_confidence_items=low_confidence_items,
-        activity_heatmap=activity_heatmap,
-        status_timeline=status_timeline,
-        confidence_scatter=confidence_scatter,
-        regular_payments=regular_payments_summary,
-        exhibitions=exhibitions
+    Все показатели считаются агрегатами в БД (см. BankTransactionAnalyticsService).
+    """
+    return BankTransactionAnalyticsService(db).get_analytics(
+        date_from=date_from,
+        date_to=date_to,
+        year=year,
+        month=month,
+        transaction_type=transaction_type,
+        category_id=category_id,
+        compare_previous_period=compare_previous_period,
     )
 
 
@@ -1001,7 +653,12 @@ def get_account_grouping(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get transactions grouped by account number."""
+    """
+    Get transactions grouped by account number.
+
+    Без фильтров читается сводка bank_account_summaries, с фильтрами -
+    дельта-режим по дневным агрегатам (точность по дате - день).
+    """
 
     # Parse enum values (handle empty strings)
     parsed_transaction_type = None
@@ -1019,18 +676,21 @@ def get_account_grouping(
         except ValueError:
             pass
 
-    # Base query
-    query = db.query(BankTransaction).filter(BankTransaction.is_active == True)
+    has_filters = bool(date_from or date_to or parsed_transaction_type or parsed_status)
 
-    # Apply filters
-    if date_from:
-        query = query.filter(BankTransaction.transaction_date >= date_from)
-    if date_to:
-        query = query.filter(BankTransaction.transaction_date <= date_to)
-    if parsed_transaction_type:
-        query = query.filter(BankTransaction.transaction_type == parsed_transaction_type)
-    if parsed_status:
-        query = query.filter(BankTransaction.status == parsed_status)
+    # Без фильтров - готовая сводка по счетам
+    if not has_filters and settings.ACCOUNT_SUMMARY_ENABLED:
+        return get_account_grouping_from_summary(db)
+
+    # С фильтрами - дельта-режим: движения за период из дневных агрегатов
+    if has_filters and settings.ACCOUNT_SUMMARY_ENABLED and settings.DAILY_ROLLUP_ENABLED:
+        return get_account_grouping_delta(
+            db,
+            date_from=date_from,
+            date_to=date_to,
+            transaction_type=parsed_transaction_type,
+            status=parsed_status,
+        )
 
     # Group by account number, organization, and bank
     accounts_data = db.query(
@@ -1075,7 +735,7 @@ def get_account_grouping(
     if date_from:
         accounts_data = accounts_data.filter(BankTransaction.transaction_date >= date_from)
     if date_to:
-        accounts_data = accounts_data.filter(BankTransaction.transaction_date <= date_to)
+        accounts_data = accounts_data.filter(BankTransaction.transaction_date < date_to + timedelta(days=1))
     if parsed_transaction_type:
         accounts_data = accounts_data.filter(BankTransaction.transaction_type == parsed_transaction_type)
     if parsed_status:
@@ -1299,7 +959,7 @@ def delete_by_filter(
     if date_from:
         query = query.filter(BankTransaction.transaction_date >= date_from)
     if date_to:
-        query = query.filter(BankTransaction.transaction_date <= date_to)
+        query = query.filter(BankTransaction.transaction_date < date_to + timedelta(days=1))
 
     if category_id is not None:
         if category_id == 0 or str(category_id).lower() == 'null':
@@ -1311,15 +971,7 @@ def delete_by_filter(
         query = query.filter(BankTransaction.organization_id == organization_id)
 
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                BankTransaction.counterparty_name.ilike(search_term),
-                BankTransaction.counterparty_inn.ilike(search_term),
-                BankTransaction.payment_purpose.ilike(search_term),
-                BankTransaction.document_number.ilike(search_term)
-            )
-        )
+        query = query.filter(build_search_filter(search))
 
     # Get count before deletion
     total_count = query.count()
@@ -1771,6 +1423,7 @@ def get_regular_patterns(
 
 @router.post("/mark-regular-payments")
 def mark_regular_payments(
+    incremental: bool = Query(False, description="Re-evaluate only counterparties touched since the last run"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -1784,7 +1437,7 @@ def mark_regular_payments(
     from app.services.transaction_classifier import RegularPaymentDetector
 
     detector = RegularPaymentDetector(db)
-    marked_count = detector.mark_regular_payments()
+    marked_count = detector.mark_regular_payments(incremental=incremental)
 
     return {"message": f"Marked {marked_count} transactions as regular payments", "marked_count": marked_count}
 
@@ -1961,6 +1614,10 @@ def bulk_link_to_expenses(
 def auto_match_transactions(
     threshold: float = Query(70.0, description="Minimum matching score for auto-matching"),
     limit: int = Query(100, description="Maximum number of transactions to process"),
+    mode: AutoMatchModeEnum = Query(
+        AutoMatchModeEnum.GREEDY,
+        description="greedy - best expense per transaction in order; optimal - max total score per batch"
+    ),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -1974,7 +1631,7 @@ def auto_match_transactions(
     from app.services.expense_matching import ExpenseMatchingService
 
     matching_service = ExpenseMatchingService(db)
-    matched = matching_service.auto_match_transactions(threshold=threshold, limit=limit)
+    matched = matching_service.auto_match_transactions(threshold=threshold, limit=limit, mode=mode)
 
     return {
         "message": f"Auto-matched {len(matched)} transactions",
@@ -1983,17 +1640,57 @@ def auto_match_transactions(
     }
 
 
+@router.post("/auto-match/start")
+async def start_auto_match(
+    threshold: float = Query(70.0, description="Minimum matching score for auto-matching"),
+    mode: AutoMatchModeEnum = Query(AutoMatchModeEnum.GREEDY),
+    batch_size: int = Query(500, ge=50, le=5000),
+    dry_run: bool = Query(False, description="Report proposed links without saving them"),
+    resume_task_id: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Автосопоставление всех непривязанных расходных транзакций фоновой задачей (ADMIN, MANAGER).
+
+    Прогресс - /api/v1/tasks/{task_id} и /ws/tasks/{task_id}.
+    dry_run возвращает предложенные привязки в результате задачи без записи.
+    resume_task_id продолжает прерванный прогон с последнего обработанного id.
+    """
+    if current_user.role not in [UserRoleEnum.ADMIN, UserRoleEnum.MANAGER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only ADMIN and MANAGER can run auto-matching"
+        )
+
+    try:
+        task_id = AutoMatchService.start_auto_match(
+            threshold=threshold,
+            mode=mode,
+            batch_size=batch_size,
+            dry_run=dry_run,
+            resume_task_id=resume_task_id,
+            user_id=current_user.id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    return {
+        "task_id": task_id,
+        "message": f"Auto-match started. Track progress at /api/v1/tasks/{task_id}"
+    }
+
+
 # ==================== Similar Transactions ====================
 
 @router.get("/{transaction_id}/similar", response_model=List[BankTransactionResponse])
 def get_similar_transactions(
     transaction_id: int,
-    similarity_threshold: float = Query(0.5, description="Similarity threshold (0-1)"),
-    limit: int = Query(1000, description="Maximum number of similar transactions to return"),
+    similarity_threshold: float = Query(0.5, ge=0, le=1, description="Similarity threshold (0-1)"),
+    limit: int = Query(1000, ge=1, le=1000, description="Maximum number of similar transactions to return"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Find similar transactions based on counterparty, purpose, and amount."""
+    """Find similar uncategorized transactions ranked by counterparty and purpose similarity."""
     # Get the source transaction
     source_transaction = db.query(BankTransaction).filter(
         BankTransaction.id == transaction_id,
@@ -2006,120 +1703,18 @@ def get_similar_transactions(
             detail="Transaction not found"
         )
 
-    # Build query for similar transactions
-    query = db.query(BankTransaction).options(
+    # Кандидаты по индексам + ранжирование (см. app/services/similarity_search.py)
+    ranked = find_similar_transactions(
+        db, source_transaction, similarity_threshold=similarity_threshold, limit=limit
+    )
+    rank = {tx_id: position for position, (tx_id, _) in enumerate(ranked)}
+
+    similar_transactions = db.query(BankTransaction).options(
         joinedload(BankTransaction.category_rel),
         joinedload(BankTransaction.organization_rel),
         joinedload(BankTransaction.suggested_category_rel)
-    ).filter(
-        BankTransaction.is_active == True,
-        BankTransaction.id != transaction_id,
-        BankTransaction.category_id == None  # Только не категоризированные
-    )
-
-    # Стоп-слова и общие банковские термины, которые не следует использовать для поиска
-    stop_words = {
-        # Предлоги и союзы
-        'для', 'при', 'или', 'без', 'под', 'над', 'перед', 'после',
-        'через', 'между', 'среди', 'вместо', 'кроме', 'около', 'вдоль',
-        # Общие банковские термины
-        'оплата', 'плата', 'платеж', 'счет', 'счёт', 'счету', 'договор',
-        'договору', 'номер', 'дата', 'период', 'услуги', 'услуг',
-        'работы', 'работ', 'товар', 'товара', 'товаров', 'включая',
-        'также', 'всего', 'итого', 'сумма', 'сумму', 'рублей', 'рубль',
-        'копеек', 'копейка', 'безналичный', 'наличный', 'перевод',
-        'перечисление', 'возврат', 'аванс', 'предоплата', 'доплата',
-        'комиссия', 'комис', 'пополнение', 'списание', 'зачисление',
-        # НДС и налоги
-        'числе', 'число', 'включительно', 'облагается', 'ставка',
-        # Документы
-        'документ', 'основание', 'назначение', 'платежа',
-        # Даты
-        'январь', 'февраль', 'март', 'апрель', 'июнь', 'июль',
-        'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь',
-        # Банковские операции
-        'операции', 'операция', 'банк', 'банка', 'расчетный', 'расчётный',
-        'корреспондентский', 'транзакция', 'межбанк', 'межбанковский',
-    }
-
-    # Паттерны банковских комиссий и служебных операций для исключения
-    commission_patterns = [
-        'комис%',
-        'пополнение по операции сбп%',
-        'плата за пакет%',
-        'плата за обслуживание%',
-        'плата за предоставление услуги%',
-        'плата за пополнение%',
-        'погашение задолженности по договору%',
-        'межбанки%',
-        'sms-банк%',
-        'sms банк%',
-        'смс-банк%',
-        'смс банк%',
-    ]
-
-    # Исключаем банковские комиссии из результатов поиска
-    # Важно: учитываем NULL значения payment_purpose (они не должны исключаться)
-    for pattern in commission_patterns:
-        query = query.filter(
-            or_(
-                BankTransaction.payment_purpose.is_(None),
-                ~BankTransaction.payment_purpose.ilike(pattern)
-            )
-        )
-
-    # Стратегия поиска: объединяем контрагента, business_operation и ключевые слова через OR
-    search_conditions = []
-
-    # 1. Поиск по контрагенту (ИНН или имя)
-    if source_transaction.counterparty_inn:
-        # По ИНН - точное совпадение
-        search_conditions.append(BankTransaction.counterparty_inn == source_transaction.counterparty_inn)
-
-    if source_transaction.counterparty_name:
-        # По имени - используем ilike для более мягкого поиска
-        name_parts = source_transaction.counterparty_name.strip().split()
-        if name_parts:
-            # Точное совпадение по имени
-            search_conditions.append(BankTransaction.counterparty_name.ilike(source_transaction.counterparty_name))
-            # Поиск по фамилии (первое слово имени, если >= 3 символов)
-            if len(name_parts[0]) >= 3:
-                search_conditions.append(BankTransaction.counterparty_name.ilike(f"{name_parts[0]}%"))
-
-    # 2. Поиск по business_operation (хозяйственной операции) - ВСЕГДА если есть
-    if source_transaction.business_operation:
-        search_conditions.append(BankTransaction.business_operation == source_transaction.business_operation)
-
-    # 3. Поиск по ключевым словам из назначения платежа (если нет других критериев)
-    if not search_conditions and source_transaction.payment_purpose:
-        # Извлекаем значимые ключевые слова (минимум 5 символов, не стоп-слова)
-        words = source_transaction.payment_purpose.lower().split()
-        keywords = [
-            word.strip('.,;:!?()[]{}"\'-')
-            for word in words
-            if len(word) >= 5 and word.lower().strip('.,;:!?()[]{}"\'-') not in stop_words
-        ]
-
-        # Берём только уникальные слова длиной >= 6 символов для более точного поиска
-        significant_keywords = list(set([kw for kw in keywords if len(kw) >= 6]))[:3]
-
-        if significant_keywords:
-            # Создаём условие: все ключевые слова должны присутствовать
-            keyword_conditions = [BankTransaction.payment_purpose.ilike(f"%{kw}%") for kw in significant_keywords]
-            if keyword_conditions:
-                search_conditions.append(and_(*keyword_conditions))
-
-    # Применяем все условия через OR (любое совпадение)
-    if search_conditions:
-        query = query.filter(or_(*search_conditions))
-
-    # Фильтр по типу транзакции
-    query = query.filter(BankTransaction.transaction_type == source_transaction.transaction_type)
-
-    # Order by date and limit
-    similar_transactions = query.order_by(
-        BankTransaction.transaction_date.desc()
-    ).limit(limit).all()
+    ).filter(BankTransaction.id.in_(list(rank))).all() if rank else []
+    similar_transactions.sort(key=lambda t: rank[t.id])
 
     # Format response
     result = []
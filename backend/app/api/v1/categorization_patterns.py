@@ -2,21 +2,23 @@
 Categorization patterns API endpoints.
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 
 from app.db.session import get_db
 from app.db.models import (
     BankTransaction, BudgetCategory, BankTransactionStatusEnum,
-    CategorizationRule, User, CategorizationRuleTypeEnum
+    CategorizationRule, User, CategorizationRuleTypeEnum, TransactionKeyword
 )
 from app.api.v1.auth import get_current_active_user
 from app.schemas.categorization_rule import (
     CategorizationRule as CategorizationRuleSchema,
     CategorizationRuleCreate,
     CategorizationRuleUpdate,
+    CategorizationRulePreview,
 )
+from app.services.rule_preview import preview_rule
 
 router = APIRouter(prefix="/categorization-patterns", tags=["categorization-patterns"])
 
@@ -126,84 +128,49 @@ def get_payment_purpose_keyword_patterns(
     """
     Get categorization patterns by payment purpose keywords.
 
-    Analyzes payment_purpose field to extract common keywords and their associated categories.
-    This helps identify which keywords are frequently used in categorized transactions.
+    Uses the transaction_keywords index (payment_purpose words normalized by
+    keyword_tokenizer.index_tokens) to find common keywords and their associated
+    categories. Each transaction is counted once per keyword.
     """
 
-    # Get all categorized transactions with payment_purpose
-    transactions = (
+    # Group keyword index by keyword and category (one indexed GROUP BY)
+    K = TransactionKeyword
+    transaction_count = func.count(K.transaction_id)
+    patterns = (
         db.query(
-            BankTransaction.payment_purpose,
+            K.keyword,
             BankTransaction.category_id,
             BudgetCategory.name.label("category_name"),
-            BankTransaction.category_confidence,
+            transaction_count.label("transaction_count"),
+            func.coalesce(func.sum(BankTransaction.category_confidence), 0).label("confidence_sum"),
         )
+        .join(BankTransaction, K.transaction_id == BankTransaction.id)
         .join(BudgetCategory, BankTransaction.category_id == BudgetCategory.id)
         .filter(BankTransaction.is_active == True)
-        .filter(BankTransaction.payment_purpose.isnot(None))
         .filter(BankTransaction.category_id.isnot(None))
+        .filter(func.length(K.keyword) >= min_keyword_length)
+        .group_by(K.keyword, BankTransaction.category_id, BudgetCategory.name)
+        .having(transaction_count >= min_transactions)
+        .order_by(desc("transaction_count"))
+        .limit(limit)
         .all()
     )
 
-    # Extract keywords and group by category
-    keyword_patterns = {}
-
-    for transaction in transactions:
-        if not transaction.payment_purpose:
-            continue
-
-        # Extract words from payment purpose (normalize to lowercase)
-        words = transaction.payment_purpose.lower().split()
-
-        # Filter words: length >= min_keyword_length, skip numbers
-        keywords = [
-            word.strip('.,;:()[]{}"\'-')
-            for word in words
-            if len(word) >= min_keyword_length and not word.isdigit()
-        ]
-
-        # Group by keyword and category
-        for keyword in keywords:
-            if not keyword:
-                continue
-
-            key = (keyword, transaction.category_id, transaction.category_name)
-
-            if key not in keyword_patterns:
-                keyword_patterns[key] = {
-                    "keyword": keyword,
-                    "category_id": transaction.category_id,
-                    "category_name": transaction.category_name,
-                    "transaction_count": 0,
-                    "confidence_sum": 0.0,
-                }
-
-            keyword_patterns[key]["transaction_count"] += 1
-            if transaction.category_confidence:
-                keyword_patterns[key]["confidence_sum"] += float(transaction.category_confidence)
-
-    # Convert to list and filter by min_transactions
-    patterns = [
+    return [
         {
-            "keyword": p["keyword"],
-            "category_id": p["category_id"],
-            "category_name": p["category_name"],
-            "transaction_count": p["transaction_count"],
+            "keyword": p.keyword,
+            "category_id": p.category_id,
+            "category_name": p.category_name,
+            "transaction_count": p.transaction_count,
             "confidence_estimate": (
-                p["confidence_sum"] / p["transaction_count"]
-                if p["transaction_count"] > 0
+                float(p.confidence_sum) / p.transaction_count
+                if p.transaction_count > 0
                 else 0.5
             ),
         }
-        for p in keyword_patterns.values()
-        if p["transaction_count"] >= min_transactions
+        for p in patterns
     ]
 
-    # Sort by transaction count (descending) and limit
-    patterns.sort(key=lambda x: x["transaction_count"], reverse=True)
-
-    return patterns[:limit]
-
 
 @router.get("/stats")
 def get_categorization_stats(
@@ -371,6 +338,32 @@ def create_categorization_rule(
     }
 
 
+@router.post("/rules/preview", response_model=CategorizationRulePreview)
+def preview_categorization_rule(
+    rule_data: CategorizationRuleCreate,
+    sample_size: int = Query(20, ge=0, le=200),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Preview the impact of a rule before creating it (nothing is saved).
+
+    Counts matching transactions and how many would be newly categorized or
+    conflict with their current category, plus a sample.
+    """
+    category = db.query(BudgetCategory).filter(BudgetCategory.id == rule_data.category_id).first()
+    if not category:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Category with id {rule_data.category_id} not found"
+        )
+
+    try:
+        return preview_rule(db, rule_data, sample_size=sample_size)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 @router.put("/rules/{rule_id}", response_model=CategorizationRuleSchema)
 def update_categorization_rule(
     rule_id: int,
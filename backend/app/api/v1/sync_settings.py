@@ -24,6 +24,7 @@ class SyncSettingsUpdate(BaseModel):
     sync_time_minute: Optional[int] = Field(None, ge=0, le=59)
     auto_classify: Optional[bool] = None
     sync_days_back: Optional[int] = Field(None, ge=1, le=365)
+    full_sync_interval_hours: Optional[int] = Field(None, ge=1, le=720)
     auto_sync_expenses_enabled: Optional[bool] = None
     sync_expenses_interval_hours: Optional[int] = Field(None, ge=1, le=72)
     sync_expenses_days_back: Optional[int] = Field(None, ge=1, le=365)
@@ -44,6 +45,7 @@ class SyncSettingsResponse(BaseModel):
     sync_time_minute: int
     auto_classify: bool
     sync_days_back: int
+    full_sync_interval_hours: int
     auto_sync_expenses_enabled: bool
     sync_expenses_interval_hours: int
     sync_expenses_days_back: int
@@ -63,6 +65,7 @@ class SyncSettingsResponse(BaseModel):
     last_sync_completed_at: Optional[datetime]
     last_sync_status: Optional[str]
     last_sync_message: Optional[str]
+    last_full_sync_at: Optional[datetime]
     created_at: datetime
     updated_at: datetime
 
@@ -159,8 +162,8 @@ async def trigger_sync_now(
         settings.last_sync_message = "Синхронизация запущена вручную"
         db.commit()
 
-        # Start monitoring task completion in background
-        asyncio.create_task(sync_scheduler._monitor_task_completion(task_id))
+        # Start monitoring task completion in background (полная сверка за sync_days_back)
+        asyncio.create_task(sync_scheduler._monitor_task_completion(task_id, full_sync=True))
 
         logger.info(f"Manual sync triggered by {current_user.username}, task_id: {task_id}")
 
@@ -43,6 +43,12 @@ class Settings(BaseSettings):
     ODATA_CONNECTION_TIMEOUT: int = 10
     ODATA_GET_REQUEST_TIMEOUT: int = 30
 
+    # Параллельная загрузка документов 1С: страниц в работе на одну коллекцию
+    ODATA_FETCH_CONCURRENCY: int = 2
+    # Справочник банковских счетов организаций (bank_account_references):
+    # перезагрузка из 1С, если он старше N часов
+    BANK_REFERENCE_REFRESH_HOURS: int = 24
+
     # Batch size
     SYNC_BATCH_SIZE: int = 100
 
@@ -53,6 +59,13 @@ class Settings(BaseSettings):
     REDIS_DB: int = 0
     CACHE_ENABLED: bool = True
 
+    # Дневные агрегаты транзакций (bank_transaction_daily_rollups)
+    DAILY_ROLLUP_ENABLED: bool = True
+    # Сводка по счетам для /account-grouping (bank_account_summaries)
+    ACCOUNT_SUMMARY_ENABLED: bool = True
+    # Индекс ключевых слов назначения платежа (transaction_keywords)
+    KEYWORD_INDEX_ENABLED: bool = True
+
     # FTP Settings (for fin module)
     FTP_HOST: str = ""
     FTP_PORT: int = 21
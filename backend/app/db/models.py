@@ -425,6 +425,29 @@ class BankTransaction(Base):
                               foreign_keys=[expense_id])
     suggested_expense_rel = relationship("Expense", foreign_keys=[suggested_expense_id])
 
+    __table_args__ = (
+        # Keyset-пагинация списка: ORDER BY transaction_date DESC, id DESC
+        Index('ix_bank_tx_active_date_id', 'transaction_date', 'id',
+              postgresql_where=(is_active == True)),
+        # Подстрочный поиск (ILIKE '%term%') - GIN-индексы pg_trgm
+        Index('ix_bank_tx_counterparty_name_trgm', 'counterparty_name',
+              postgresql_using='gin', postgresql_ops={'counterparty_name': 'gin_trgm_ops'}),
+        Index('ix_bank_tx_counterparty_inn_trgm', 'counterparty_inn',
+              postgresql_using='gin', postgresql_ops={'counterparty_inn': 'gin_trgm_ops'}),
+        Index('ix_bank_tx_payment_purpose_trgm', 'payment_purpose',
+              postgresql_using='gin', postgresql_ops={'payment_purpose': 'gin_trgm_ops'}),
+        Index('ix_bank_tx_document_number_trgm', 'document_number',
+              postgresql_using='gin', postgresql_ops={'document_number': 'gin_trgm_ops'}),
+        # Похожие транзакции (ORDER BY column <-> value LIMIT n) - GiST-индексы
+        # pg_trgm по активным транзакциям без категории
+        Index('ix_bank_tx_counterparty_name_gist_trgm', 'counterparty_name',
+              postgresql_using='gist', postgresql_ops={'counterparty_name': 'gist_trgm_ops'},
+              postgresql_where=(is_active == True) & category_id.is_(None)),
+        Index('ix_bank_tx_payment_purpose_gist_trgm', 'payment_purpose',
+              postgresql_using='gist', postgresql_ops={'payment_purpose': 'gist_trgm_ops'},
+              postgresql_where=(is_active == True) & category_id.is_(None)),
+    )
+
 
 class BusinessOperationMapping(Base):
     """Mapping of 1C business operations to budget categories."""
@@ -537,6 +560,13 @@ class SyncSettings(Base):
     last_sync_status = Column(String(50), nullable=True)  # SUCCESS, FAILED, IN_PROGRESS
     last_sync_message = Column(Text, nullable=True)
 
+    # Incremental sync: full reconciliation sweep (sync_days_back) every N hours
+    full_sync_interval_hours = Column(Integer, default=24, nullable=False)
+    last_full_sync_at = Column(DateTime, nullable=True)
+
+    # Last regular payments detection (incremental mode starts from here)
+    last_regular_payments_run_at = Column(DateTime, nullable=True)
+
     # Metadata
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
@@ -546,6 +576,30 @@ class SyncSettings(Base):
     updated_by_rel = relationship("User", foreign_keys=[updated_by])
 
 
+class SyncWatermark(Base):
+    """Last synced 1C document per collection (incremental sync starts from here)."""
+    __tablename__ = "sync_watermarks"
+
+    collection = Column(String(50), primary_key=True)  # receipt, payment, cash_receipt, cash_payment
+    last_document_date = Column(DateTime, nullable=False)
+    last_ref_key = Column(String(36), nullable=False)
+
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class BankAccountReference(Base):
+    """Organization bank account from 1C catalog (shared cache for 1C import)."""
+    __tablename__ = "bank_account_references"
+
+    ref_key = Column(String(36), primary_key=True)  # Ref_Key Catalog_БанковскиеСчетаОрганизаций
+    account_number = Column(String(20), nullable=True, index=True)
+    bank_key = Column(String(36), nullable=True)
+    bank_name = Column(String(500), nullable=True)
+    bank_bik = Column(String(20), nullable=True)
+
+    refreshed_at = Column(DateTime, nullable=True)  # Когда загружено полным справочником (NULL - запрошено по ключу)
+
+
 class BackgroundTask(Base):
     """Background tasks stored in database for persistence across restarts."""
     __tablename__ = "background_tasks"
@@ -580,3 +634,115 @@ class BackgroundTask(Base):
     __table_args__ = (
         Index('ix_background_tasks_status_created', 'status', 'created_at'),
     )
+
+
+class BankTransactionDailyRollup(Base):
+    """
+    Daily aggregates of active bank transactions.
+
+    Maintained incrementally on commit (see app/services/daily_rollup.py):
+    touched days are recalculated from bank_transactions.
+    """
+    __tablename__ = "bank_transaction_daily_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Ключ агрегации
+    day = Column(Date, nullable=False)
+    organization_id = Column(Integer, nullable=True)
+    account_number = Column(String(20), nullable=True)
+    category_id = Column(Integer, nullable=True)
+    transaction_type = Column(Enum(BankTransactionTypeEnum), nullable=True)
+    status = Column(Enum(BankTransactionStatusEnum), nullable=True)
+    payment_source = Column(Enum(PaymentSourceEnum), nullable=True)
+    our_bank_name = Column(String(500), nullable=True)
+    our_bank_bik = Column(String(20), nullable=True)
+
+    # Агрегаты
+    transaction_count = Column(Integer, default=0, nullable=False)
+    total_amount = Column(Numeric(18, 2), default=0, nullable=False)
+    confidence_sum = Column(Numeric(18, 4), default=0, nullable=False)  # Сумма ненулевых category_confidence
+    confidence_count = Column(Integer, default=0, nullable=False)  # Количество ненулевых category_confidence
+
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index('ix_bt_daily_rollup_day', 'day'),
+        Index('ix_bt_daily_rollup_org_day', 'organization_id', 'day'),
+        Index('ix_bt_daily_rollup_account_day', 'account_number', 'day'),
+    )
+
+
+class BankAccountSummary(Base):
+    """
+    Per-account totals of active bank transactions for /account-grouping.
+
+    Maintained incrementally on commit (see app/services/account_summary.py):
+    count/sum deltas of touched transactions are added to the row of their key.
+    """
+    __tablename__ = "bank_account_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Ключ группировки (как в /account-grouping)
+    account_number = Column(String(20), nullable=True, index=True)
+    organization_id = Column(Integer, nullable=True)
+    our_bank_name = Column(String(500), nullable=True)
+    our_bank_bik = Column(String(20), nullable=True)
+
+    # Счетчики
+    total_count = Column(Integer, default=0, nullable=False)
+    credit_count = Column(Integer, default=0, nullable=False)
+    debit_count = Column(Integer, default=0, nullable=False)
+    needs_processing_count = Column(Integer, default=0, nullable=False)  # NEW + NEEDS_REVIEW
+    approved_count = Column(Integer, default=0, nullable=False)
+
+    # Суммы
+    total_credit_amount = Column(Numeric(18, 2), default=0, nullable=False)
+    total_debit_amount = Column(Numeric(18, 2), default=0, nullable=False)
+
+    last_transaction_date = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Одна строка на ключ - цель ON CONFLICT при добавлении дельт
+        Index(
+            'uq_bank_account_summaries_key',
+            'account_number', 'organization_id', 'our_bank_name', 'our_bank_bik',
+            unique=True, postgresql_nulls_not_distinct=True
+        ),
+    )
+
+
+class TransactionKeyword(Base):
+    """
+    Inverted index of payment purpose keywords (keyword -> transactions).
+
+    Maintained on commit (see app/services/keyword_index.py) with the shared
+    normalizer from app/services/keyword_tokenizer.py.
+    """
+    __tablename__ = "transaction_keywords"
+
+    transaction_id = Column(
+        Integer, ForeignKey("bank_transactions.id", ondelete="CASCADE"), primary_key=True
+    )
+    keyword = Column(String(100), primary_key=True)
+
+    __table_args__ = (
+        Index('ix_transaction_keywords_keyword', 'keyword', 'transaction_id'),
+    )
+
+
+class RuleSetVersion(Base):
+    """
+    Version counter of categorization rules (singleton table).
+
+    Incremented in the same transaction as any change of CategorizationRule or
+    BusinessOperationMapping (see app/services/rule_cache.py), so every worker
+    process can tell whether its compiled rule set is stale.
+    """
+    __tablename__ = "rule_set_versions"
+
+    id = Column(Integer, primary_key=True, default=1)  # Singleton
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
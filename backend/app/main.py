@@ -22,6 +22,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 from app.db.session import engine
 from app.db.models import Base
+# Регистрирует слушатели сессии: дневные агрегаты, сводка по счетам, версия правил
+from app.services import daily_rollup, account_summary, rule_cache, keyword_index  # noqa: F401
 
 # Import routers
 from app.api.v1.auth import router as auth_router
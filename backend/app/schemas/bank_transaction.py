@@ -251,6 +251,8 @@ class BankTransactionList(BaseModel):
     page: int
     page_size: int
     pages: int
+    next_cursor: Optional[str] = None  # Курсор следующей страницы (keyset-режим)
+    total_is_exact: bool = True  # False, если total - оценка или значение из кэша
 
 
 # ==================== Analytics Schemas ====================
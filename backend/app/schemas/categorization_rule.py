@@ -1,7 +1,7 @@
 """Pydantic schemas for categorization rules."""
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field, validator
 
 from app.db.models import CategorizationRuleTypeEnum
@@ -78,3 +78,31 @@ class CategorizationRule(CategorizationRuleBase):
 
     class Config:
         from_attributes = True
+
+
+class CategorizationRulePreviewItem(BaseModel):
+    """Transaction affected by a candidate rule."""
+    id: int
+    transaction_date: datetime
+    amount: Decimal
+    counterparty_name: Optional[str] = None
+    counterparty_inn: Optional[str] = None
+    payment_purpose: Optional[str] = None
+    status: str
+    current_category_id: Optional[int] = None
+    outcome: str  # new / conflict / same / shadowed
+
+
+class CategorizationRulePreview(BaseModel):
+    """Impact preview of a candidate rule (dry run, nothing is saved)."""
+    # По всем активным транзакциям, подходящим под условие правила
+    matched_count: int
+    uncategorized_count: int  # без категории - правило их категоризирует
+    same_category_count: int  # уже в целевой категории
+    conflicting_count: int  # в другой категории
+    # Проверка приоритета правил на последних evaluated_count транзакциях
+    evaluated_count: int
+    would_categorize_count: int
+    would_conflict_count: int
+    shadowed_count: int  # решение принимает другое правило или маппинг с большим приоритетом
+    sample: List[CategorizationRulePreviewItem] = []
@@ -0,0 +1,540 @@
+"""
+Сводка по банковским счетам (bank_account_summaries) для /account-grouping.
+
+Таблица хранит итоги по ключу (счет, организация, банк) за все время - одна
+строка на ключ (уникальный индекс с NULLS NOT DISTINCT) - и поддерживается
+инкрементально, без пересчета истории счета:
+- слушатели сессии при первом изменении BankTransaction в транзакции читают
+  его прежнее состояние из БД и вычитают его вклад (ORM update/delete и
+  массовые query.update()/delete()); новые строки только запоминаются;
+- перед commit к этим дельтам прибавляется текущее состояние затронутых
+  строк, и сводка обновляется одним INSERT ... ON CONFLICT DO UPDATE
+  (total_count = total_count + дельта, ...). last_transaction_date
+  пересчитывается по счету, только если ушла строка с последней датой.
+
+Обновление идет под pg_advisory_xact_lock затронутых счетов, поэтому
+параллельные commit не теряют и не дублируют изменения. В других СУБД
+(SQLite в тестах) затронутые счета пересчитываются целиком
+(refresh_account_summary - им же пользуется полный пересчет).
+
+Код, который пишет в bank_transactions сырым SQL, должен сам вызвать
+mark_transactions_changed().
+
+Запросы с фильтрами (период, тип, статус) обслуживаются "дельта-режимом":
+движения за период собираются из дневных агрегатов по тому же ключу
+(счет, организация, банк).
+"""
+import logging
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, delete, distinct, event, func, insert, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import (
+    BankTransaction, BankAccountSummary, BankTransactionDailyRollup, Organization,
+    BankTransactionTypeEnum, BankTransactionStatusEnum
+)
+from app.schemas.bank_transaction import AccountGrouping, AccountGroupingList
+from app.services.daily_rollup import rollup_query
+from app.services.transaction_search import is_postgresql
+
+logger = logging.getLogger(__name__)
+
+TRACKED_IDS_KEY = "account_summary_tracked_ids"
+DELTAS_KEY = "account_summary_deltas"
+NO_ACCOUNT_LABEL = "Не указан"
+REFRESH_CHUNK_ACCOUNTS = 200
+REFRESH_CHUNK_IDS = 1000
+# Первый ключ pg_advisory_xact_lock(int, int) для блокировок счетов сводки
+SUMMARY_LOCK_NAMESPACE = 7302
+
+# None в наборе счетов означает группу без номера счета
+_NULL_ACCOUNT = object()
+
+_NEEDS_PROCESSING = (BankTransactionStatusEnum.NEW, BankTransactionStatusEnum.NEEDS_REVIEW)
+
+# Колонки BankTransaction, от которых зависит вклад строки в сводку
+SUMMARY_COLUMNS = (
+    BankTransaction.id,
+    BankTransaction.is_active,
+    BankTransaction.account_number,
+    BankTransaction.organization_id,
+    BankTransaction.our_bank_name,
+    BankTransaction.our_bank_bik,
+    BankTransaction.transaction_type,
+    BankTransaction.status,
+    BankTransaction.amount,
+    BankTransaction.transaction_date,
+)
+
+# (счет, организация, банк, БИК)
+SummaryKey = Tuple[Optional[str], Optional[int], Optional[str], Optional[str]]
+
+_COUNTERS = (
+    'total_count', 'credit_count', 'debit_count', 'needs_processing_count', 'approved_count',
+    'total_credit_amount', 'total_debit_amount',
+)
+
+
+class _SummaryDelta:
+    """Изменение итогов одного ключа сводки за транзакцию."""
+
+    __slots__ = _COUNTERS + ('added_last', 'removed_last')
+
+    def __init__(self):
+        for name in _COUNTERS:
+            setattr(self, name, 0)
+        self.added_last: Optional[datetime] = None
+        self.removed_last: Optional[datetime] = None
+
+    def add(self, row, sign: int) -> None:
+        amount = Decimal(row.amount or 0) * sign
+        self.total_count += sign
+        if row.transaction_type == BankTransactionTypeEnum.CREDIT:
+            self.credit_count += sign
+            self.total_credit_amount += amount
+        elif row.transaction_type == BankTransactionTypeEnum.DEBIT:
+            self.debit_count += sign
+            self.total_debit_amount += amount
+        if row.status in _NEEDS_PROCESSING:
+            self.needs_processing_count += sign
+        elif row.status == BankTransactionStatusEnum.APPROVED:
+            self.approved_count += sign
+
+        if row.transaction_date is None:
+            return
+        if sign > 0:
+            self.added_last = max(filter(None, (self.added_last, row.transaction_date)))
+        else:
+            self.removed_last = max(filter(None, (self.removed_last, row.transaction_date)))
+
+    def is_empty(self) -> bool:
+        return not any(getattr(self, name) for name in _COUNTERS) and self.added_last == self.removed_last
+
+    def needs_last_date(self) -> bool:
+        """Ушла строка, которая могла быть последней по дате."""
+        return self.removed_last is not None and (
+            self.added_last is None or self.added_last < self.removed_last
+        )
+
+
+def _summary_key(row) -> SummaryKey:
+    return (row.account_number, row.organization_id, row.our_bank_name, row.our_bank_bik)
+
+
+def _subtract_previous(session: Session, rows: Iterable) -> None:
+    """Вычесть прежний вклад строк, которые еще не менялись в этой транзакции."""
+    tracked: Set[int] = session.info.setdefault(TRACKED_IDS_KEY, set())
+    deltas: Dict[SummaryKey, _SummaryDelta] = session.info.setdefault(DELTAS_KEY, {})
+    for row in rows:
+        if row.id in tracked:
+            continue
+        tracked.add(row.id)
+        if row.is_active:
+            deltas.setdefault(_summary_key(row), _SummaryDelta()).add(row, -1)
+
+
+def mark_transactions_changed(
+    session: Session,
+    transaction_ids: Iterable[int],
+    previous_rows: Iterable = ()
+) -> None:
+    """
+    Учесть в сводке при ближайшем commit транзакции, измененные сырым SQL.
+
+    Args:
+        session: Сессия
+        transaction_ids: id созданных и измененных транзакций
+        previous_rows: Состояние измененных транзакций до изменения
+            (строки с колонками SUMMARY_COLUMNS)
+    """
+    _subtract_previous(session, previous_rows)
+    session.info.setdefault(TRACKED_IDS_KEY, set()).update(transaction_ids)
+
+
+def _account_condition(column, accounts: List):
+    numbers = [a for a in accounts if a is not _NULL_ACCOUNT]
+    conditions = []
+    if numbers:
+        conditions.append(column.in_(numbers))
+    if len(numbers) != len(accounts):
+        conditions.append(column.is_(None))
+    return or_(*conditions)
+
+
+def _key_condition(columns, key: SummaryKey):
+    # = вместо IS NOT DISTINCT FROM - чтобы использовался индекс по счету
+    return and_(*[
+        column.is_(None) if value is None else column == value
+        for column, value in zip(columns, key)
+    ])
+
+
+def _account_lock_id(account) -> int:
+    data = b'' if account is _NULL_ACCOUNT or not account else account.encode()
+    value = zlib.crc32(data)
+    return value - (1 << 32) if value >= 1 << 31 else value
+
+
+def _lock_accounts(session: Session, accounts: Iterable) -> None:
+    """Заблокировать счета до конца транзакции (по возрастанию ключа - без взаимных блокировок)."""
+    for lock_id in sorted({_account_lock_id(account) for account in accounts}):
+        session.execute(select(func.pg_advisory_xact_lock(SUMMARY_LOCK_NAMESPACE, lock_id)))
+
+
+def refresh_account_summary(session: Session, account_numbers: Iterable) -> int:
+    """
+    Пересчитать сводку по указанным счетам из bank_transactions целиком.
+
+    Returns:
+        Количество пересчитанных счетов.
+    """
+    accounts = list({a if a else _NULL_ACCOUNT for a in account_numbers})
+    S = BankAccountSummary
+    T = BankTransaction
+
+    is_credit = T.transaction_type == BankTransactionTypeEnum.CREDIT
+    is_debit = T.transaction_type == BankTransactionTypeEnum.DEBIT
+    lock_accounts = is_postgresql(session)
+
+    for start in range(0, len(accounts), REFRESH_CHUNK_ACCOUNTS):
+        chunk = accounts[start:start + REFRESH_CHUNK_ACCOUNTS]
+
+        source = select(
+            T.account_number,
+            T.organization_id,
+            T.our_bank_name,
+            T.our_bank_bik,
+            func.count(T.id),
+            func.count(T.id).filter(is_credit),
+            func.count(T.id).filter(is_debit),
+            func.count(T.id).filter(T.status.in_(_NEEDS_PROCESSING)),
+            func.count(T.id).filter(T.status == BankTransactionStatusEnum.APPROVED),
+            func.coalesce(func.sum(T.amount).filter(is_credit), 0),
+            func.coalesce(func.sum(T.amount).filter(is_debit), 0),
+            func.max(T.transaction_date),
+        ).where(
+            T.is_active == True,
+            _account_condition(T.account_number, chunk),
+        ).group_by(
+            T.account_number, T.organization_id, T.our_bank_name, T.our_bank_bik
+        )
+
+        if lock_accounts:
+            _lock_accounts(session, chunk)
+        session.execute(delete(S).where(_account_condition(S.account_number, chunk)))
+        session.execute(insert(S).from_select([
+            S.account_number, S.organization_id, S.our_bank_name, S.our_bank_bik,
+            S.total_count, S.credit_count, S.debit_count,
+            S.needs_processing_count, S.approved_count,
+            S.total_credit_amount, S.total_debit_amount,
+            S.last_transaction_date,
+        ], source))
+
+    return len(accounts)
+
+
+def _key_sort(item) -> tuple:
+    return tuple((value is None, value if value is not None else '') for value in item[0])
+
+
+def _apply_deltas_postgresql(session: Session, deltas: Dict[SummaryKey, _SummaryDelta]) -> None:
+    S = BankAccountSummary.__table__
+    T = BankTransaction
+    key_columns = [S.c.account_number, S.c.organization_id, S.c.our_bank_name, S.c.our_bank_bik]
+
+    _lock_accounts(session, {key[0] for key in deltas})
+
+    items = sorted(deltas.items(), key=_key_sort)
+    statement = pg_insert(S).values([
+        {
+            'account_number': key[0],
+            'organization_id': key[1],
+            'our_bank_name': key[2],
+            'our_bank_bik': key[3],
+            **{name: getattr(delta, name) for name in _COUNTERS},
+            'last_transaction_date': delta.added_last,
+        }
+        for key, delta in items
+    ])
+    session.execute(statement.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={
+            **{name: S.c[name] + statement.excluded[name] for name in _COUNTERS},
+            'last_transaction_date': func.greatest(
+                S.c.last_transaction_date, statement.excluded.last_transaction_date
+            ),
+            'updated_at': func.now(),
+        }
+    ))
+
+    # Последняя дата ушла (строка удалена, деактивирована или перенесена) -
+    # максимум по ключу считается заново
+    for key, delta in items:
+        if not delta.needs_last_date():
+            continue
+        latest = select(func.max(T.transaction_date)).where(
+            T.is_active == True,
+            _key_condition([T.account_number, T.organization_id, T.our_bank_name, T.our_bank_bik], key),
+        ).scalar_subquery()
+        session.execute(
+            update(S)
+            .where(_key_condition(key_columns, key), S.c.last_transaction_date <= delta.removed_last)
+            .values(last_transaction_date=latest)
+        )
+
+
+def apply_account_summary_changes(
+    session: Session,
+    transaction_ids: Iterable[int],
+    deltas: Dict[SummaryKey, _SummaryDelta]
+) -> int:
+    """
+    Прибавить к дельтам текущее состояние транзакций и обновить сводку.
+
+    Returns:
+        Количество измененных ключей сводки.
+    """
+    ids = sorted(transaction_ids)
+    for start in range(0, len(ids), REFRESH_CHUNK_IDS):
+        rows = session.execute(
+            select(*SUMMARY_COLUMNS).where(
+                BankTransaction.id.in_(ids[start:start + REFRESH_CHUNK_IDS]),
+                BankTransaction.is_active == True,
+            )
+        ).all()
+        for row in rows:
+            deltas.setdefault(_summary_key(row), _SummaryDelta()).add(row, 1)
+
+    deltas = {key: delta for key, delta in deltas.items() if not delta.is_empty()}
+    if not deltas:
+        return 0
+
+    if is_postgresql(session):
+        _apply_deltas_postgresql(session, deltas)
+    else:
+        refresh_account_summary(session, {key[0] for key in deltas})
+    return len(deltas)
+
+
+def rebuild_account_summary(session: Session) -> int:
+    """Полный пересчет сводки по всем счетам."""
+    # Несохраненные изменения попадут в пересчет - дельты по ним не нужны
+    session.flush()
+    session.info.pop(TRACKED_IDS_KEY, None)
+    session.info.pop(DELTAS_KEY, None)
+
+    accounts = {row[0] for row in session.query(distinct(BankTransaction.account_number)).all()}
+    accounts.update(row[0] for row in session.query(distinct(BankAccountSummary.account_number)).all())
+    return refresh_account_summary(session, accounts)
+
+
+def _organization_names(session: Session, org_ids: Iterable[int]) -> dict:
+    org_ids = {org_id for org_id in org_ids if org_id}
+    if not org_ids:
+        return {}
+    return dict(
+        session.query(Organization.id, Organization.name)
+        .filter(Organization.id.in_(org_ids)).all()
+    )
+
+
+def get_account_grouping_from_summary(session: Session) -> AccountGroupingList:
+    """/account-grouping без фильтров - чтение готовой сводки."""
+    rows = session.query(BankAccountSummary).filter(
+        BankAccountSummary.total_count > 0
+    ).order_by(BankAccountSummary.last_transaction_date.desc()).all()
+
+    orgs = _organization_names(session, (row.organization_id for row in rows))
+
+    accounts = [
+        AccountGrouping(
+            account_number=row.account_number or NO_ACCOUNT_LABEL,
+            organization_id=row.organization_id,
+            organization_name=orgs.get(row.organization_id),
+            our_bank_name=row.our_bank_name,
+            our_bank_bik=row.our_bank_bik,
+            total_count=row.total_count,
+            credit_count=row.credit_count,
+            debit_count=row.debit_count,
+            total_credit_amount=row.total_credit_amount,
+            total_debit_amount=row.total_debit_amount,
+            balance=row.total_credit_amount - row.total_debit_amount,
+            needs_processing_count=row.needs_processing_count,
+            approved_count=row.approved_count,
+            last_transaction_date=row.last_transaction_date
+        )
+        for row in rows
+    ]
+
+    return AccountGroupingList(accounts=accounts, total_accounts=len(accounts))
+
+
+def get_account_grouping_delta(
+    session: Session,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    transaction_type: Optional[BankTransactionTypeEnum] = None,
+    status: Optional[BankTransactionStatusEnum] = None,
+) -> AccountGroupingList:
+    """
+    /account-grouping с фильтрами - движения за период из дневных агрегатов.
+
+    Точность по дате - день: last_transaction_date равен началу последнего дня
+    с движениями, date_to включает весь день.
+    """
+    R = BankTransactionDailyRollup
+    query = rollup_query(
+        session, date_from=date_from, date_to=date_to, transaction_type=transaction_type
+    )
+    if status:
+        query = query.filter(R.status == status)
+
+    is_credit = R.transaction_type == BankTransactionTypeEnum.CREDIT
+    is_debit = R.transaction_type == BankTransactionTypeEnum.DEBIT
+
+    def count_where(condition=None):
+        total = func.sum(R.transaction_count)
+        if condition is not None:
+            total = total.filter(condition)
+        return func.coalesce(total, 0)
+
+    last_day = func.max(R.day)
+    rows = query.with_entities(
+        R.account_number,
+        R.organization_id,
+        R.our_bank_name,
+        R.our_bank_bik,
+        count_where().label('total_count'),
+        count_where(is_credit).label('credit_count'),
+        count_where(is_debit).label('debit_count'),
+        count_where(R.status.in_([
+            BankTransactionStatusEnum.NEW,
+            BankTransactionStatusEnum.NEEDS_REVIEW
+        ])).label('needs_processing_count'),
+        count_where(R.status == BankTransactionStatusEnum.APPROVED).label('approved_count'),
+        func.coalesce(func.sum(R.total_amount).filter(is_credit), 0).label('total_credit_amount'),
+        func.coalesce(func.sum(R.total_amount).filter(is_debit), 0).label('total_debit_amount'),
+        last_day.label('last_day'),
+    ).group_by(
+        R.account_number, R.organization_id, R.our_bank_name, R.our_bank_bik
+    ).order_by(last_day.desc()).all()
+    orgs = _organization_names(session, (row.organization_id for row in rows))
+
+    accounts = []
+    for row in rows:
+        credit_amount = Decimal(row.total_credit_amount or 0)
+        debit_amount = Decimal(row.total_debit_amount or 0)
+        accounts.append(AccountGrouping(
+            account_number=row.account_number or NO_ACCOUNT_LABEL,
+            organization_id=row.organization_id,
+            organization_name=orgs.get(row.organization_id),
+            our_bank_name=row.our_bank_name,
+            our_bank_bik=row.our_bank_bik,
+            total_count=int(row.total_count),
+            credit_count=int(row.credit_count),
+            debit_count=int(row.debit_count),
+            total_credit_amount=credit_amount,
+            total_debit_amount=debit_amount,
+            balance=credit_amount - debit_amount,
+            needs_processing_count=int(row.needs_processing_count),
+            approved_count=int(row.approved_count),
+            last_transaction_date=(
+                datetime.combine(row.last_day, datetime.min.time()) if row.last_day else None
+            )
+        ))
+
+    return AccountGroupingList(accounts=accounts, total_accounts=len(accounts))
+
+
+# ==================== Session listeners ====================
+
+def _capture_previous(session: Session, whereclause) -> None:
+    rows = session.execute(select(*SUMMARY_COLUMNS).where(whereclause)).all()
+    _subtract_previous(session, rows)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_flushed_transactions(session: Session, flush_context, instances) -> None:
+    """Вычесть прежний вклад измененных/удаленных BankTransaction (состояние в БД до flush)."""
+    if not settings.ACCOUNT_SUMMARY_ENABLED:
+        return
+
+    tracked = session.info.get(TRACKED_IDS_KEY, ())
+    ids = [
+        obj.id for obj in session.deleted
+        if isinstance(obj, BankTransaction) and obj.id not in tracked
+    ]
+    ids.extend(
+        obj.id for obj in session.dirty
+        if isinstance(obj, BankTransaction) and obj.id not in tracked and session.is_modified(obj)
+    )
+
+    for start in range(0, len(ids), REFRESH_CHUNK_IDS):
+        _capture_previous(session, BankTransaction.id.in_(ids[start:start + REFRESH_CHUNK_IDS]))
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flushed_transactions(session: Session, flush_context) -> None:
+    """Запомнить id новых и измененных BankTransaction."""
+    if not settings.ACCOUNT_SUMMARY_ENABLED:
+        return
+
+    ids = [
+        obj.id for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, BankTransaction)
+    ]
+    if ids:
+        session.info.setdefault(TRACKED_IDS_KEY, set()).update(ids)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_transactions(orm_execute_state) -> None:
+    """Вычесть прежний вклад строк массовых UPDATE/DELETE по bank_transactions."""
+    if not settings.ACCOUNT_SUMMARY_ENABLED:
+        return
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not BankTransaction:
+        return
+
+    affected = select(*SUMMARY_COLUMNS)
+    whereclause = orm_execute_state.statement.whereclause
+    if whereclause is not None:
+        affected = affected.where(whereclause)
+
+    session = orm_execute_state.session
+    _subtract_previous(session, session.execute(affected).all())
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_tracked_changes(session: Session) -> None:
+    """Обновить сводку в той же транзакции, что и изменения."""
+    if not settings.ACCOUNT_SUMMARY_ENABLED:
+        return
+
+    session.flush()
+    transaction_ids = session.info.pop(TRACKED_IDS_KEY, None)
+    deltas = session.info.pop(DELTAS_KEY, None)
+    if not transaction_ids and not deltas:
+        return
+
+    try:
+        with session.begin_nested():
+            apply_account_summary_changes(session, transaction_ids or (), deltas or {})
+    except Exception as e:
+        # Сводка не должна ломать основную запись - ее можно пересчитать позже
+        logger.warning(f"Account summary update failed for {len(transaction_ids or ())} transactions: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_tracked_changes(session: Session) -> None:
+    session.info.pop(TRACKED_IDS_KEY, None)
+    session.info.pop(DELTAS_KEY, None)
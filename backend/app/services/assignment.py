@@ -0,0 +1,88 @@
+"""
+Задача о назначениях (венгерский алгоритм) для сопоставления платежей с заявками.
+
+max_weight_assignment() по матрице весов строк (транзакций) и столбцов (заявок)
+находит паросочетание с максимальной суммой весов. Вес <= 0 означает "пары
+нет": такие пары в результат не попадают, строка остается без назначения.
+
+Реализация - венгерский алгоритм с потенциалами, O(n^2 * m); внутренний цикл
+по столбцам векторизован на numpy, поэтому компоненты в тысячи строк решаются
+за секунды.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+
+def max_weight_assignment(weights: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Назначение строк столбцам с максимальной суммой весов.
+
+    Args:
+        weights: Матрица n x m; вес <= 0 - пары нет
+
+    Returns:
+        [(row, column), ...] только для пар с положительным весом
+    """
+    weights = np.asarray(weights, dtype=float)
+    if weights.size == 0:
+        return []
+
+    # Алгоритм требует строк не больше, чем столбцов
+    transposed = weights.shape[0] > weights.shape[1]
+    matrix = weights.T if transposed else weights
+    n, m = matrix.shape
+
+    # Максимизация весов = минимизация (max - w); "нет пары" - вес 0
+    positive = np.where(matrix > 0, matrix, 0.0)
+    cost = positive.max() - positive
+
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)    # p[j] - строка (с 1), назначенная столбцу j
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+
+            free = ~used
+            free[0] = False
+            reduced = np.full(m + 1, np.inf)
+            reduced[1:] = cost[i0 - 1] - u[i0] - v[1:]
+
+            improve = free & (reduced < minv)
+            minv[improve] = reduced[improve]
+            way[improve] = j0
+
+            candidates = np.where(free, minv, np.inf)
+            j1 = int(np.argmin(candidates))
+            delta = candidates[j1]
+
+            used_columns = np.nonzero(used)[0]
+            u[p[used_columns]] += delta
+            v[used_columns] -= delta
+            minv[free] -= delta
+
+            j0 = j1
+            if p[j0] == 0:
+                break
+
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    pairs = []
+    for column in range(1, m + 1):
+        row = p[column]
+        if row and matrix[row - 1, column - 1] > 0:
+            pair = (row - 1, column - 1)
+            pairs.append((pair[1], pair[0]) if transposed else pair)
+    return pairs
@@ -3,7 +3,8 @@ import logging
 import asyncio
 import signal
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
-from typing import Optional, Dict, Any, List, Callable
+from contextlib import aclosing
+from typing import Optional, Dict, Any, AsyncIterator, List, Callable
 from datetime import date, datetime
 from decimal import Decimal
 
@@ -13,9 +14,11 @@ from app.db.session import SessionLocal
 from app.services.background_tasks import task_manager, TaskStatus
 from app.services.odata_1c_client import create_1c_client_from_env
 from app.services.bank_transaction_1c_import import BankTransaction1CImporter
+from app.services.odata_document_fetcher import DocumentPage, aiter_document_pages
+from app.services.sync_watermarks import WatermarkTracker, incremental_date_from
+from app.services.bank_transaction_upsert import upsert_bank_transactions
 from app.db.models import (
-    BankTransaction, BankTransactionTypeEnum, BankTransactionStatusEnum,
-    PaymentSourceEnum, Organization, Contractor,
+    BankTransactionTypeEnum, Organization, Contractor,
     BudgetCategory, ExpenseTypeEnum
 )
 
@@ -70,57 +73,6 @@ class AsyncSyncService:
         if task:
             task.total = max(total, 1)
 
-    @staticmethod
-    def _fetch_bank_documents(client, date_from: date, date_to: date) -> List[tuple[str, Dict[str, Any]]]:
-        """Fetch all bank-related documents from 1C with pagination."""
-        all_docs: List[tuple[str, Dict[str, Any]]] = []
-
-        # Fetch all receipts with pagination
-        skip = 0
-        while True:
-            receipts = client.get_bank_receipts(date_from, date_to, top=1000, skip=skip)
-            if not receipts:
-                break
-            all_docs.extend([("receipt", doc) for doc in receipts])
-            skip += len(receipts)
-            if len(receipts) < 1000:  # Last page
-                break
-
-        # Fetch all payments with pagination
-        skip = 0
-        while True:
-            payments = client.get_bank_payments(date_from, date_to, top=1000, skip=skip)
-            if not payments:
-                break
-            all_docs.extend([("payment", doc) for doc in payments])
-            skip += len(payments)
-            if len(payments) < 1000:  # Last page
-                break
-
-        # Fetch all cash receipts with pagination
-        skip = 0
-        while True:
-            cash_receipts = client.get_cash_receipts(date_from, date_to, top=1000, skip=skip)
-            if not cash_receipts:
-                break
-            all_docs.extend([("cash_receipt", doc) for doc in cash_receipts])
-            skip += len(cash_receipts)
-            if len(cash_receipts) < 1000:  # Last page
-                break
-
-        # Fetch all cash payments with pagination
-        skip = 0
-        while True:
-            cash_payments = client.get_cash_payments(date_from, date_to, top=1000, skip=skip)
-            if not cash_payments:
-                break
-            all_docs.extend([("cash_payment", doc) for doc in cash_payments])
-            skip += len(cash_payments)
-            if len(cash_payments) < 1000:  # Last page
-                break
-
-        return all_docs
-
     @classmethod
     async def _import_organizations(
         cls,
@@ -353,118 +305,148 @@ class AsyncSyncService:
         task_id: str,
         db: Session,
         importer: BankTransaction1CImporter,
-        all_docs: List[tuple[str, Dict[str, Any]]],
+        pages: AsyncIterator[DocumentPage],
         processed_offset: int = 0,
         total_count: Optional[int] = None
     ) -> tuple[Dict[str, Any], int]:
-        """Process bank documents and update progress."""
-        total_docs = len(all_docs)
-        total_for_progress = total_count if total_count is not None else total_docs
-        cls._set_task_total(task_id, total_for_progress if total_for_progress else 1)
+        """
+        Process bank documents page by page and update progress.
 
-        if total_docs == 0:
-            message = "Нет данных для импорта"
-            task_manager.update_progress(task_id, processed_offset, message=message)
-            return {
-                "success": True,
-                "message": message,
-                "total_fetched": 0,
-                "total_created": 0,
-                "total_updated": 0,
-                "total_skipped": 0,
-                "errors": [],
-            }, processed_offset
+        Страницы приходят из aiter_document_pages(): пока документы страницы
+        записываются в БД, следующие страницы загружаются из 1С. Всего
+        документов заранее не известно - total_count используется как оценка
+        и увеличивается по мере загрузки.
 
+        Документы страницы разбираются в строки (_prepare_document) и
+        записываются одним upsert_bank_transactions + commit на страницу.
+        """
         created = 0
         updated = 0
         skipped = 0
+        fetched = 0
         errors: List[str] = []
+        cancelled = False
+        tracker = WatermarkTracker()
+        i = -1
+
+        logger.info("Starting streaming import of bank documents (one upsert per page)")
+
+        async for doc_type, page, documents in pages:
+            fetched += len(documents)
+            cls._set_task_total(task_id, max(total_count or 0, processed_offset + fetched))
+            logger.debug(f"Processing {doc_type} page {page} ({len(documents)} documents)")
+
+            rows = []
+            # Документы, попавшие в upsert страницы - для водяных знаков
+            prepared = []
+            for doc in documents:
+                i += 1
+                try:
+                    # Проверка отмены задачи
+                    task = task_manager.get_task(task_id)
+                    if task and task.status == TaskStatus.CANCELLED:
+                        logger.info(f"Task {task_id} was cancelled by user at {i + 1}/{fetched}")
+                        cancelled = True
+                        break
+
+                    # Разбор документа с таймаутом 90 секунд (справочники
+                    # запрашиваются из 1С). Если разбор зависнет, документ будет пропущен
+                    try:
+                        row = with_timeout(
+                            cls._prepare_document,
+                            90,  # Таймаут 90 секунд (учитывая retry в HTTP-запросах)
+                            db, importer, doc_type, doc
+                        )
+                        if row is None:
+                            skipped += 1
+                        else:
+                            rows.append(row)
+                            prepared.append(doc)
+                    except TimeoutError as timeout_err:
+                        logger.warning(f"Document {i + 1} ({doc_type}) timeout: {timeout_err}")
+                        errors.append(f"Document {i + 1} ({doc_type}): timeout after 90 seconds")
+                        skipped += 1
+                        tracker.hold(doc_type)
+                        # Продолжаем обработку следующего документа
 
-        # Увеличенный размер батча для более эффективных коммитов
-        batch_size = 500
-        last_commit_index = 0
+                    # Обновление прогресса каждые 50 записей
+                    if i % 50 == 0:
+                        message = f"Обработано {i + 1} (загружено {fetched}) - создано: {created}, обновлено: {updated}, пропущено: {skipped}"
+                        task_manager.update_progress(
+                            task_id,
+                            processed_offset + i + 1,
+                            message=message
+                        )
 
-        logger.info(f"Starting import of {total_docs} bank documents (batch size: {batch_size})")
+                        # Логирование каждые 500 записей для отслеживания прогресса
+                        if (i + 1) % 500 == 0:
+                            logger.info(f"Progress: {message}")
 
-        for i, (doc_type, doc) in enumerate(all_docs):
-            try:
-                # Проверка отмены задачи
-                task = task_manager.get_task(task_id)
-                if task and task.status == TaskStatus.CANCELLED:
-                    logger.info(f"Task {task_id} was cancelled by user at {i + 1}/{total_docs}")
-                    break
+                    # Небольшая пауза для разгрузки event loop
+                    if i % 100 == 0:
+                        await asyncio.sleep(0.001)
 
-                # Обработка документа с таймаутом 90 секунд
-                # Если обработка зависнет, документ будет пропущен
-                try:
-                    result = with_timeout(
-                        cls._process_document,
-                        90,  # Таймаут 90 секунд (учитывая retry в HTTP-запросах)
-                        db, importer, doc_type, doc
-                    )
-                    if result == "created":
-                        created += 1
-                    elif result == "updated":
-                        updated += 1
-                    else:
-                        skipped += 1
-                except TimeoutError as timeout_err:
-                    logger.warning(f"Document {i + 1} ({doc_type}) timeout: {timeout_err}")
-                    errors.append(f"Document {i + 1} ({doc_type}): timeout after 90 seconds")
+                except Exception as e:
+                    # КРИТИЧНО: НЕ делаем rollback здесь - это блокирует всю обработку
+                    # Просто логируем ошибку и пропускаем проблемный документ
+                    error_msg = f"Document {i + 1} ({doc_type}): {str(e)}"
+                    errors.append(error_msg)
+                    logger.error(f"Error processing {error_msg}", exc_info=True)
+                    tracker.hold(doc_type)
                     skipped += 1
                     # Продолжаем обработку следующего документа
 
-                # Коммит каждые batch_size записей
-                if (i + 1) % batch_size == 0:
-                    try:
-                        db.commit()
-                        last_commit_index = i + 1
-                        logger.info(f"Committed batch at {i + 1}/{total_docs} ({created} created, {updated} updated, {skipped} skipped)")
-                    except Exception as commit_error:
-                        logger.error(f"Commit error at item {i + 1}: {commit_error}", exc_info=True)
-                        db.rollback()
-                        errors.append(f"Commit failed at {i + 1}: {str(commit_error)}")
-                        # Продолжаем обработку после ошибки коммита
-
-                # Обновление прогресса каждые 50 записей или на последней записи
-                if i % 50 == 0 or i == total_docs - 1:
-                    processed_value = processed_offset + i + 1
-                    percent = int((i + 1) / total_docs * 100)
-                    message = f"Обработано {i + 1}/{total_docs} ({percent}%) - создано: {created}, обновлено: {updated}, пропущено: {skipped}"
-                    task_manager.update_progress(
-                        task_id,
-                        processed_value,
-                        message=message
-                    )
-
-                    # Логирование каждые 500 записей для отслеживания прогресса
-                    if (i + 1) % 500 == 0:
-                        logger.info(f"Progress: {message}")
+            # Страница - один upsert и один commit
+            try:
+                created_ids, updated_ids, unchanged = upsert_bank_transactions(db, rows)
+                importer._queue_created(created_ids)
+                importer._apply_pending_classifications()
+                db.commit()
+                created += len(created_ids)
+                updated += len(updated_ids)
+                skipped += unchanged
+                for doc in prepared:
+                    tracker.observe(doc_type, doc)
+                logger.info(f"Committed {doc_type} page {page} ({created} created, {updated} updated, {skipped} skipped)")
+            except Exception as commit_error:
+                logger.error(f"Commit error at {doc_type} page {page}: {commit_error}", exc_info=True)
+                db.rollback()
+                errors.append(f"Commit failed at {doc_type} page {page}: {str(commit_error)}")
+                skipped += len(rows)
+                tracker.hold(doc_type)
+                # Stub-маппинги страницы откатились - обновить кэш импортера
+                importer._preload_business_operation_mappings()
+                # Продолжаем обработку после ошибки коммита
+
+            if cancelled:
+                break
 
-                # Небольшая пауза для разгрузки event loop
-                if i % 100 == 0:
-                    await asyncio.sleep(0.001)
+        total_docs = i + 1
+        if fetched == 0:
+            message = "Нет данных для импорта"
+            task_manager.update_progress(task_id, processed_offset, message=message)
+            return {
+                "success": True,
+                "message": message,
+                "total_fetched": 0,
+                "total_created": 0,
+                "total_updated": 0,
+                "total_skipped": 0,
+                "errors": [],
+            }, processed_offset
 
-            except Exception as e:
-                # КРИТИЧНО: НЕ делаем rollback здесь - это блокирует всю обработку
-                # Просто логируем ошибку и пропускаем проблемный документ
-                error_msg = f"Document {i + 1} ({doc_type}): {str(e)}"
-                errors.append(error_msg)
-                logger.error(f"Error processing {error_msg}", exc_info=True)
-                skipped += 1
-                # Продолжаем обработку следующего документа
-
-        # Финальный коммит для оставшихся записей
+        # Водяные знаки - отдельным commit после записи всех страниц
         try:
-            if last_commit_index < total_docs:
+            if not cancelled:
+                tracker.save(db)
                 db.commit()
-                logger.info(f"Final commit: total {created} created, {updated} updated, {skipped} skipped")
         except Exception as e:
             logger.error(f"Final commit error: {e}", exc_info=True)
             db.rollback()
             errors.append(f"Final commit failed: {str(e)}")
 
         final_processed = processed_offset + total_docs
+        cls._set_task_total(task_id, final_processed)
         final_message = f"Завершено: {created} создано, {updated} обновлено, {skipped} пропущено"
         task_manager.update_progress(
             task_id,
@@ -477,7 +459,7 @@ class AsyncSyncService:
         return {
             "success": True,
             "message": f"Импорт завершён: {created} создано, {updated} обновлено, {skipped} пропущено",
-            "total_fetched": total_docs,
+            "total_fetched": fetched,
             "total_created": created,
             "total_updated": updated,
             "total_skipped": skipped,
@@ -547,37 +529,29 @@ class AsyncSyncService:
                 message="Получение данных из 1С..."
             )
 
-            all_docs = cls._fetch_bank_documents(client, date_from, date_to)
-            total_docs = len(all_docs)
-            cls._set_task_total(task_id, total_docs or 1)
-
-            if total_docs == 0:
-                message = "Нет данных для импорта"
-                task_manager.update_progress(task_id, 1, message=message)
-                return {
-                    "success": True,
-                    "message": message,
-                    "total_fetched": 0,
-                    "total_created": 0,
-                    "total_updated": 0,
-                    "total_skipped": 0,
-                    "errors": [],
-                }
-
             importer = BankTransaction1CImporter(
                 db=db,
                 odata_client=client,
                 auto_classify=auto_classify
             )
+            # Справочник счетов - до страниц и вне таймаута разбора документа
+            importer.preload_reference_data()
+            db.commit()
 
-            result, _ = await cls._import_bank_documents(
-                task_id,
-                db,
-                importer,
-                all_docs,
-                processed_offset=0,
-                total_count=total_docs
-            )
+            # Загрузка и запись идут одновременно (страницами)
+            task = task_manager.get_task(task_id)
+            async with aclosing(aiter_document_pages(client, date_from, date_to)) as pages:
+                result, total_docs = await cls._import_bank_documents(
+                    task_id,
+                    db,
+                    importer,
+                    pages,
+                    processed_offset=0,
+                    total_count=task.total if task else None
+                )
+
+            if result["total_fetched"] == 0:
+                return result
 
             # Обновить банковскую информацию в транзакциях
             task_manager.update_progress(task_id, total_docs, message="Обновление банковской информации...")
@@ -601,62 +575,53 @@ class AsyncSyncService:
             db.close()
 
     @classmethod
-    def _process_document(
+    def _prepare_document(
         cls,
         db: Session,
         importer: BankTransaction1CImporter,
         doc_type: str,
         doc: Dict
-    ) -> str:
-        """Process a single document using importer methods.
+    ) -> Optional[Dict[str, Any]]:
+        """Parse a single document into a row for upsert_bank_transactions.
 
-        Returns 'created', 'updated', or 'skipped'.
+        Returns None if the document is skipped.
         """
         ref_key = doc.get("Ref_Key")
         if not ref_key:
             logger.debug("Skipping document without Ref_Key")
-            return "skipped"
+            return None
 
         try:
-            # Check if exists
-            existing = db.query(BankTransaction).filter(
-                BankTransaction.external_id_1c == ref_key
-            ).first()
-
             # Parse amount
             amount = Decimal(str(doc.get("СуммаДокумента", 0) or 0))
             if amount == 0:
                 logger.debug(f"Skipping document {ref_key} with zero amount")
-                return "skipped"
+                return None
 
             # Use importer's parsing methods for correct data extraction
             try:
                 if doc_type == "receipt":
                     transaction_data = importer._parse_receipt_data(doc)
                     tx_type = BankTransactionTypeEnum.CREDIT
-                    payment_source = PaymentSourceEnum.BANK
                 elif doc_type == "payment":
                     transaction_data = importer._parse_payment_data(doc)
                     tx_type = BankTransactionTypeEnum.DEBIT
-                    payment_source = PaymentSourceEnum.BANK
                 elif doc_type == "cash_receipt":
                     transaction_data = importer._parse_cash_receipt_data(doc)
                     tx_type = BankTransactionTypeEnum.CREDIT
-                    payment_source = PaymentSourceEnum.CASH
                 elif doc_type == "cash_payment":
                     transaction_data = importer._parse_cash_payment_data(doc)
                     tx_type = BankTransactionTypeEnum.DEBIT
-                    payment_source = PaymentSourceEnum.CASH
                 else:
                     logger.warning(f"Unknown document type: {doc_type}")
-                    return "skipped"
+                    return None
             except Exception as e:
                 logger.warning(f"Failed to parse document {ref_key} ({doc_type}): {e}")
-                return "skipped"
+                return None
 
             if not transaction_data.get('transaction_date'):
                 logger.debug(f"Skipping document {ref_key} without transaction date")
-                return "skipped"
+                return None
 
             # Ensure business_operation mapping exists (с использованием кэша импортера)
             if transaction_data.get('business_operation'):
@@ -684,73 +649,16 @@ class AsyncSyncService:
                     # Добавляем в кэш
                     importer._business_operation_mapping_cache.add(business_op)
 
-            if existing:
-                # Update existing transaction with parsed data
-                # Защищенные поля - не перезаписываем пользовательские изменения
-                protected_fields = {
-                    'status', 'category_id', 'suggested_category_id',
-                    'category_confidence', 'approved_by', 'approved_at',
-                    'expense_id', 'notes'
-                }
-
-                for key, value in transaction_data.items():
-                    if key in protected_fields:
-                        # Для notes - обновляем только если пусто
-                        if key == 'notes' and not getattr(existing, key, None):
-                            setattr(existing, key, value)
-                        continue
-                    if hasattr(existing, key) and value is not None:
-                        setattr(existing, key, value)
-
-                logger.debug(f"Updated transaction {ref_key}")
-                return "updated"
-            else:
-                # Create new transaction
-                transaction_data['external_id_1c'] = ref_key
-                transaction_data['transaction_type'] = tx_type
-                transaction_data['payment_source'] = payment_source
-                transaction_data['import_source'] = 'ODATA_1C'
-                transaction_data['imported_at'] = datetime.utcnow()
-                transaction_data['is_active'] = True
-
-                transaction = BankTransaction(**transaction_data)
-
-                # Apply classification if enabled
-                # RULES auto-apply, AI only suggests
-                if importer.auto_classify and importer.classifier:
-                    try:
-                        category_id, confidence, reasoning, is_rule_based = importer.classifier.classify(
-                            payment_purpose=transaction.payment_purpose,
-                            counterparty_name=transaction.counterparty_name,
-                            counterparty_inn=transaction.counterparty_inn,
-                            amount=transaction.amount,
-                            transaction_type=transaction.transaction_type,
-                            business_operation=transaction.business_operation
-                        )
-                        if category_id:
-                            if is_rule_based:
-                                # RULE: auto-apply category
-                                transaction.category_id = category_id
-                                transaction.category_confidence = Decimal(str(confidence))
-                                transaction.status = BankTransactionStatusEnum.CATEGORIZED
-                            else:
-                                # AI HEURISTIC: only suggest
-                                transaction.suggested_category_id = category_id
-                                transaction.category_confidence = Decimal(str(confidence))
-                                transaction.status = BankTransactionStatusEnum.NEEDS_REVIEW
-                    except Exception as e:
-                        logger.warning(f"Classification failed for {ref_key}: {e}")
-
-                db.add(transaction)
-                logger.debug(f"Created transaction {ref_key}")
-                return "created"
+            # Тип, источник и время импорта - только для новых записей;
+            # защищенные поля существующих записей upsert не затирает
+            return importer._new_transaction_row(ref_key, transaction_data, tx_type)
 
         except Exception as e:
             # ВАЖНО: НЕ делаем rollback и НЕ пробрасываем исключение
             # Это блокирует обработку всего батча
-            # Вместо этого логируем ошибку и возвращаем "skipped"
+            # Вместо этого логируем ошибку и пропускаем документ
             logger.error(f"Error processing document {ref_key} ({doc_type}): {e}", exc_info=True)
-            return "skipped"
+            return None
 
     @classmethod
     def start_organizations_sync(cls, user_id: int = None) -> str:
@@ -1187,9 +1095,15 @@ class AsyncSyncService:
         date_from: date,
         date_to: date,
         auto_classify: bool = True,
-        user_id: int = None
+        user_id: int = None,
+        incremental: bool = False
     ) -> str:
-        """Start full async sync (organizations, categories, transactions)."""
+        """
+        Start full async sync (organizations, categories, transactions).
+
+        incremental=True: банковские документы загружаются только от водяных
+        знаков коллекций (sync_watermarks), не раньше date_from.
+        """
         task_id = task_manager.create_task(
             task_type=cls.TASK_TYPE_FULL_SYNC,
             total=0,
@@ -1197,6 +1111,7 @@ class AsyncSyncService:
                 "date_from": date_from.isoformat(),
                 "date_to": date_to.isoformat(),
                 "auto_classify": auto_classify,
+                "incremental": incremental,
                 "user_id": user_id,
             }
         )
@@ -1206,7 +1121,8 @@ class AsyncSyncService:
             cls._sync_full_async,
             date_from=date_from,
             date_to=date_to,
-            auto_classify=auto_classify
+            auto_classify=auto_classify,
+            incremental=incremental
         )
 
         return task_id
@@ -1217,7 +1133,8 @@ class AsyncSyncService:
         task_id: str,
         date_from: date,
         date_to: date,
-        auto_classify: bool
+        auto_classify: bool,
+        incremental: bool = False
     ) -> Dict[str, Any]:
         """Async worker for full sync."""
         db = SessionLocal()
@@ -1232,27 +1149,18 @@ class AsyncSyncService:
             task_manager.update_progress(task_id, 0, message="Загрузка данных из 1С...")
             org_docs = client.get_organizations()
             cat_docs = client.get_cash_flow_categories()
-            bank_docs = cls._fetch_bank_documents(client, date_from, date_to)
 
-            total_count = len(org_docs) + len(cat_docs) + len(bank_docs)
-            total_for_progress = max(total_count, 1)
-            cls._set_task_total(task_id, total_for_progress)
+            date_from_by_type = None
+            if incremental:
+                date_from_by_type = incremental_date_from(db, date_from, date_to)
+                logger.info(f"Incremental sync from watermarks: {date_from_by_type}")
 
-            if total_count == 0:
-                task_manager.update_progress(task_id, total_for_progress, message="Нет данных для синхронизации")
-                return {
-                    "success": True,
-                    "message": "Нет данных для синхронизации",
-                    "organizations": {"total": 0, "created": 0, "updated": 0},
-                    "categories": {"total": 0, "created": 0, "updated": 0},
-                    "transactions": {
-                        "total_fetched": 0,
-                        "total_created": 0,
-                        "total_updated": 0,
-                        "total_skipped": 0,
-                        "errors": [],
-                    },
-                }
+            # Банковские документы загружаются потоково при импорте; для
+            # прогресса - оценка 50 документов в день
+            bank_date_from = min(date_from_by_type.values()) if date_from_by_type else date_from
+            estimated_bank_docs = ((date_to - bank_date_from).days + 1) * 50
+            total_for_progress = max(len(org_docs) + len(cat_docs) + estimated_bank_docs, 1)
+            cls._set_task_total(task_id, total_for_progress)
 
             processed = 0
 
@@ -1277,15 +1185,21 @@ class AsyncSyncService:
                 odata_client=client,
                 auto_classify=auto_classify
             )
+            # Справочник счетов - до страниц и вне таймаута разбора документа
+            importer.preload_reference_data()
+            db.commit()
 
-            bank_result, processed = await cls._import_bank_documents(
-                task_id,
-                db,
-                importer,
-                bank_docs,
-                processed_offset=processed,
-                total_count=total_for_progress
-            )
+            async with aclosing(aiter_document_pages(
+                client, date_from, date_to, date_from_by_type=date_from_by_type
+            )) as pages:
+                bank_result, processed = await cls._import_bank_documents(
+                    task_id,
+                    db,
+                    importer,
+                    pages,
+                    processed_offset=processed,
+                    total_count=total_for_progress
+                )
 
             # Обновить банковскую информацию в транзакциях
             task_manager.update_progress(task_id, processed, message="Обновление банковской информации...")
@@ -1306,6 +1220,7 @@ class AsyncSyncService:
             return {
                 "success": True,
                 "message": final_message,
+                "incremental": incremental,
                 "organizations": org_result,
                 "categories": cat_result,
                 "transactions": bank_result,
@@ -0,0 +1,206 @@
+"""
+Фоновое автосопоставление банковских транзакций с заявками.
+
+Кандидаты - все непривязанные расходные транзакции
+(ExpenseMatchingService.unlinked_transactions_query). Они читаются порциями по
+возрастанию id (keyset), открытые заявки загружаются один раз в
+ExpenseCandidateIndex, каждая порция сопоставляется match_batch() и
+записывается отдельным commit.
+
+Прогресс и число привязок публикуются через task_manager
+(WebSocket /ws/tasks/{task_id}); прерванный прогон можно продолжить с
+last_id другой задачи.
+
+Режим dry_run ничего не записывает: привязки применяются только в памяти
+сессии (autoflush выключен, commit не вызывается), чтобы следующие порции
+видели уменьшенные остатки заявок, а в конце сессия откатывается. В
+результат задачи попадают предложенные привязки.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from app.db.models import BankTransaction
+from app.db.session import SessionLocal
+from app.services.background_tasks import task_manager, TaskStatus
+from app.services.expense_matching import (
+    AutoMatchModeEnum, ExpenseCandidateIndex, ExpenseMatchingService
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+# Привязок в результате задачи (остальные только считаются)
+MAX_REPORTED_MATCHES = 5000
+
+
+class AutoMatchService:
+    """Автосопоставление транзакций с заявками фоновой задачей."""
+
+    TASK_TYPE_AUTO_MATCH = "auto_match_expenses"
+
+    @classmethod
+    def start_auto_match(
+        cls,
+        threshold: float = 70.0,
+        mode: AutoMatchModeEnum = AutoMatchModeEnum.GREEDY,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        dry_run: bool = False,
+        resume_task_id: Optional[str] = None,
+        user_id: Optional[int] = None
+    ) -> str:
+        """
+        Запустить фоновое автосопоставление.
+
+        Args:
+            threshold: Минимальный score привязки
+            mode: Жадный или оптимальный (по пакету) режим
+            batch_size: Транзакций в порции (одна порция - один commit)
+            dry_run: Только предложить привязки, ничего не записывая
+            resume_task_id: Продолжить с last_id предыдущей задачи
+            user_id: Кто запустил
+
+        Returns:
+            ID задачи
+        """
+        start_after_id = 0
+
+        if resume_task_id:
+            previous = task_manager.get_task(resume_task_id)
+            if not previous or previous.task_type != cls.TASK_TYPE_AUTO_MATCH:
+                raise ValueError(f"Auto-match task {resume_task_id} not found")
+            start_after_id = int(previous.metadata.get("last_id") or 0)
+
+        task_id = task_manager.create_task(
+            task_type=cls.TASK_TYPE_AUTO_MATCH,
+            total=0,
+            metadata={
+                "threshold": threshold,
+                "mode": mode.value,
+                "batch_size": batch_size,
+                "dry_run": dry_run,
+                "resumed_from": resume_task_id,
+                "start_after_id": start_after_id,
+                "last_id": start_after_id,
+                "user_id": user_id,
+            },
+            user_id=user_id
+        )
+
+        task_manager.run_async_task(
+            task_id,
+            cls._auto_match_async,
+            threshold=threshold,
+            mode=mode,
+            batch_size=batch_size,
+            dry_run=dry_run,
+            start_after_id=start_after_id
+        )
+
+        return task_id
+
+    @classmethod
+    async def _auto_match_async(
+        cls,
+        task_id: str,
+        threshold: float,
+        mode: AutoMatchModeEnum,
+        batch_size: int,
+        dry_run: bool,
+        start_after_id: int
+    ) -> Dict[str, Any]:
+        """Async worker: порции по id → match_batch → commit (или откат в dry_run)."""
+        db = SessionLocal()
+        # Commit порции не должен сбрасывать заявки индекса
+        db.expire_on_commit = False
+        if dry_run:
+            # Привязки остаются в памяти сессии: запросы следующих порций
+            # не должны сбрасывать их в БД
+            db.autoflush = False
+        try:
+            service = ExpenseMatchingService(db)
+
+            total = service.unlinked_transactions_query().filter(
+                BankTransaction.id > start_after_id
+            ).count()
+            task = task_manager.get_task(task_id)
+            if task:
+                task.total = max(total, 1)
+
+            index = ExpenseCandidateIndex.load(db)
+
+            last_id = start_after_id
+            processed = 0
+            matched_count = 0
+            matches = []
+            cancelled = False
+
+            task_manager.update_progress(
+                task_id, 0,
+                message=f"Найдено {total} транзакций, открытых заявок: {len(index)}"
+            )
+
+            while True:
+                task = task_manager.get_task(task_id)
+                if task and task.status == TaskStatus.CANCELLED:
+                    logger.info(f"Auto-match {task_id} cancelled at id {last_id}")
+                    cancelled = True
+                    break
+
+                transactions = service.unlinked_transactions_query().filter(
+                    BankTransaction.id > last_id
+                ).order_by(BankTransaction.id).limit(batch_size).all()
+                if not transactions:
+                    break
+
+                batch_matches = service.match_batch(transactions, index, threshold, mode)
+                if not dry_run:
+                    db.commit()
+
+                last_id = transactions[-1].id
+                processed += len(transactions)
+                matched_count += len(batch_matches)
+                for match in batch_matches:
+                    if len(matches) >= MAX_REPORTED_MATCHES:
+                        break
+                    matches.append(service.match_to_dict(match))
+
+                task_manager.update_progress(
+                    task_id,
+                    processed,
+                    message=(
+                        f"Обработано {processed}/{total} - "
+                        f"{'предложено' if dry_run else 'привязано'}: {matched_count}"
+                    ),
+                    metadata={"last_id": last_id, "matched": matched_count}
+                )
+
+                # Отдать управление event loop между порциями
+                await asyncio.sleep(0)
+
+            if dry_run:
+                db.rollback()
+
+            message = (
+                f"{'Остановлено' if cancelled else 'Завершено'}: обработано {processed}, "
+                f"{'предложено' if dry_run else 'привязано'} {matched_count}"
+            )
+            logger.info(f"Auto-match {task_id}: {message} (last id {last_id})")
+
+            return {
+                "success": not cancelled,
+                "message": message,
+                "dry_run": dry_run,
+                "total_processed": processed,
+                "total_matched": matched_count,
+                "matches": matches,
+                "matches_truncated": matched_count > len(matches),
+                "last_id": last_id,
+            }
+
+        except Exception:
+            db.rollback()
+            logger.exception("Auto-match failed")
+            raise
+        finally:
+            db.close()
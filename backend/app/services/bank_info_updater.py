@@ -1,87 +1,16 @@
 """Service for updating bank information in existing transactions."""
 import logging
-from typing import Dict, Tuple
+from typing import Dict
 
 from sqlalchemy.orm import Session
 
 from app.db.models import BankTransaction
+from app.services.bank_reference_cache import BankAccountCache
 from app.services.odata_1c_client import OData1CClient
 
 logger = logging.getLogger(__name__)
 
 
-def load_all_bank_accounts(client: OData1CClient) -> Dict[str, Tuple[str, str]]:
-    """
-    Load all bank accounts from 1C into cache.
-
-    Returns:
-        Dict[account_number, Tuple[bank_name, bank_bik]]
-    """
-    logger.info("Loading bank accounts from 1C...")
-    accounts_cache = {}
-
-    try:
-        skip = 0
-        page_size = 100
-
-        while True:
-            response = client._make_request(
-                method='GET',
-                endpoint='Catalog_БанковскиеСчетаОрганизаций',
-                params={
-                    '$format': 'json',
-                    '$expand': 'Банк',
-                    '$top': page_size,
-                    '$skip': skip
-                }
-            )
-
-            results = response.get('value', [])
-
-            if not results:
-                break
-
-            for account_data in results:
-                account_number = account_data.get('НомерСчета')
-
-                if not account_number:
-                    continue
-
-                # Get bank information
-                bank_name = None
-                bank_bik = None
-
-                # From expanded data
-                bank_data = account_data.get('Банк')
-                if bank_data and isinstance(bank_data, dict):
-                    bank_name = (
-                        bank_data.get('Description') or
-                        bank_data.get('Наименование') or
-                        bank_data.get('НаименованиеПолное')
-                    )
-                    bank_bik = bank_data.get('Code') or bank_data.get('Код') or bank_data.get('БИК')
-
-                # Fallback: data directly from account_data
-                if not bank_name or not bank_bik:
-                    bank_name = bank_name or account_data.get('НаименованиеБанка')
-                    bank_bik = bank_bik or account_data.get('БИКБанка')
-
-                if bank_name and bank_bik:
-                    accounts_cache[account_number] = (
-                        str(bank_name)[:500],
-                        str(bank_bik)[:20]
-                    )
-
-            skip += page_size
-
-        logger.info(f"Loaded {len(accounts_cache)} bank accounts from 1C")
-        return accounts_cache
-
-    except Exception as e:
-        logger.error(f"Error loading bank accounts: {e}")
-        return accounts_cache
-
-
 def update_transactions_bank_info(db: Session, client: OData1CClient) -> Dict[str, int]:
     """
     Update bank information in all transactions without it.
@@ -109,8 +38,8 @@ def update_transactions_bank_info(db: Session, client: OData1CClient) -> Dict[st
 
         logger.info(f"Found {total} transactions to update")
 
-        # Load all bank accounts from 1C
-        accounts_cache = load_all_bank_accounts(client)
+        # Bank accounts from the persisted 1C catalog (reloaded if stale)
+        accounts_cache = BankAccountCache(db, client).accounts_by_number()
 
         # Update transactions
         for transaction in transactions:
@@ -0,0 +1,227 @@
+"""
+Справочник банковских счетов организаций 1С (bank_account_references).
+
+Документы 1С ссылаются на счет организации по Ref_Key. Раньше каждый импортер
+для каждого нового ключа делал до двух запросов OData (счет, затем банк), и
+кэш жил только до конца импорта. Теперь справочник
+Catalog_БанковскиеСчетаОрганизаций с $expand=Банк загружается целиком
+несколькими страницами, хранится в таблице со временем загрузки
+(refreshed_at) и используется всеми импортами и синхронизациями:
+- BankAccountCache читает таблицу один раз и перезагружает справочник из 1С,
+  если он пуст или последняя полная загрузка старше
+  BANK_REFERENCE_REFRESH_HOURS. Импорт загружает справочник заранее
+  (preload) - до разбора документов и вне его таймаута;
+- счет, которого нет в таблице (создан после загрузки), запрашивается по
+  ключу как раньше и тоже сохраняется - без refreshed_at, чтобы не считать
+  справочник свежим.
+
+Записи пишутся в SAVEPOINT текущей транзакции - commit делает импорт; ошибка
+загрузки справочника не прерывает импорт.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import BankAccountReference
+from app.services.odata_1c_client import OData1CClient
+from app.services.transaction_search import is_postgresql
+
+logger = logging.getLogger(__name__)
+
+EMPTY_GUID = "00000000-0000-0000-0000-000000000000"
+CATALOG_PAGE_SIZE = 1000
+
+# (номер счета, банк, БИК)
+BankAccountInfo = Tuple[Optional[str], Optional[str], Optional[str]]
+
+
+def parse_bank(bank_data: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Название и БИК банка из Catalog_Банки (БИК хранится в поле Code)."""
+    bank_name = (
+        bank_data.get('Description') or
+        bank_data.get('Наименование') or
+        bank_data.get('НаименованиеПолное')
+    )
+    bank_bik = bank_data.get('Code') or bank_data.get('Код') or bank_data.get('БИК')
+    return bank_name, bank_bik
+
+
+def parse_bank_account(account_data: Dict[str, Any]) -> BankAccountInfo:
+    """Номер счета, банк и БИК из Catalog_БанковскиеСчетаОрганизаций (с $expand=Банк)."""
+    account_number = (
+        account_data.get('НомерСчета') or
+        account_data.get('Description') or
+        account_data.get('Code')
+    )
+
+    bank_data = account_data.get('Банк')
+    if bank_data and isinstance(bank_data, dict):
+        bank_name, bank_bik = parse_bank(bank_data)
+    else:
+        bank_name, bank_bik = None, None
+    bank_name = bank_name or account_data.get('БанкНаименование') or account_data.get('НаименованиеБанка')
+    bank_bik = bank_bik or account_data.get('БИК') or account_data.get('БанкБИК') or account_data.get('БИКБанка')
+
+    return (
+        str(account_number)[:20] if account_number else None,
+        str(bank_name)[:500] if bank_name else None,
+        str(bank_bik)[:20] if bank_bik else None
+    )
+
+
+def _bank_key(account_data: Dict[str, Any]) -> Optional[str]:
+    bank_data = account_data.get('Банк')
+    bank_key = account_data.get('Банк_Key') or (
+        bank_data.get('Ref_Key') if isinstance(bank_data, dict) else None
+    )
+    return bank_key if bank_key and bank_key != EMPTY_GUID else None
+
+
+def fetch_bank_accounts(client: OData1CClient) -> List[Dict[str, Any]]:
+    """Весь справочник банковских счетов организаций постранично (с банками)."""
+    accounts = []
+    skip = 0
+    while True:
+        response = client._make_request(
+            method='GET',
+            endpoint='Catalog_БанковскиеСчетаОрганизаций',
+            params={
+                '$format': 'json',
+                '$expand': 'Банк',
+                '$top': CATALOG_PAGE_SIZE,
+                '$skip': skip
+            }
+        )
+        page = response.get('value', [])
+        accounts.extend(page)
+        if len(page) < CATALOG_PAGE_SIZE:
+            return accounts
+        skip += CATALOG_PAGE_SIZE
+
+
+def _reference_row(
+    ref_key: str,
+    account_data: Dict[str, Any],
+    refreshed_at: Optional[datetime]
+) -> Dict[str, Any]:
+    account_number, bank_name, bank_bik = parse_bank_account(account_data)
+    return {
+        'ref_key': ref_key,
+        'account_number': account_number,
+        'bank_key': _bank_key(account_data),
+        'bank_name': bank_name,
+        'bank_bik': bank_bik,
+        'refreshed_at': refreshed_at,
+    }
+
+
+def _store(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Сохранить счета (новые добавить, существующие обновить) в SAVEPOINT."""
+    if not rows:
+        return
+    with db.begin_nested():
+        if is_postgresql(db):
+            statement = pg_insert(BankAccountReference).values(rows)
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[BankAccountReference.ref_key],
+                set_={
+                    **{
+                        column: statement.excluded[column]
+                        for column in ('account_number', 'bank_key', 'bank_name', 'bank_bik')
+                    },
+                    # Запись по ключу не меняет время полной загрузки
+                    'refreshed_at': func.coalesce(
+                        statement.excluded.refreshed_at, BankAccountReference.refreshed_at
+                    ),
+                }
+            ))
+        else:
+            for row in rows:
+                if row['refreshed_at'] is None:
+                    row = {key: value for key, value in row.items() if key != 'refreshed_at'}
+                db.merge(BankAccountReference(**row))
+
+
+def refresh_bank_accounts(db: Session, client: OData1CClient) -> int:
+    """
+    Перезагрузить справочник из 1С (без commit).
+
+    Returns:
+        Количество загруженных счетов
+    """
+    refreshed_at = datetime.utcnow()
+    rows = [
+        _reference_row(account_data['Ref_Key'], account_data, refreshed_at)
+        for account_data in fetch_bank_accounts(client)
+        if account_data.get('Ref_Key')
+    ]
+    _store(db, rows)
+    logger.info(f"Loaded {len(rows)} organization bank accounts from 1C")
+    return len(rows)
+
+
+class BankAccountCache:
+    """Банковские счета организаций по Ref_Key из bank_account_references."""
+
+    def __init__(self, db: Session, client: OData1CClient):
+        self.db = db
+        self.client = client
+        self._accounts: Optional[Dict[str, BankAccountInfo]] = None
+
+    def _is_stale(self) -> bool:
+        # Время последней полной загрузки (у счетов, запрошенных по ключу, его нет)
+        refreshed_at = self.db.query(func.max(BankAccountReference.refreshed_at)).scalar()
+        if refreshed_at is None:
+            return True
+        return datetime.utcnow() - refreshed_at > timedelta(hours=settings.BANK_REFERENCE_REFRESH_HOURS)
+
+    def _load(self) -> Dict[str, BankAccountInfo]:
+        if self._accounts is None:
+            try:
+                if self._is_stale():
+                    refresh_bank_accounts(self.db, self.client)
+            except Exception as e:
+                # Остаются сохраненные записи и запросы по ключу
+                logger.warning(f"Failed to refresh organization bank accounts from 1C: {e}")
+
+            self._accounts = {
+                reference.ref_key: (reference.account_number, reference.bank_name, reference.bank_bik)
+                for reference in self.db.query(BankAccountReference)
+            }
+        return self._accounts
+
+    def preload(self) -> int:
+        """
+        Прочитать справочник (и перезагрузить из 1С, если устарел) заранее.
+
+        Returns:
+            Количество счетов в справочнике
+        """
+        return len(self._load())
+
+    def get(self, ref_key: str) -> Optional[BankAccountInfo]:
+        """Счет по Ref_Key или None, если его нет в справочнике."""
+        return self._load().get(ref_key)
+
+    def add(self, ref_key: str, account_data: Dict[str, Any], info: BankAccountInfo) -> None:
+        """Сохранить счет, запрошенный по ключу (info - с учетом отдельно запрошенного банка)."""
+        row = _reference_row(ref_key, account_data, None)
+        row['account_number'], row['bank_name'], row['bank_bik'] = info
+        try:
+            _store(self.db, [row])
+        except Exception as e:
+            logger.warning(f"Failed to store bank account {ref_key}: {e}")
+        self._load()[ref_key] = info
+
+    def accounts_by_number(self) -> Dict[str, Tuple[str, str]]:
+        """{номер счета: (банк, БИК)} для счетов с известным банком."""
+        return {
+            account_number: (bank_name, bank_bik)
+            for account_number, bank_name, bank_bik in self._load().values()
+            if account_number and bank_name and bank_bik
+        }
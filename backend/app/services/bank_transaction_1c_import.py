@@ -21,8 +21,10 @@ from app.db.models import (
     Contractor,
     BusinessOperationMapping
 )
+from app.services.bank_reference_cache import BankAccountCache
+from app.services.bank_transaction_upsert import upsert_bank_transactions
 from app.services.odata_1c_client import OData1CClient
-from app.services.transaction_classifier import TransactionClassifier
+from app.services.transaction_classifier import TransactionClassifier, apply_classification_results
 
 logger = logging.getLogger(__name__)
 
@@ -88,8 +90,12 @@ class BankTransaction1CImporter:
         # Кэши для оптимизации производительности
         self._organization_cache: Dict[str, Optional[Organization]] = {}
         self._bank_account_cache: Dict[str, tuple[Optional[str], Optional[str], Optional[str]]] = {}
+        # Справочник счетов организаций, общий для всех импортов (bank_account_references)
+        self._bank_accounts = BankAccountCache(db, odata_client)
         self._counterparty_cache: Dict[str, Dict[str, Any]] = {}
         self._business_operation_mapping_cache: set = set()
+        # Новые транзакции, ожидающие пакетной классификации
+        self._pending_classification: List[BankTransaction] = []
 
         # Предзагрузка существующих маппингов бизнес-операций
         self._preload_business_operation_mappings()
@@ -103,6 +109,16 @@ class BankTransaction1CImporter:
         except Exception as e:
             logger.warning(f"Failed to preload business operation mappings: {e}")
 
+    def preload_reference_data(self) -> None:
+        """
+        Загрузить справочник счетов организаций до разбора документов.
+
+        Иначе холодная загрузка (несколько страниц из 1С) случится при разборе
+        первого документа - внутри его таймаута.
+        """
+        accounts = self._bank_accounts.preload()
+        logger.debug(f"Preloaded {accounts} organization bank accounts")
+
     def import_transactions(
         self,
         date_from: date,
@@ -126,6 +142,7 @@ class BankTransaction1CImporter:
             f"Starting 1C import: date_from={date_from}, date_to={date_to}, "
             f"auto_classify={self.auto_classify}"
         )
+        self.preload_reference_data()
 
         try:
             # Импорт поступлений безналичных (CREDIT, BANK)
@@ -209,14 +226,17 @@ class BankTransaction1CImporter:
 
                 result.total_fetched += len(receipts)
 
+                rows = []
                 for receipt in receipts:
                     try:
-                        self._process_receipt(receipt, result)
+                        rows.append(self._process_receipt(receipt, result))
                     except Exception as e:
                         error_msg = f"Failed to process receipt {receipt.get('Ref_Key')}: {str(e)}"
                         logger.error(error_msg)
                         result.errors.append(error_msg)
 
+                self._write_rows(rows, result)
+                result.auto_categorized += self._apply_pending_classifications()
                 self.db.commit()
 
                 if len(receipts) < batch_size:
@@ -255,14 +275,17 @@ class BankTransaction1CImporter:
 
                 result.total_fetched += len(payments)
 
+                rows = []
                 for payment in payments:
                     try:
-                        self._process_payment(payment, result)
+                        rows.append(self._process_payment(payment, result))
                     except Exception as e:
                         error_msg = f"Failed to process payment {payment.get('Ref_Key')}: {str(e)}"
                         logger.error(error_msg)
                         result.errors.append(error_msg)
 
+                self._write_rows(rows, result)
+                result.auto_categorized += self._apply_pending_classifications()
                 self.db.commit()
 
                 if len(payments) < batch_size:
@@ -301,14 +324,17 @@ class BankTransaction1CImporter:
 
                 result.total_fetched += len(cash_receipts)
 
+                rows = []
                 for cash_receipt in cash_receipts:
                     try:
-                        self._process_cash_receipt(cash_receipt, result)
+                        rows.append(self._process_cash_receipt(cash_receipt, result))
                     except Exception as e:
                         error_msg = f"Failed to process cash receipt {cash_receipt.get('Ref_Key')}: {str(e)}"
                         logger.error(error_msg)
                         result.errors.append(error_msg)
 
+                self._write_rows(rows, result)
+                result.auto_categorized += self._apply_pending_classifications()
                 self.db.commit()
 
                 if len(cash_receipts) < batch_size:
@@ -347,14 +373,17 @@ class BankTransaction1CImporter:
 
                 result.total_fetched += len(cash_payments)
 
+                rows = []
                 for cash_payment in cash_payments:
                     try:
-                        self._process_cash_payment(cash_payment, result)
+                        rows.append(self._process_cash_payment(cash_payment, result))
                     except Exception as e:
                         error_msg = f"Failed to process cash payment {cash_payment.get('Ref_Key')}: {str(e)}"
                         logger.error(error_msg)
                         result.errors.append(error_msg)
 
+                self._write_rows(rows, result)
+                result.auto_categorized += self._apply_pending_classifications()
                 self.db.commit()
 
                 if len(cash_payments) < batch_size:
@@ -373,17 +402,13 @@ class BankTransaction1CImporter:
         self,
         receipt_data: Dict[str, Any],
         result: BankTransaction1CImportResult
-    ):
-        """Обработать одно поступление"""
+    ) -> Dict[str, Any]:
+        """Обработать одно поступление - строка для _write_rows()"""
         external_id = receipt_data.get('Ref_Key')
 
         if not external_id:
             raise ValueError("Missing Ref_Key in receipt data")
 
-        existing = self.db.query(BankTransaction).filter(
-            BankTransaction.external_id_1c == external_id
-        ).first()
-
         transaction_data = self._parse_receipt_data(receipt_data)
 
         if transaction_data.get('business_operation'):
@@ -392,46 +417,22 @@ class BankTransaction1CImporter:
                 result
             )
 
-        if existing:
-            # Обновляем ТОЛЬКО данные из 1С, сохраняя пользовательские поля
-            self._update_transaction_from_1c(existing, transaction_data)
-            result.total_updated += 1
-            logger.debug(f"Updated receipt {external_id}")
-
-        else:
-            transaction_data['external_id_1c'] = external_id
-            transaction_data['transaction_type'] = BankTransactionTypeEnum.CREDIT
-            transaction_data['import_source'] = 'ODATA_1C'
-            transaction_data['imported_at'] = datetime.utcnow()
-
-            transaction = BankTransaction(**transaction_data)
-
-            if self.auto_classify and self.classifier:
-                self._apply_classification(transaction)
-                if transaction.category_id:
-                    result.auto_categorized += 1
-
-            self.db.add(transaction)
-            result.total_created += 1
-            logger.debug(f"Created receipt {external_id}")
-
         result.total_processed += 1
+        return self._new_transaction_row(
+            external_id, transaction_data, BankTransactionTypeEnum.CREDIT
+        )
 
     def _process_payment(
         self,
         payment_data: Dict[str, Any],
         result: BankTransaction1CImportResult
-    ):
-        """Обработать одно списание"""
+    ) -> Dict[str, Any]:
+        """Обработать одно списание - строка для _write_rows()"""
         external_id = payment_data.get('Ref_Key')
 
         if not external_id:
             raise ValueError("Missing Ref_Key in payment data")
 
-        existing = self.db.query(BankTransaction).filter(
-            BankTransaction.external_id_1c == external_id
-        ).first()
-
         transaction_data = self._parse_payment_data(payment_data)
 
         if transaction_data.get('business_operation'):
@@ -440,46 +441,22 @@ class BankTransaction1CImporter:
                 result
             )
 
-        if existing:
-            # Обновляем ТОЛЬКО данные из 1С, сохраняя пользовательские поля
-            self._update_transaction_from_1c(existing, transaction_data)
-            result.total_updated += 1
-            logger.debug(f"Updated payment {external_id}")
-
-        else:
-            transaction_data['external_id_1c'] = external_id
-            transaction_data['transaction_type'] = BankTransactionTypeEnum.DEBIT
-            transaction_data['import_source'] = 'ODATA_1C'
-            transaction_data['imported_at'] = datetime.utcnow()
-
-            transaction = BankTransaction(**transaction_data)
-
-            if self.auto_classify and self.classifier:
-                self._apply_classification(transaction)
-                if transaction.category_id:
-                    result.auto_categorized += 1
-
-            self.db.add(transaction)
-            result.total_created += 1
-            logger.debug(f"Created payment {external_id}")
-
         result.total_processed += 1
+        return self._new_transaction_row(
+            external_id, transaction_data, BankTransactionTypeEnum.DEBIT
+        )
 
     def _process_cash_receipt(
         self,
         receipt_data: Dict[str, Any],
         result: BankTransaction1CImportResult
-    ):
-        """Обработать один приходный кассовый ордер (ПКО)"""
+    ) -> Dict[str, Any]:
+        """Обработать один приходный кассовый ордер (ПКО) - строка для _write_rows()"""
         external_id = receipt_data.get('Ref_Key')
 
         if not external_id:
             raise ValueError("Missing Ref_Key in cash receipt data")
 
-        existing = self.db.query(BankTransaction).filter(
-            BankTransaction.external_id_1c == external_id
-        ).first()
-
         transaction_data = self._parse_cash_receipt_data(receipt_data)
 
         if transaction_data.get('business_operation'):
@@ -488,46 +465,22 @@ class BankTransaction1CImporter:
                 result
             )
 
-        if existing:
-            # Обновляем ТОЛЬКО данные из 1С, сохраняя пользовательские поля
-            self._update_transaction_from_1c(existing, transaction_data)
-            result.total_updated += 1
-            logger.debug(f"Updated cash receipt (PKO) {external_id}")
-
-        else:
-            transaction_data['external_id_1c'] = external_id
-            transaction_data['transaction_type'] = BankTransactionTypeEnum.CREDIT
-            transaction_data['import_source'] = 'ODATA_1C'
-            transaction_data['imported_at'] = datetime.utcnow()
-
-            transaction = BankTransaction(**transaction_data)
-
-            if self.auto_classify and self.classifier:
-                self._apply_classification(transaction)
-                if transaction.category_id:
-                    result.auto_categorized += 1
-
-            self.db.add(transaction)
-            result.total_created += 1
-            logger.debug(f"Created cash receipt (PKO) {external_id}")
-
         result.total_processed += 1
+        return self._new_transaction_row(
+            external_id, transaction_data, BankTransactionTypeEnum.CREDIT
+        )
 
     def _process_cash_payment(
         self,
         payment_data: Dict[str, Any],
         result: BankTransaction1CImportResult
-    ):
-        """Обработать один расходный кассовый ордер (РКО)"""
+    ) -> Dict[str, Any]:
+        """Обработать один расходный кассовый ордер (РКО) - строка для _write_rows()"""
         external_id = payment_data.get('Ref_Key')
 
         if not external_id:
             raise ValueError("Missing Ref_Key in cash payment data")
 
-        existing = self.db.query(BankTransaction).filter(
-            BankTransaction.external_id_1c == external_id
-        ).first()
-
         transaction_data = self._parse_cash_payment_data(payment_data)
 
         if transaction_data.get('business_operation'):
@@ -536,60 +489,51 @@ class BankTransaction1CImporter:
                 result
             )
 
-        if existing:
-            # Обновляем ТОЛЬКО данные из 1С, сохраняя пользовательские поля
-            self._update_transaction_from_1c(existing, transaction_data)
-            result.total_updated += 1
-            logger.debug(f"Updated cash payment (RKO) {external_id}")
-
-        else:
-            transaction_data['external_id_1c'] = external_id
-            transaction_data['transaction_type'] = BankTransactionTypeEnum.DEBIT
-            transaction_data['import_source'] = 'ODATA_1C'
-            transaction_data['imported_at'] = datetime.utcnow()
-
-            transaction = BankTransaction(**transaction_data)
-
-            if self.auto_classify and self.classifier:
-                self._apply_classification(transaction)
-                if transaction.category_id:
-                    result.auto_categorized += 1
-
-            self.db.add(transaction)
-            result.total_created += 1
-            logger.debug(f"Created cash payment (RKO) {external_id}")
-
         result.total_processed += 1
+        return self._new_transaction_row(
+            external_id, transaction_data, BankTransactionTypeEnum.DEBIT
+        )
 
-    def _update_transaction_from_1c(
+    def _new_transaction_row(
+        self,
+        external_id: str,
+        transaction_data: Dict[str, Any],
+        transaction_type: BankTransactionTypeEnum
+    ) -> Dict[str, Any]:
+        """Колонки транзакции для upsert_bank_transactions (поля новой записи тоже)."""
+        row = dict(transaction_data)
+        row['external_id_1c'] = external_id
+        row['transaction_type'] = transaction_type
+        row.setdefault('payment_source', PaymentSourceEnum.BANK)
+        row['import_source'] = 'ODATA_1C'
+        row['imported_at'] = datetime.utcnow()
+        row['is_active'] = True
+        return row
+
+    def _write_rows(
         self,
-        existing: BankTransaction,
-        transaction_data: Dict[str, Any]
+        rows: List[Dict[str, Any]],
+        result: BankTransaction1CImportResult
     ) -> None:
         """
-        Обновляет существующую транзакцию данными из 1С,
-        НЕ затирая пользовательские поля (категория, статус, confidence и т.д.)
+        Записать страницу одним upsert (существующие обновляются без затирания
+        пользовательских полей) и поставить новые транзакции в очередь классификации.
         """
-        # Поля, которые НЕЛЬЗЯ перезаписывать - это пользовательские данные
-        protected_fields = {
-            'status',                    # Статус обработки (NEW, CATEGORIZED, APPROVED и т.д.)
-            'category_id',               # Назначенная категория
-            'suggested_category_id',     # Предложенная категория
-            'category_confidence',       # Уверенность классификации
-            'approved_by',               # Кто подтвердил
-            'approved_at',               # Когда подтверждено
-            'expense_id',                # Связь с заявкой на расход
-            'notes',                     # Пользовательские заметки (если уже есть)
-        }
-
-        # Поля из 1С, которые можно обновлять
-        for key, value in transaction_data.items():
-            if key in protected_fields:
-                # Для notes - обновляем только если в существующей записи пусто
-                if key == 'notes' and not getattr(existing, key, None):
-                    setattr(existing, key, value)
-                continue
-            setattr(existing, key, value)
+        created_ids, updated_ids, unchanged = upsert_bank_transactions(self.db, rows)
+        result.total_created += len(created_ids)
+        result.total_updated += len(updated_ids)
+        result.total_skipped += unchanged
+        self._queue_created(created_ids)
+
+    def _queue_created(self, transaction_ids: List[int]) -> None:
+        """Поставить созданные транзакции в очередь пакетной классификации."""
+        if not transaction_ids or not (self.auto_classify and self.classifier):
+            return
+        # Классификация - пачкой перед commit (см. _apply_pending_classifications)
+        for transaction in self.db.query(BankTransaction).filter(
+            BankTransaction.id.in_(transaction_ids)
+        ):
+            self._queue_classification(transaction)
 
     def _parse_receipt_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Парсинг данных поступления из 1С в формат BankTransaction"""
@@ -1003,6 +947,12 @@ class BankTransaction1CImporter:
         if account_key in self._bank_account_cache:
             return self._bank_account_cache[account_key]
 
+        # Справочник, загруженный из 1С целиком
+        reference = self._bank_accounts.get(account_key)
+        if reference is not None:
+            self._bank_account_cache[account_key] = reference
+            return reference
+
         try:
             account_data = self.odata_client.get_bank_account_by_key(account_key)
 
@@ -1065,8 +1015,9 @@ class BankTransaction1CImporter:
                         str(bank_name)[:500] if bank_name else None,
                         str(bank_bik)[:20] if bank_bik else None
                     )
-                    # Кэшируем результат
+                    # Кэшируем результат (и сохраняем в справочник для следующих импортов)
                     self._bank_account_cache[account_key] = result
+                    self._bank_accounts.add(account_key, account_data, result)
                     return result
                 else:
                     logger.warning(f"Account number not found in account_data for key: {account_key}")
@@ -1156,48 +1107,35 @@ class BankTransaction1CImporter:
             return match.group(1)
         return None
 
-    def _apply_classification(self, transaction: BankTransaction):
+    def _queue_classification(self, transaction: BankTransaction):
+        """Поставить новую транзакцию в очередь пакетной классификации."""
+        if not transaction.payment_purpose and not transaction.business_operation:
+            return
+        self._pending_classification.append(transaction)
+
+    def _apply_pending_classifications(self) -> int:
         """
-        Применить классификацию к транзакции.
+        Классифицировать накопленные транзакции одним вызовом classify_many().
 
         Логика:
         - Правила категоризации (is_rule_based=True) → автоматически применяются
         - AI эвристика (is_rule_based=False) → только предлагается для проверки
+
+        Returns:
+            Количество транзакций, категоризированных правилом
         """
-        if not transaction.payment_purpose and not transaction.business_operation:
-            return
+        pending, self._pending_classification = self._pending_classification, []
+        if not pending or not self.classifier:
+            return 0
 
         try:
-            category_id, confidence, reasoning, is_rule_based = self.classifier.classify(
-                payment_purpose=transaction.payment_purpose,
-                counterparty_name=transaction.counterparty_name,
-                counterparty_inn=transaction.counterparty_inn,
-                amount=transaction.amount,
-                transaction_type=transaction.transaction_type,
-                business_operation=transaction.business_operation
-            )
-
-            if category_id:
-                if is_rule_based:
-                    # ПРАВИЛО: автоматически применяем категорию
-                    # (BusinessOperationMapping, CategorizationRule by INN/name/keyword)
-                    transaction.category_id = category_id
-                    transaction.category_confidence = Decimal(str(confidence))
-                    transaction.status = BankTransactionStatusEnum.CATEGORIZED
-                    logger.debug(f"Auto-categorized by RULE: {reasoning}")
-                else:
-                    # AI ЭВРИСТИКА: только предлагаем для проверки
-                    # (historical matching, bank commission detection)
-                    transaction.suggested_category_id = category_id
-                    transaction.category_confidence = Decimal(str(confidence))
-                    transaction.status = BankTransactionStatusEnum.NEEDS_REVIEW
-                    logger.debug(f"AI suggestion (requires review): {reasoning}")
-            else:
-                # Категория не найдена - оставляем как NEW
-                logger.debug(f"No categorization: {reasoning}")
-
+            results = self.classifier.classify_many(pending)
+            categorized = apply_classification_results(self.db, pending, results)
+            logger.debug(f"Classified batch of {len(pending)}: {categorized} auto-categorized by RULE")
+            return categorized
         except Exception as e:
-            logger.warning(f"Classification failed for transaction: {e}")
+            logger.warning(f"Classification failed for batch of {len(pending)} transactions: {e}")
+            return 0
 
     def _ensure_business_operation_mapping_exists(
         self,
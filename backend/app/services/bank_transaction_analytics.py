@@ -0,0 +1,721 @@
+"""
+Аналитика по банковским транзакциям на стороне БД.
+
+Все показатели /bank-transactions/analytics считаются сгруппированными
+SQL-агрегатами (COUNT/SUM/AVG ... FILTER, GROUP BY), в Python попадают только
+небольшие итоговые наборы строк. Временные ряды и разбивка по статусам читаются
+из дневных агрегатов (bank_transaction_daily_rollups), если они включены. ORM-объекты загружаются лишь для выборок
+с ограничением (low_confidence_items, confidence_scatter).
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Date, Integer, and_, cast, extract, func
+from sqlalchemy.orm import Query, Session, joinedload
+
+from app.core.config import settings
+from app.db.models import (
+    BankTransaction, BankTransactionDailyRollup, BudgetCategory,
+    BankTransactionTypeEnum, BankTransactionStatusEnum
+)
+from app.schemas.bank_transaction import (
+    BankTransactionAnalytics, BankTransactionKPIs, MonthlyFlowData, DailyFlowData,
+    CategoryBreakdown, CounterpartyBreakdown, ProcessingFunnelData, ProcessingFunnelStage,
+    AIPerformanceData, ConfidenceBracket, LowConfidenceItem, ActivityHeatmapPoint,
+    StatusTimelinePoint, ConfidenceScatterPoint, RegionalData, SourceDistribution,
+    RegularPaymentSummary, ExhibitionData
+)
+from app.services.daily_rollup import rollup_query
+
+MONTH_NAMES_RU = [
+    '', 'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+    'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь'
+]
+
+CONFIDENCE_BRACKETS = [
+    ('High (≥90%)', 0.9, 1.0),
+    ('Medium (70-90%)', 0.7, 0.9),
+    ('Low (50-70%)', 0.5, 0.7),
+    ('Very Low (<50%)', 0.0, 0.5),
+]
+
+TOP_CATEGORIES_LIMIT = 10
+TOP_COUNTERPARTIES_LIMIT = 20
+REGULAR_PAYMENTS_LIMIT = 20
+LOW_CONFIDENCE_ITEMS_LIMIT = 50
+CONFIDENCE_SCATTER_LIMIT = 500
+
+# Выражения, переиспользуемые в агрегатах
+_amount = BankTransaction.amount
+_is_debit = BankTransaction.transaction_type == BankTransactionTypeEnum.DEBIT
+_is_credit = BankTransaction.transaction_type != BankTransactionTypeEnum.DEBIT
+# Уверенность учитывается, только если она задана и не равна 0
+_has_confidence = and_(
+    BankTransaction.category_confidence.isnot(None),
+    BankTransaction.category_confidence != 0
+)
+_is_categorized = BankTransaction.category_id.isnot(None)
+_day = func.date(BankTransaction.transaction_date, type_=Date)
+
+
+def _sum(condition=None):
+    """COALESCE(SUM(amount) [FILTER (WHERE condition)], 0)."""
+    total = func.sum(_amount)
+    if condition is not None:
+        total = total.filter(condition)
+    return func.coalesce(total, 0)
+
+
+def _count(condition=None):
+    """COUNT(id) [FILTER (WHERE condition)]."""
+    counter = func.count(BankTransaction.id)
+    if condition is not None:
+        counter = counter.filter(condition)
+    return counter
+
+
+def _percent(part, whole) -> float:
+    return float(part / whole * 100) if whole else 0
+
+
+def _avg_amount(total: Decimal, count: int) -> Decimal:
+    return total / count if count > 0 else Decimal(0)
+
+
+def _as_float(value) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+class _AggregateSource:
+    """
+    Единый набор агрегатных выражений над bank_transactions или над
+    дневными агрегатами bank_transaction_daily_rollups.
+    """
+
+    def __init__(self, query: Query, rollup: bool = False):
+        self.query = query
+        self.rollup = rollup
+        self.model = BankTransactionDailyRollup if rollup else BankTransaction
+        self.day = BankTransactionDailyRollup.day if rollup else _day
+        moment = BankTransactionDailyRollup.day if rollup else BankTransaction.transaction_date
+        self.year = cast(extract('year', moment), Integer)
+        self.month = cast(extract('month', moment), Integer)
+
+    def count(self, condition=None):
+        if not self.rollup:
+            return _count(condition)
+        total = func.sum(BankTransactionDailyRollup.transaction_count)
+        if condition is not None:
+            total = total.filter(condition)
+        return func.coalesce(total, 0)
+
+    def amount(self, condition=None):
+        if not self.rollup:
+            return _sum(condition)
+        total = func.sum(BankTransactionDailyRollup.total_amount)
+        if condition is not None:
+            total = total.filter(condition)
+        return func.coalesce(total, 0)
+
+    def avg_confidence(self):
+        if not self.rollup:
+            return func.avg(BankTransaction.category_confidence).filter(_has_confidence)
+        return (
+            func.sum(BankTransactionDailyRollup.confidence_sum)
+            / func.nullif(func.sum(BankTransactionDailyRollup.confidence_count), 0)
+        )
+
+
+class BankTransactionAnalyticsService:
+    """Сборка BankTransactionAnalytics из SQL-агрегатов."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def build_query(
+        self,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        year: Optional[int] = None,
+        month: Optional[int] = None,
+        transaction_type: Optional[BankTransactionTypeEnum] = None,
+        category_id: Optional[int] = None,
+    ) -> Query:
+        """Базовый отфильтрованный запрос (фильтры те же, что у эндпоинта)."""
+        query = self.db.query(BankTransaction).filter(BankTransaction.is_active == True)
+
+        if year and month:
+            query = query.filter(
+                extract('year', BankTransaction.transaction_date) == year,
+                extract('month', BankTransaction.transaction_date) == month
+            )
+        elif year:
+            query = query.filter(extract('year', BankTransaction.transaction_date) == year)
+
+        if date_from:
+            query = query.filter(BankTransaction.transaction_date >= date_from)
+        if date_to:
+            # date_to включает весь день - как в дневных агрегатах (rollup_query)
+            query = query.filter(BankTransaction.transaction_date < date_to + timedelta(days=1))
+
+        if transaction_type:
+            query = query.filter(BankTransaction.transaction_type == transaction_type)
+        if category_id:
+            query = query.filter(BankTransaction.category_id == category_id)
+
+        return query
+
+    def get_analytics(
+        self,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        year: Optional[int] = None,
+        month: Optional[int] = None,
+        transaction_type: Optional[BankTransactionTypeEnum] = None,
+        category_id: Optional[int] = None,
+        compare_previous_period: bool = True,
+    ) -> BankTransactionAnalytics:
+        query = self.build_query(date_from, date_to, year, month, transaction_type, category_id)
+
+        # Фильтры эндпоинта покрываются дневными агрегатами - временные ряды
+        # и разбивку по статусам берем из них
+        if settings.DAILY_ROLLUP_ENABLED:
+            source = _AggregateSource(rollup_query(
+                self.db,
+                date_from=date_from,
+                date_to=date_to,
+                year=year,
+                month=month,
+                transaction_type=transaction_type,
+                category_id=category_id or None,
+            ), rollup=True)
+        else:
+            source = _AggregateSource(query)
+
+        totals = self._totals(query)
+        status_rows = self._status_breakdown(source)
+
+        kpis = self._kpis(totals, status_rows)
+        if compare_previous_period and date_from and date_to:
+            self._apply_previous_period(kpis, totals, date_from, date_to)
+
+        return BankTransactionAnalytics(
+            kpis=kpis,
+            monthly_flow=self._monthly_flow(source),
+            daily_flow=self._daily_flow(source),
+            top_categories=self._top_categories(query, totals['categorized_amount']),
+            category_type_distribution=[],
+            top_counterparties=self._top_counterparties(query),
+            regional_distribution=self._regional_distribution(query),
+            source_distribution=self._source_distribution(query, totals['count']),
+            processing_funnel=self._processing_funnel(status_rows, totals['count']),
+            ai_performance=self._ai_performance(query, totals),
+            low_confidence_items=self._low_confidence_items(query),
+            activity_heatmap=self._activity_heatmap(query),
+            status_timeline=self._status_timeline(source),
+            confidence_scatter=self._confidence_scatter(query),
+            regular_payments=self._regular_payments(query),
+            exhibitions=self._exhibitions(query),
+        )
+
+    # ====== KPIs ======
+
+    def _totals(self, query: Query) -> Dict[str, Any]:
+        """Итоговые показатели периода одним SELECT."""
+        row = query.with_entities(
+            _count().label('count'),
+            _sum(_is_debit).label('debit'),
+            _sum(_is_credit).label('credit'),
+            _count(_is_categorized).label('categorized'),
+            _sum(_is_categorized).label('categorized_amount'),
+            func.avg(BankTransaction.category_confidence).filter(
+                and_(_is_categorized, _has_confidence)).label('avg_confidence'),
+            _count(and_(_is_categorized, BankTransaction.category_confidence >= 0.9)).label('auto_categorized'),
+            _count(and_(_is_categorized, _has_confidence,
+                        BankTransaction.category_confidence < 0.7)).label('low_confidence'),
+            _count(BankTransaction.is_regular_payment == True).label('regular'),
+        ).one()
+
+        return {
+            'count': row.count or 0,
+            'debit': Decimal(row.debit or 0),
+            'credit': Decimal(row.credit or 0),
+            'categorized': row.categorized or 0,
+            'categorized_amount': Decimal(row.categorized_amount or 0),
+            'avg_confidence': _as_float(row.avg_confidence),
+            'auto_categorized': row.auto_categorized or 0,
+            'low_confidence': row.low_confidence or 0,
+            'regular': row.regular or 0,
+        }
+
+    def _status_breakdown(self, source: _AggregateSource) -> Dict[BankTransactionStatusEnum, Dict[str, Any]]:
+        status_col = source.model.status
+        rows = source.query.with_entities(
+            status_col.label('status'), source.count().label('count'), source.amount().label('amount')
+        ).group_by(status_col).all()
+
+        result = {
+            status_enum: {'count': 0, 'amount': Decimal(0)}
+            for status_enum in BankTransactionStatusEnum
+        }
+        for row in rows:
+            if row.status in result:
+                result[row.status] = {'count': int(row.count), 'amount': Decimal(row.amount or 0)}
+        return result
+
+    def _kpis(self, totals: Dict[str, Any], status_rows: Dict) -> BankTransactionKPIs:
+        total_count = totals['count']
+        counts = {status_enum: data['count'] for status_enum, data in status_rows.items()}
+
+        # needs_review = NEW + NEEDS_REVIEW (та же логика, что в /stats)
+        needs_review_count = (
+            counts[BankTransactionStatusEnum.NEW] + counts[BankTransactionStatusEnum.NEEDS_REVIEW]
+        )
+
+        return BankTransactionKPIs(
+            total_debit_amount=totals['debit'],
+            total_credit_amount=totals['credit'],
+            net_flow=totals['credit'] - totals['debit'],
+            total_transactions=total_count,
+            new_count=counts[BankTransactionStatusEnum.NEW],
+            categorized_count=counts[BankTransactionStatusEnum.CATEGORIZED],
+            approved_count=counts[BankTransactionStatusEnum.APPROVED],
+            needs_review_count=needs_review_count,
+            ignored_count=counts[BankTransactionStatusEnum.IGNORED],
+            new_percent=_percent(counts[BankTransactionStatusEnum.NEW], total_count),
+            categorized_percent=_percent(counts[BankTransactionStatusEnum.CATEGORIZED], total_count),
+            approved_percent=_percent(counts[BankTransactionStatusEnum.APPROVED], total_count),
+            needs_review_percent=_percent(needs_review_count, total_count),
+            ignored_percent=_percent(counts[BankTransactionStatusEnum.IGNORED], total_count),
+            avg_category_confidence=totals['avg_confidence'],
+            auto_categorized_count=totals['auto_categorized'],
+            auto_categorized_percent=_percent(totals['auto_categorized'], total_count),
+            regular_payments_count=totals['regular'],
+            regular_payments_percent=_percent(totals['regular'], total_count),
+        )
+
+    def _apply_previous_period(
+        self,
+        kpis: BankTransactionKPIs,
+        totals: Dict[str, Any],
+        date_from: date,
+        date_to: date,
+    ) -> None:
+        """Сравнение с предыдущим периодом той же длины (один агрегатный SELECT)."""
+        period_days = (date_to - date_from).days + 1
+        prev_date_from = date_from - timedelta(days=period_days)
+        prev_date_to = date_from - timedelta(days=1)
+
+        prev = self.db.query(BankTransaction).filter(
+            BankTransaction.is_active == True,
+            BankTransaction.transaction_date >= prev_date_from,
+            BankTransaction.transaction_date < prev_date_to + timedelta(days=1)
+        ).with_entities(
+            _count().label('count'),
+            _sum(_is_debit).label('debit'),
+            _sum(BankTransaction.transaction_type == BankTransactionTypeEnum.CREDIT).label('credit'),
+        ).one()
+
+        prev_debit = Decimal(prev.debit or 0)
+        prev_credit = Decimal(prev.credit or 0)
+        prev_net_flow = prev_credit - prev_debit
+        net_flow = totals['credit'] - totals['debit']
+
+        if prev_debit > 0:
+            kpis.debit_change_percent = float((totals['debit'] - prev_debit) / prev_debit * 100)
+        if prev_credit > 0:
+            kpis.credit_change_percent = float((totals['credit'] - prev_credit) / prev_credit * 100)
+        if prev_net_flow != 0:
+            kpis.net_flow_change_percent = float((net_flow - prev_net_flow) / abs(prev_net_flow) * 100)
+        kpis.transactions_change = totals['count'] - (prev.count or 0)
+
+    # ====== Time series ======
+
+    def _monthly_flow(self, source: _AggregateSource) -> List[MonthlyFlowData]:
+        year_col = source.year.label('year')
+        month_col = source.month.label('month')
+        is_debit = source.model.transaction_type == BankTransactionTypeEnum.DEBIT
+        is_credit = source.model.transaction_type != BankTransactionTypeEnum.DEBIT
+
+        rows = source.query.with_entities(
+            year_col,
+            month_col,
+            source.amount(is_debit).label('debit'),
+            source.amount(is_credit).label('credit'),
+            source.count().label('count'),
+            source.avg_confidence().label('avg_confidence'),
+        ).group_by(year_col, month_col).order_by(year_col, month_col).all()
+
+        monthly_flow = []
+        for row in rows:
+            debit = Decimal(row.debit or 0)
+            credit = Decimal(row.credit or 0)
+            monthly_flow.append(MonthlyFlowData(
+                year=row.year,
+                month=row.month,
+                month_name=f"{MONTH_NAMES_RU[row.month]} {row.year}",
+                debit_amount=debit,
+                credit_amount=credit,
+                net_flow=credit - debit,
+                transaction_count=int(row.count),
+                avg_confidence=_as_float(row.avg_confidence)
+            ))
+        return monthly_flow
+
+    def _daily_flow(self, source: _AggregateSource) -> List[DailyFlowData]:
+        day_col = source.day.label('day')
+        is_debit = source.model.transaction_type == BankTransactionTypeEnum.DEBIT
+        is_credit = source.model.transaction_type != BankTransactionTypeEnum.DEBIT
+
+        rows = source.query.with_entities(
+            day_col,
+            source.amount(is_debit).label('debit'),
+            source.amount(is_credit).label('credit'),
+            source.count().label('count'),
+        ).group_by(day_col).order_by(day_col).all()
+
+        daily_flow = []
+        for row in rows:
+            debit = Decimal(row.debit or 0)
+            credit = Decimal(row.credit or 0)
+            daily_flow.append(DailyFlowData(
+                date=row.day,
+                debit_amount=debit,
+                credit_amount=credit,
+                net_flow=credit - debit,
+                transaction_count=int(row.count),
+            ))
+        return daily_flow
+
+    def _status_timeline(self, source: _AggregateSource) -> List[StatusTimelinePoint]:
+        day_col = source.day.label('day')
+        status_col = source.model.status
+
+        rows = source.query.with_entities(
+            day_col,
+            source.count(status_col == BankTransactionStatusEnum.NEW).label('new'),
+            source.count(status_col == BankTransactionStatusEnum.CATEGORIZED).label('categorized'),
+            source.count(status_col == BankTransactionStatusEnum.MATCHED).label('matched'),
+            source.count(status_col == BankTransactionStatusEnum.APPROVED).label('approved'),
+            source.count(status_col == BankTransactionStatusEnum.NEEDS_REVIEW).label('needs_review'),
+            source.count(status_col == BankTransactionStatusEnum.IGNORED).label('ignored'),
+        ).group_by(day_col).order_by(day_col).all()
+
+        return [
+            StatusTimelinePoint(
+                date=row.day,
+                new_count=int(row.new),
+                categorized_count=int(row.categorized),
+                matched_count=int(row.matched),
+                approved_count=int(row.approved),
+                needs_review_count=int(row.needs_review),
+                ignored_count=int(row.ignored)
+            )
+            for row in rows
+        ]
+
+    def _activity_heatmap(self, query: Query) -> List[ActivityHeatmapPoint]:
+        # Используем document_date (дата из 1С), если доступна, иначе transaction_date
+        moment = func.coalesce(BankTransaction.document_date, BankTransaction.transaction_date)
+        # extract('dow'): 0=Sunday -> приводим к weekday(): 0=Monday, 6=Sunday
+        day_col = ((cast(extract('dow', moment), Integer) + 6) % 7).label('day_of_week')
+        hour_col = cast(extract('hour', moment), Integer).label('hour')
+
+        rows = query.with_entities(
+            day_col, hour_col, _count().label('count'), _sum().label('total')
+        ).group_by(day_col, hour_col).order_by(day_col, hour_col).all()
+
+        activity_heatmap = []
+        for row in rows:
+            total = Decimal(row.total or 0)
+            activity_heatmap.append(ActivityHeatmapPoint(
+                day_of_week=row.day_of_week,
+                hour=row.hour,
+                transaction_count=row.count,
+                total_amount=total,
+                avg_amount=_avg_amount(total, row.count)
+            ))
+        return activity_heatmap
+
+    # ====== Breakdowns ======
+
+    def _top_categories(self, query: Query, total_categorized_amount: Decimal) -> List[CategoryBreakdown]:
+        total_col = _sum().label('total')
+        rows = query.filter(_is_categorized).outerjoin(
+            BudgetCategory, BudgetCategory.id == BankTransaction.category_id
+        ).with_entities(
+            BankTransaction.category_id,
+            BudgetCategory.name,
+            BudgetCategory.type,
+            _count().label('count'),
+            total_col,
+            func.avg(BankTransaction.category_confidence).filter(_has_confidence).label('avg_confidence'),
+        ).group_by(
+            BankTransaction.category_id, BudgetCategory.name, BudgetCategory.type
+        ).order_by(total_col.desc()).limit(TOP_CATEGORIES_LIMIT).all()
+
+        top_categories = []
+        for row in rows:
+            total = Decimal(row.total or 0)
+            top_categories.append(CategoryBreakdown(
+                category_id=row.category_id,
+                category_name=row.name or '',
+                category_type=row.type.value if row.type else None,
+                transaction_count=row.count,
+                total_amount=total,
+                avg_amount=_avg_amount(total, row.count),
+                avg_confidence=_as_float(row.avg_confidence),
+                percent_of_total=_percent(total, total_categorized_amount)
+            ))
+        return top_categories
+
+    def _top_counterparties(self, query: Query) -> List[CounterpartyBreakdown]:
+        total_col = _sum().label('total')
+        rows = query.filter(
+            BankTransaction.counterparty_inn.isnot(None),
+            BankTransaction.counterparty_inn != ''
+        ).with_entities(
+            BankTransaction.counterparty_inn,
+            func.max(BankTransaction.counterparty_name).label('name'),
+            _count().label('count'),
+            total_col,
+            func.min(BankTransaction.transaction_date).label('first_date'),
+            func.max(BankTransaction.transaction_date).label('last_date'),
+            _count(BankTransaction.is_regular_payment == True).label('regular_count'),
+        ).group_by(
+            BankTransaction.counterparty_inn
+        ).order_by(total_col.desc()).limit(TOP_COUNTERPARTIES_LIMIT).all()
+
+        top_counterparties = []
+        for row in rows:
+            total = Decimal(row.total or 0)
+            top_counterparties.append(CounterpartyBreakdown(
+                counterparty_inn=row.counterparty_inn,
+                counterparty_name=row.name or 'Unknown',
+                transaction_count=row.count,
+                total_amount=total,
+                avg_amount=_avg_amount(total, row.count),
+                first_transaction_date=row.first_date or datetime.now(),
+                last_transaction_date=row.last_date or datetime.now(),
+                is_regular=row.regular_count > 0
+            ))
+        return top_counterparties
+
+    def _regional_distribution(self, query: Query) -> List[RegionalData]:
+        total_col = _sum().label('total')
+        rows = query.filter(BankTransaction.region.isnot(None)).with_entities(
+            BankTransaction.region, _count().label('count'), total_col
+        ).group_by(BankTransaction.region).order_by(total_col.desc()).all()
+
+        total_with_region = sum(row.count for row in rows)
+
+        regional_distribution = []
+        for row in rows:
+            total = Decimal(row.total or 0)
+            regional_distribution.append(RegionalData(
+                region=row.region.value,
+                transaction_count=row.count,
+                total_amount=total,
+                avg_amount=_avg_amount(total, row.count),
+                percent_of_total=_percent(row.count, total_with_region)
+            ))
+        return regional_distribution
+
+    def _source_distribution(self, query: Query, total_count: int) -> List[SourceDistribution]:
+        rows = query.with_entities(
+            BankTransaction.payment_source, _count().label('count'), _sum().label('total')
+        ).group_by(BankTransaction.payment_source).all()
+
+        # NULL-источник считается банковским
+        source_dict: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            source_key = row.payment_source.value if row.payment_source else 'BANK'
+            data = source_dict.setdefault(source_key, {'count': 0, 'total': Decimal(0)})
+            data['count'] += row.count
+            data['total'] += Decimal(row.total or 0)
+
+        return [
+            SourceDistribution(
+                source=source_key,
+                transaction_count=data['count'],
+                total_amount=data['total'],
+                percent_of_total=_percent(data['count'], total_count)
+            )
+            for source_key, data in sorted(source_dict.items())
+        ]
+
+    def _regular_payments(self, query: Query) -> List[RegularPaymentSummary]:
+        group_key = func.coalesce(
+            BankTransaction.counterparty_inn, BankTransaction.counterparty_name, 'Unknown'
+        ).label('group_key')
+        count_col = _count().label('count')
+
+        rows = query.filter(BankTransaction.is_regular_payment == True).with_entities(
+            group_key,
+            func.max(BankTransaction.counterparty_name).label('name'),
+            func.max(BankTransaction.category_id).label('category_id'),
+            count_col,
+            _sum().label('total'),
+            func.min(BankTransaction.transaction_date).label('first_date'),
+            func.max(BankTransaction.transaction_date).label('last_date'),
+        ).group_by(group_key).order_by(count_col.desc()).limit(REGULAR_PAYMENTS_LIMIT).all()
+
+        category_ids = {row.category_id for row in rows if row.category_id}
+        category_names = {}
+        if category_ids:
+            category_names = dict(
+                self.db.query(BudgetCategory.id, BudgetCategory.name)
+                .filter(BudgetCategory.id.in_(category_ids)).all()
+            )
+
+        regular_payments = []
+        for row in rows:
+            if row.first_date and row.last_date and row.count > 1:
+                frequency_days = int((row.last_date - row.first_date).days / (row.count - 1))
+            else:
+                frequency_days = 30
+
+            cp_key = row.group_key
+            last_date = row.last_date.date() if row.last_date else date.today()
+            total = Decimal(row.total or 0)
+
+            regular_payments.append(RegularPaymentSummary(
+                counterparty_inn=cp_key if len(cp_key) in (10, 12) else None,
+                counterparty_name=row.name or 'Unknown',
+                category_id=row.category_id,
+                category_name=category_names.get(row.category_id),
+                avg_amount=_avg_amount(total, row.count),
+                frequency_days=frequency_days,
+                last_payment_date=last_date,
+                transaction_count=row.count,
+                is_monthly=25 <= frequency_days <= 35,
+                is_quarterly=85 <= frequency_days <= 95
+            ))
+        return regular_payments
+
+    def _exhibitions(self, query: Query) -> List[ExhibitionData]:
+        total_col = _sum().label('total')
+        rows = query.filter(
+            BankTransaction.exhibition.isnot(None),
+            BankTransaction.exhibition != ''
+        ).with_entities(
+            BankTransaction.exhibition,
+            _count().label('count'),
+            total_col,
+            func.min(BankTransaction.transaction_date).label('first_date'),
+            func.max(BankTransaction.transaction_date).label('last_date'),
+        ).group_by(BankTransaction.exhibition).order_by(total_col.desc()).all()
+
+        exhibitions = []
+        for row in rows:
+            total = Decimal(row.total or 0)
+            exhibitions.append(ExhibitionData(
+                exhibition=row.exhibition,
+                transaction_count=row.count,
+                total_amount=total,
+                avg_amount=_avg_amount(total, row.count),
+                first_transaction_date=row.first_date or datetime.now(),
+                last_transaction_date=row.last_date or datetime.now()
+            ))
+        return exhibitions
+
+    # ====== Processing & AI ======
+
+    def _processing_funnel(self, status_rows: Dict, total_count: int) -> ProcessingFunnelData:
+        funnel_stages = [
+            ProcessingFunnelStage(
+                status=status_enum.value,
+                count=data['count'],
+                amount=data['amount'],
+                percent_of_total=_percent(data['count'], total_count)
+            )
+            for status_enum, data in status_rows.items()
+        ]
+
+        approved_count = status_rows[BankTransactionStatusEnum.APPROVED]['count']
+        return ProcessingFunnelData(
+            stages=funnel_stages,
+            total_count=total_count,
+            conversion_rate_to_approved=_percent(approved_count, total_count)
+        )
+
+    def _ai_performance(self, query: Query, totals: Dict[str, Any]) -> AIPerformanceData:
+        categorized_count = totals['categorized']
+        confidence = BankTransaction.category_confidence
+
+        bracket_columns = []
+        for index, (_, min_conf, max_conf) in enumerate(CONFIDENCE_BRACKETS):
+            condition = and_(_is_categorized, _has_confidence, confidence >= min_conf, confidence < max_conf)
+            bracket_columns.append(_count(condition).label(f'count_{index}'))
+            bracket_columns.append(_sum(condition).label(f'amount_{index}'))
+
+        row = query.with_entities(*bracket_columns).one()
+
+        confidence_distribution = []
+        for index, (bracket_name, min_conf, max_conf) in enumerate(CONFIDENCE_BRACKETS):
+            count = getattr(row, f'count_{index}') or 0
+            confidence_distribution.append(ConfidenceBracket(
+                bracket=bracket_name,
+                min_confidence=min_conf,
+                max_confidence=max_conf,
+                count=count,
+                total_amount=Decimal(getattr(row, f'amount_{index}') or 0),
+                percent_of_total=_percent(count, categorized_count)
+            ))
+
+        return AIPerformanceData(
+            confidence_distribution=confidence_distribution,
+            avg_confidence=totals['avg_confidence'] or 0.0,
+            high_confidence_count=totals['auto_categorized'],
+            high_confidence_percent=_percent(totals['auto_categorized'], categorized_count),
+            low_confidence_count=totals['low_confidence'],
+            low_confidence_percent=_percent(totals['low_confidence'], categorized_count)
+        )
+
+    def _low_confidence_items(self, query: Query) -> List[LowConfidenceItem]:
+        transactions = query.filter(
+            _has_confidence, BankTransaction.category_confidence < 0.7
+        ).options(
+            joinedload(BankTransaction.suggested_category_rel)
+        ).order_by(BankTransaction.id).limit(LOW_CONFIDENCE_ITEMS_LIMIT).all()
+
+        return [
+            LowConfidenceItem(
+                transaction_id=t.id,
+                transaction_date=t.transaction_date,
+                counterparty_name=t.counterparty_name or 'Unknown',
+                amount=t.amount,
+                payment_purpose=t.payment_purpose,
+                suggested_category_name=t.suggested_category_rel.name if t.suggested_category_rel else None,
+                category_confidence=float(t.category_confidence),
+                status=t.status.value
+            )
+            for t in transactions
+        ]
+
+    def _confidence_scatter(self, query: Query) -> List[ConfidenceScatterPoint]:
+        rows = query.filter(_is_categorized).with_entities(
+            BankTransaction.id,
+            BankTransaction.transaction_date,
+            BankTransaction.counterparty_name,
+            BankTransaction.amount,
+            BankTransaction.category_confidence,
+            BankTransaction.status,
+            BankTransaction.transaction_type,
+            BankTransaction.is_regular_payment,
+        ).order_by(BankTransaction.id).limit(CONFIDENCE_SCATTER_LIMIT).all()
+
+        return [
+            ConfidenceScatterPoint(
+                transaction_id=row.id,
+                transaction_date=row.transaction_date,
+                counterparty_name=row.counterparty_name,
+                amount=row.amount,
+                category_confidence=float(row.category_confidence) if row.category_confidence else None,
+                status=row.status.value,
+                transaction_type=row.transaction_type.value,
+                is_regular_payment=row.is_regular_payment
+            )
+            for row in rows
+        ]
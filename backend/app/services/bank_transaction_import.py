@@ -156,6 +156,9 @@ class BankTransactionImporter:
             skipped = 0
             errors = []
 
+            # История категорий по всем ИНН - одним запросом на весь файл
+            self.classifier.preload_historical_index()
+
             for idx, row in df.iterrows():
                 try:
                     # Parse date
@@ -303,6 +306,9 @@ class BankTransactionImporter:
                                 # RULE: auto-apply category
                                 transaction.category_id = category_id
                                 transaction.status = BankTransactionStatusEnum.CATEGORIZED
+                                self.classifier.record_categorization(
+                                    counterparty_inn, transaction_type, category_id
+                                )
                             else:
                                 # AI HEURISTIC: only suggest
                                 transaction.suggested_category_id = category_id
@@ -0,0 +1,207 @@
+"""
+Пакетная запись документов 1С в bank_transactions (импорт и синхронизация).
+
+upsert_bank_transactions() записывает страницу документов - плоские словари
+колонок BankTransaction - одним INSERT ... ON CONFLICT (external_id_1c)
+DO UPDATE вместо SELECT + ORM-flush на каждый документ. Правила обновления
+существующих записей (apply_1c_update для ORM):
+- пользовательские поля (PROTECTED_FIELDS) не перезаписываются, notes
+  заполняется, только если в записи пусто;
+- остальные поля обновляются только непустыми значениями из 1С;
+- поля новой записи (INSERT_ONLY_FIELDS: тип, источник импорта, активность)
+  у существующих не меняются.
+Строка, у которой ни одна обновляемая колонка не меняется (повторная загрузка
+того же документа), не перезаписывается (ON CONFLICT ... DO UPDATE WHERE
+... IS DISTINCT FROM ...) и не попадает в RETURNING - такие документы
+считаются неизмененными. Созданные и обновленные строки различаются по
+RETURNING (xmax = 0).
+
+Core INSERT не проходит через ORM-слушатели сессии, поэтому дни, счета и
+транзакции реально измененных строк помечаются явно (daily_rollup,
+account_summary, keyword_index) - старые значения читаются одним SELECT по
+странице. В других СУБД (SQLite в тестах) - один SELECT по external_id_1c на
+страницу и запись через ORM.
+"""
+import logging
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple
+
+from sqlalchemy import false, func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import BankTransaction
+from app.services.account_summary import SUMMARY_COLUMNS, mark_transactions_changed
+from app.services.daily_rollup import mark_rollup_days_dirty
+from app.services.keyword_index import mark_transactions_dirty
+from app.services.transaction_search import is_postgresql
+
+logger = logging.getLogger(__name__)
+
+# Пользовательские данные - при повторном импорте не перезаписываются
+PROTECTED_FIELDS: FrozenSet[str] = frozenset({
+    'status',                    # Статус обработки (NEW, CATEGORIZED, APPROVED и т.д.)
+    'category_id',               # Назначенная категория
+    'suggested_category_id',     # Предложенная категория
+    'category_confidence',       # Уверенность классификации
+    'approved_by',               # Кто подтвердил
+    'approved_at',               # Когда подтверждено
+    'expense_id',                # Связь с заявкой на расход
+    'notes',                     # Пользовательские заметки (если уже есть)
+})
+
+# Задаются только при создании записи
+INSERT_ONLY_FIELDS: FrozenSet[str] = frozenset({
+    'external_id_1c', 'transaction_type', 'import_source', 'imported_at', 'is_active',
+})
+
+
+def apply_1c_update(existing: BankTransaction, data: Dict[str, Any]) -> None:
+    """Обновить существующую транзакцию данными из 1С, не затирая пользовательские поля."""
+    for key, value in data.items():
+        if key in INSERT_ONLY_FIELDS:
+            continue
+        if key in PROTECTED_FIELDS:
+            # Для notes - обновляем только если в существующей записи пусто
+            if key == 'notes' and not existing.notes:
+                existing.notes = value
+            continue
+        if value is not None and hasattr(existing, key):
+            setattr(existing, key, value)
+
+
+def _conflict_update(statement, keys: Iterable[str]) -> Dict[str, Any]:
+    table = BankTransaction.__table__
+    excluded = statement.excluded
+
+    values = {}
+    for key in keys:
+        if key in INSERT_ONLY_FIELDS:
+            continue
+        if key == 'notes':
+            values[key] = func.coalesce(func.nullif(table.c.notes, ''), excluded.notes)
+        elif key not in PROTECTED_FIELDS:
+            values[key] = func.coalesce(excluded[key], table.c[key])
+    # onupdate колонки не срабатывает для ON CONFLICT
+    values['updated_at'] = func.now()
+    return values
+
+
+def _changed_condition(values: Dict[str, Any]):
+    """Хотя бы одна обновляемая колонка получает другое значение."""
+    table = BankTransaction.__table__
+    conditions = [
+        table.c[key].is_distinct_from(value)
+        for key, value in values.items()
+        if key != 'updated_at'
+    ]
+    return or_(*conditions) if conditions else false()
+
+
+def _upsert_postgresql(db: Session, rows: List[Dict[str, Any]]) -> Tuple[List[int], List[int], int]:
+    table = BankTransaction.__table__
+    external_ids = [row['external_id_1c'] for row in rows]
+
+    # Прежнее состояние существующих записей - для пересчета агрегатов
+    previous: Dict[int, Any] = {}
+    if settings.DAILY_ROLLUP_ENABLED or settings.ACCOUNT_SUMMARY_ENABLED:
+        previous = {
+            row.id: row
+            for row in db.execute(
+                select(*SUMMARY_COLUMNS).where(table.c.external_id_1c.in_(external_ids))
+            )
+        }
+
+    # Многострочный VALUES требует одинаковых ключей - группы по набору колонок
+    groups: Dict[FrozenSet[str], List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+
+    created: List[int] = []
+    updated: List[int] = []
+    days = []
+    for keys, group in groups.items():
+        statement = pg_insert(table).values(group)
+        values = _conflict_update(statement, keys)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.external_id_1c],
+            set_=values,
+            where=_changed_condition(values)
+        ).returning(
+            table.c.id,
+            table.c.transaction_date,
+            literal_column('xmax = 0').label('inserted')
+        )
+
+        for row in db.execute(statement):
+            (created if row.inserted else updated).append(row.id)
+            days.append(row.transaction_date)
+
+    # Только реально измененные строки: новые и старые день/счет обновленных
+    if settings.DAILY_ROLLUP_ENABLED:
+        days.extend(previous[id_].transaction_date for id_ in updated if id_ in previous)
+        mark_rollup_days_dirty(db, days)
+    if settings.ACCOUNT_SUMMARY_ENABLED:
+        mark_transactions_changed(db, created + updated, [previous[id_] for id_ in updated if id_ in previous])
+    mark_transactions_dirty(db, created + updated)
+    return created, updated, len(rows) - len(created) - len(updated)
+
+
+def _upsert_orm(db: Session, rows: List[Dict[str, Any]]) -> Tuple[List[int], List[int], int]:
+    existing = {
+        transaction.external_id_1c: transaction
+        for transaction in db.query(BankTransaction).filter(
+            BankTransaction.external_id_1c.in_([row['external_id_1c'] for row in rows])
+        )
+    }
+
+    new_transactions = []
+    updated: List[int] = []
+    unchanged = 0
+    for row in rows:
+        transaction = existing.get(row['external_id_1c'])
+        if transaction is None:
+            transaction = BankTransaction(**row)
+            db.add(transaction)
+            new_transactions.append(transaction)
+            continue
+
+        apply_1c_update(transaction, row)
+        if db.is_modified(transaction):
+            updated.append(transaction.id)
+        else:
+            unchanged += 1
+
+    db.flush()
+    return [transaction.id for transaction in new_transactions], updated, unchanged
+
+
+def upsert_bank_transactions(db: Session, rows: List[Dict[str, Any]]) -> Tuple[List[int], List[int], int]:
+    """
+    Записать страницу документов 1С (без commit).
+
+    Args:
+        db: Сессия
+        rows: Колонки BankTransaction, обязательно external_id_1c; поля новой
+            записи (transaction_type, payment_source, import_source, ...)
+            задает вызывающий код
+
+    Returns:
+        (id созданных, id обновленных, количество неизмененных)
+    """
+    # Один документ дважды на странице - последняя версия
+    # (ON CONFLICT не может обновить строку дважды за запрос)
+    rows = list({row['external_id_1c']: row for row in rows}.values())
+    if not rows:
+        return [], [], 0
+
+    if is_postgresql(db):
+        created, updated, unchanged = _upsert_postgresql(db, rows)
+    else:
+        created, updated, unchanged = _upsert_orm(db, rows)
+
+    logger.debug(
+        f"Upserted {len(rows)} bank transactions: {len(created)} created, "
+        f"{len(updated)} updated, {unchanged} unchanged"
+    )
+    return created, updated, unchanged
@@ -0,0 +1,91 @@
+"""
+Массовое обновление строк по первичному ключу одним UPDATE.
+
+В PostgreSQL строится один запрос вида
+
+    UPDATE bank_transactions SET status = v.status, ...
+    FROM (VALUES (...), (...)) AS v (id, status, ...)
+    WHERE bank_transactions.id = v.id
+
+Значения приводятся к типам колонок модели через CAST, поэтому enum-колонки и
+NULL в первой строке VALUES обрабатываются корректно. В остальных СУБД
+(SQLite в тестах) - UPDATE по каждой строке.
+
+Запрос выполняется через ORM-сессию, поэтому слушатели daily_rollup и
+account_summary видят затронутые строки и пересчитывают агрегаты.
+"""
+from typing import Any, Dict, Sequence
+
+from sqlalchemy import cast, column, func, update, values
+from sqlalchemy.orm import Session
+
+from app.services.transaction_search import is_postgresql
+
+# Строк в одном VALUES - ограничение на число параметров запроса
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def bulk_update_by_id(
+    session: Session,
+    model,
+    rows: Sequence[Dict[str, Any]],
+    columns: Sequence[str],
+    keep_existing_on_null: Sequence[str] = (),
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> int:
+    """
+    Обновить колонки columns у строк model по id.
+
+    Args:
+        session: Сессия БД
+        model: ORM-модель с первичным ключом id
+        rows: Словари {'id': ..., <колонка>: <значение>, ...}
+        columns: Обновляемые колонки (должны быть в каждой строке)
+        keep_existing_on_null: Колонки, для которых NULL означает "не менять"
+        chunk_size: Максимум строк в одном запросе
+
+    Returns:
+        Количество обновленных строк
+    """
+    if not rows or not columns:
+        return 0
+
+    table = model.__table__
+    updated = 0
+
+    if not is_postgresql(session):
+        for row in rows:
+            updated += session.query(model).filter(model.id == row['id']).update(
+                {
+                    name: row[name] for name in columns
+                    if row[name] is not None or name not in keep_existing_on_null
+                },
+                synchronize_session=False
+            )
+        return updated
+
+    names = ['id', *columns]
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        source = values(
+            *(column(name, table.c[name].type) for name in names),
+            name='v'
+        ).data([tuple(row[name] for name in names) for row in chunk])
+
+        assignments = {}
+        for name in columns:
+            value = cast(source.c[name], table.c[name].type)
+            if name in keep_existing_on_null:
+                value = func.coalesce(value, table.c[name])
+            assignments[name] = value
+
+        statement = (
+            update(model)
+            .where(model.id == source.c.id)
+            .values(assignments)
+            .execution_options(synchronize_session=False)
+        )
+        updated += session.execute(statement).rowcount
+
+    return updated
+
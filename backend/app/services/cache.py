@@ -17,6 +17,8 @@ CACHE_TTL = {
     "contracts": 300,     # 5 минут для списка договоров
     "turnover": 600,      # 10 минут для оборотной ведомости
     "references": 60,     # 1 минута для справочников
+    "list_count": 60,     # 1 минута для total постраничных списков
+    "bank_tx_stats": 15,  # 15 секунд для шапки статистики транзакций
 }
 
 
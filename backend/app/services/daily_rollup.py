@@ -0,0 +1,311 @@
+"""
+Дневные агрегаты банковских транзакций (bank_transaction_daily_rollups).
+
+Таблица хранит COUNT/SUM по ключу (день, организация, счет, банк счета,
+категория, тип, статус, источник) и поддерживается инкрементально:
+- слушатели сессии SQLAlchemy собирают дни, затронутые изменениями
+  BankTransaction (ORM add/update/delete и массовые query.update()/delete());
+- перед commit эти дни пересчитываются из bank_transactions
+  (DELETE + INSERT ... SELECT только по затронутым дням).
+
+Пересчет дня в PostgreSQL идет под pg_advisory_xact_lock этого дня (до конца
+транзакции): иначе две транзакции, пересчитывающие один день одновременно,
+обе удаляют старые строки и обе вставляют свои - агрегаты дублируются.
+
+Код, который пишет в bank_transactions сырым SQL, должен сам вызвать
+mark_rollup_days_dirty().
+"""
+import logging
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import Date, delete, distinct, event, extract, func, insert, inspect, select
+from sqlalchemy.orm import Query, Session
+
+from app.core.config import settings
+from app.db.models import (
+    BankTransaction, BankTransactionDailyRollup,
+    BankTransactionTypeEnum, BankTransactionStatusEnum
+)
+from app.services.transaction_search import is_postgresql
+
+logger = logging.getLogger(__name__)
+
+DIRTY_DAYS_KEY = "daily_rollup_dirty_days"
+REFRESH_CHUNK_DAYS = 100
+# Первый ключ pg_advisory_xact_lock(int, int) для блокировок дней агрегатов
+ROLLUP_LOCK_NAMESPACE = 7301
+
+_day_of = func.date(BankTransaction.transaction_date, type_=Date)
+
+
+def _to_day(value) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return None
+
+
+def mark_rollup_days_dirty(session: Session, days: Iterable) -> None:
+    """Пометить дни для пересчета при ближайшем commit."""
+    dirty: Set[date] = session.info.setdefault(DIRTY_DAYS_KEY, set())
+    for value in days:
+        day = _to_day(value)
+        if day:
+            dirty.add(day)
+
+
+def _lock_days(session: Session, days: List[date]) -> None:
+    """Заблокировать пересчет дней другими транзакциями (по возрастанию - без взаимных блокировок)."""
+    for day in days:
+        session.execute(select(func.pg_advisory_xact_lock(ROLLUP_LOCK_NAMESPACE, day.toordinal())))
+
+
+def refresh_daily_rollup(session: Session, days: Iterable) -> int:
+    """
+    Пересчитать агрегаты за указанные дни.
+
+    Returns:
+        Количество пересчитанных дней.
+    """
+    unique_days = sorted({d for d in (_to_day(v) for v in days) if d})
+    R = BankTransactionDailyRollup
+    T = BankTransaction
+    lock_days = is_postgresql(session)
+
+    for start in range(0, len(unique_days), REFRESH_CHUNK_DAYS):
+        chunk = unique_days[start:start + REFRESH_CHUNK_DAYS]
+        # Диапазон по transaction_date - чтобы использовался индекс по дате
+        range_from = datetime.combine(chunk[0], datetime.min.time())
+        range_to = datetime.combine(chunk[-1] + timedelta(days=1), datetime.min.time())
+
+        has_confidence = T.category_confidence != 0
+        source = select(
+            _day_of,
+            T.organization_id,
+            T.account_number,
+            T.our_bank_name,
+            T.our_bank_bik,
+            T.category_id,
+            T.transaction_type,
+            T.status,
+            T.payment_source,
+            func.count(T.id),
+            func.coalesce(func.sum(T.amount), 0),
+            func.coalesce(func.sum(T.category_confidence).filter(has_confidence), 0),
+            func.count(T.id).filter(has_confidence),
+        ).where(
+            T.is_active == True,
+            T.transaction_date >= range_from,
+            T.transaction_date < range_to,
+            _day_of.in_(chunk),
+        ).group_by(
+            _day_of, T.organization_id, T.account_number, T.our_bank_name, T.our_bank_bik,
+            T.category_id, T.transaction_type, T.status, T.payment_source
+        )
+
+        # После блокировки (READ COMMITTED) SELECT видит изменения транзакции,
+        # которая пересчитывала эти дни перед нами
+        if lock_days:
+            _lock_days(session, chunk)
+        session.execute(delete(R).where(R.day.in_(chunk)))
+        session.execute(insert(R).from_select([
+            R.day, R.organization_id, R.account_number, R.our_bank_name, R.our_bank_bik,
+            R.category_id, R.transaction_type, R.status, R.payment_source,
+            R.transaction_count, R.total_amount, R.confidence_sum, R.confidence_count,
+        ], source))
+
+    return len(unique_days)
+
+
+def rebuild_daily_rollup(
+    session: Session,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> int:
+    """Полный пересчет агрегатов (за период или за все время)."""
+    query = session.query(distinct(_day_of)).filter(BankTransaction.is_active == True)
+    if date_from:
+        query = query.filter(BankTransaction.transaction_date >= date_from)
+    if date_to:
+        query = query.filter(BankTransaction.transaction_date < date_to + timedelta(days=1))
+    days = {row[0] for row in query.all()}
+
+    # Дни, где остались только устаревшие агрегаты
+    stale = session.query(BankTransactionDailyRollup.day)
+    if date_from:
+        stale = stale.filter(BankTransactionDailyRollup.day >= date_from)
+    if date_to:
+        stale = stale.filter(BankTransactionDailyRollup.day <= date_to)
+    days.update(row[0] for row in stale.distinct().all())
+
+    return refresh_daily_rollup(session, days)
+
+
+def rollup_query(
+    session: Session,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    transaction_type: Optional[BankTransactionTypeEnum] = None,
+    payment_source: Optional[str] = None,
+    account_number: Optional[str] = None,
+    category_id: Optional[int] = None,
+    organization_id: Optional[int] = None,
+) -> Query:
+    """
+    Запрос к агрегатам с теми же фильтрами, что у эндпоинтов транзакций.
+
+    Фильтры по дате - с точностью до дня (date_to включает весь день).
+    category_id=0 означает "без категории", account_number="Не указан" - счет не задан.
+    """
+    R = BankTransactionDailyRollup
+    query = session.query(R)
+
+    if year and month:
+        query = query.filter(extract('year', R.day) == year, extract('month', R.day) == month)
+    elif year:
+        query = query.filter(extract('year', R.day) == year)
+
+    if date_from:
+        query = query.filter(R.day >= date_from)
+    if date_to:
+        query = query.filter(R.day <= date_to)
+
+    if transaction_type:
+        query = query.filter(R.transaction_type == transaction_type)
+
+    if payment_source:
+        query = query.filter(R.payment_source == payment_source)
+
+    if account_number:
+        if account_number == "Не указан":
+            query = query.filter(R.account_number.is_(None))
+        else:
+            query = query.filter(R.account_number == account_number)
+
+    if category_id is not None:
+        if category_id == 0:
+            query = query.filter(R.category_id.is_(None))
+        else:
+            query = query.filter(R.category_id == category_id)
+
+    if organization_id:
+        query = query.filter(R.organization_id == organization_id)
+
+    return query
+
+
+def rollup_stats(query: Query) -> dict:
+    """Счетчики /bank-transactions/stats по запросу к агрегатам (один SELECT)."""
+    R = BankTransactionDailyRollup
+
+    def count_where(condition=None):
+        total = func.sum(R.transaction_count)
+        if condition is not None:
+            total = total.filter(condition)
+        return func.coalesce(total, 0)
+
+    def amount_where(condition):
+        return func.coalesce(func.sum(R.total_amount).filter(condition), 0)
+
+    row = query.with_entities(
+        count_where().label('total'),
+        count_where(R.status == BankTransactionStatusEnum.NEW).label('new'),
+        count_where(R.status == BankTransactionStatusEnum.CATEGORIZED).label('categorized'),
+        count_where(R.status == BankTransactionStatusEnum.APPROVED).label('approved'),
+        count_where(R.status.in_([
+            BankTransactionStatusEnum.NEEDS_REVIEW,
+            BankTransactionStatusEnum.NEW
+        ])).label('needs_review'),
+        count_where(R.status == BankTransactionStatusEnum.IGNORED).label('ignored'),
+        amount_where(R.transaction_type == BankTransactionTypeEnum.DEBIT).label('total_debit'),
+        amount_where(R.transaction_type == BankTransactionTypeEnum.CREDIT).label('total_credit'),
+    ).one()
+
+    return {
+        'total': int(row.total),
+        'new': int(row.new),
+        'categorized': int(row.categorized),
+        'approved': int(row.approved),
+        'needs_review': int(row.needs_review),
+        'ignored': int(row.ignored),
+        'total_debit': Decimal(row.total_debit or 0),
+        'total_credit': Decimal(row.total_credit or 0),
+    }
+
+
+# ==================== Session listeners ====================
+
+@event.listens_for(Session, "before_flush")
+def _collect_flushed_days(session: Session, flush_context, instances) -> None:
+    """Собрать дни по новым/измененным/удаленным BankTransaction."""
+    if not settings.DAILY_ROLLUP_ENABLED:
+        return
+
+    days = []
+    for obj in session.new:
+        if isinstance(obj, BankTransaction):
+            days.append(obj.transaction_date)
+
+    for obj in session.dirty:
+        if isinstance(obj, BankTransaction) and session.is_modified(obj):
+            history = inspect(obj).attrs.transaction_date.history
+            days.extend(history.deleted)
+            days.append(obj.transaction_date)
+
+    for obj in session.deleted:
+        if isinstance(obj, BankTransaction):
+            days.append(obj.transaction_date)
+
+    if days:
+        mark_rollup_days_dirty(session, days)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_days(orm_execute_state) -> None:
+    """Собрать дни для массовых UPDATE/DELETE по bank_transactions."""
+    if not settings.DAILY_ROLLUP_ENABLED:
+        return
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not BankTransaction:
+        return
+
+    affected = select(distinct(_day_of))
+    whereclause = orm_execute_state.statement.whereclause
+    if whereclause is not None:
+        affected = affected.where(whereclause)
+
+    session = orm_execute_state.session
+    mark_rollup_days_dirty(session, session.execute(affected).scalars().all())
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_dirty_days(session: Session) -> None:
+    """Пересчитать затронутые дни в той же транзакции, что и изменения."""
+    if not settings.DAILY_ROLLUP_ENABLED:
+        return
+
+    # Дни становятся известны только после flush ожидающих изменений
+    session.flush()
+    days: List[date] = list(session.info.pop(DIRTY_DAYS_KEY, ()))
+    if not days:
+        return
+
+    try:
+        with session.begin_nested():
+            refresh_daily_rollup(session, days)
+    except Exception as e:
+        # Агрегаты не должны ломать основную запись - их можно пересчитать позже
+        logger.warning(f"Daily rollup refresh failed for {len(days)} days: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_dirty_days(session: Session) -> None:
+    session.info.pop(DIRTY_DAYS_KEY, None)
@@ -1,16 +1,177 @@
 """Expense matching service for linking bank transactions to expenses."""
-from typing import List, Tuple, Optional
-from datetime import date, timedelta
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from enum import Enum
+from typing import Dict, Iterable, List, Set, Tuple, Optional
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
+import numpy as np
 
 from app.db.models import (
     BankTransaction, Expense, ExpenseStatusEnum,
     BankTransactionTypeEnum, BankTransactionStatusEnum
 )
 from app.schemas.expense import MatchingSuggestion
+from app.services.assignment import max_weight_assignment
+
+# Статусы заявок, к которым можно привязать оплату
+OPEN_EXPENSE_STATUSES = (ExpenseStatusEnum.APPROVED, ExpenseStatusEnum.PARTIALLY_PAID)
+
+# Транзакций в одном пакете сопоставления (пакет - один commit)
+DEFAULT_COMMIT_BATCH = 500
+
+# Компоненты графа больше (транзакции x заявки) решаются жадно по score
+MAX_ASSIGNMENT_CELLS = 4_000_000
+
+# (транзакция, заявка, score, причины)
+Match = Tuple[BankTransaction, Expense, float, List[str]]
+
+
+class AutoMatchModeEnum(str, Enum):
+    """Стратегия автоматического сопоставления."""
+    GREEDY = "greedy"      # по порядку транзакций - лучшая заявка для каждой
+    OPTIMAL = "optimal"    # максимум суммарного score по пакету (задача о назначениях)
+
+
+def remaining_amount(expense: Expense) -> Decimal:
+    """Неоплаченный остаток заявки."""
+    return expense.amount - (expense.amount_paid or Decimal("0"))
+
+
+class _AmountBucket:
+    """Заявки одной группы, отсортированные по остатку и по сумме (для bisect)."""
+
+    _MAX_ID = float("inf")
+
+    def __init__(self):
+        self._remaining_keys: List[Tuple[Decimal, int]] = []
+        self._remaining_items: List[Expense] = []
+        self._amount_keys: List[Tuple[Decimal, int]] = []
+        self._amount_items: List[Expense] = []
+
+    @staticmethod
+    def _insert(keys: list, items: list, key: tuple, expense: Expense) -> None:
+        position = bisect_left(keys, key)
+        keys.insert(position, key)
+        items.insert(position, expense)
+
+    @staticmethod
+    def _delete(keys: list, items: list, key: tuple) -> None:
+        position = bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            del keys[position]
+            del items[position]
+
+    def add(self, expense: Expense, remaining: Decimal) -> None:
+        self._insert(self._remaining_keys, self._remaining_items, (remaining, expense.id), expense)
+        self._insert(self._amount_keys, self._amount_items, (expense.amount, expense.id), expense)
+
+    def remove(self, expense: Expense, remaining: Decimal) -> None:
+        self._delete(self._remaining_keys, self._remaining_items, (remaining, expense.id))
+        self._delete(self._amount_keys, self._amount_items, (expense.amount, expense.id))
+
+    def remaining_at_least(self, min_remaining: Decimal) -> Iterable[Expense]:
+        """Заявки с остатком >= min_remaining, от меньшего остатка к большему."""
+        start = bisect_left(self._remaining_keys, (min_remaining,))
+        return iter(self._remaining_items[start:])
+
+    def amount_between(self, min_amount: Decimal, max_amount: Decimal) -> List[Expense]:
+        """Заявки с суммой в диапазоне [min_amount, max_amount]."""
+        start = bisect_left(self._amount_keys, (min_amount,))
+        end = bisect_right(self._amount_keys, (max_amount, self._MAX_ID))
+        return self._amount_items[start:end]
+
+
+class ExpenseCandidateIndex:
+    """
+    Открытые заявки (APPROVED/PARTIALLY_PAID) в памяти для пакетного сопоставления.
+
+    Загружаются одним запросом и раскладываются по ИНН контрагента; внутри
+    группы заявки отсортированы по остатку и по сумме, поэтому кандидаты для
+    транзакции находятся бинарным поиском, а не отдельным запросом.
+    Условия отбора - те же, что в ExpenseMatchingService._get_candidate_expenses.
+    После привязки оплаты заявка переставляется по новому остатку (или
+    убирается, если оплачена полностью).
+    """
+
+    def __init__(self, expenses: Iterable[Expense]):
+        self._by_inn: Dict[Optional[str], _AmountBucket] = defaultdict(_AmountBucket)
+        self._all = _AmountBucket()
+        self._remaining: Dict[int, Decimal] = {}
+        for expense in expenses:
+            self._add(expense)
+
+    @classmethod
+    def load(cls, db: Session) -> "ExpenseCandidateIndex":
+        return cls(db.query(Expense).filter(
+            Expense.is_active == True,
+            Expense.status.in_(OPEN_EXPENSE_STATUSES)
+        ).all())
+
+    def __len__(self) -> int:
+        return len(self._remaining)
+
+    def _add(self, expense: Expense) -> None:
+        remaining = remaining_amount(expense)
+        self._remaining[expense.id] = remaining
+        self._by_inn[expense.contractor_inn or None].add(expense, remaining)
+        self._all.add(expense, remaining)
+
+    def _remove(self, expense: Expense) -> None:
+        remaining = self._remaining.pop(expense.id, None)
+        if remaining is None:
+            return
+        self._by_inn[expense.contractor_inn or None].remove(expense, remaining)
+        self._all.remove(expense, remaining)
+
+    def refresh(self, expense: Expense) -> None:
+        """Обновить положение заявки после изменения оплаченной суммы/статуса."""
+        self._remove(expense)
+        if expense.is_active and expense.status in OPEN_EXPENSE_STATUSES:
+            self._add(expense)
+
+    def candidates(
+        self,
+        transaction: BankTransaction,
+        amount_tolerance: float,
+        date_window_days: int,
+        limit: int
+    ) -> List[Expense]:
+        """Кандидаты для транзакции (не больше limit по остатку + совпадения по сумме)."""
+        tx_date = transaction.transaction_date
+        if isinstance(tx_date, datetime):
+            tx_date = tx_date.date()
+        date_from = tx_date - timedelta(days=date_window_days)
+
+        min_amount = transaction.amount * Decimal(str(1 - amount_tolerance))
+        max_amount = transaction.amount * Decimal(str(1 + amount_tolerance)) * 2
+
+        if transaction.counterparty_inn:
+            buckets = [self._by_inn.get(transaction.counterparty_inn), self._by_inn.get(None)]
+        else:
+            buckets = [self._all]
+
+        found: Dict[int, Expense] = {}
+        for bucket in buckets:
+            if bucket is None:
+                continue
+
+            for expense in bucket.amount_between(min_amount, max_amount):
+                if expense.request_date >= date_from:
+                    found.setdefault(expense.id, expense)
+
+            taken = 0
+            for expense in bucket.remaining_at_least(min_amount):
+                if taken >= limit:
+                    break
+                if expense.request_date >= date_from:
+                    found.setdefault(expense.id, expense)
+                    taken += 1
+
+        return list(found.values())
 
 
 class ExpenseMatchingService:
@@ -26,6 +187,7 @@ class ExpenseMatchingService:
     AMOUNT_TOLERANCE = 0.05   # 5% tolerance for amount matching
     DATE_TOLERANCE_DAYS = 14  # Days tolerance for date matching
     MIN_SCORE_THRESHOLD = 30.0  # Minimum score to consider a match
+    CANDIDATE_LIMIT = 50      # Candidates per transaction
 
     def __init__(self, db: Session):
         self.db = db
@@ -125,7 +287,7 @@ class ExpenseMatchingService:
                 )
             )
 
-        return query.limit(50).all()
+        return query.limit(self.CANDIDATE_LIMIT).all()
 
     def calculate_matching_score(
         self,
@@ -220,6 +382,10 @@ class ExpenseMatchingService:
         exp_due_date: Optional[date]
     ) -> Tuple[float, Optional[str]]:
         """Score date proximity."""
+        # transaction_date - DateTime, даты заявки - Date
+        if isinstance(tx_date, datetime):
+            tx_date = tx_date.date()
+
         # Check due date first
         if exp_due_date:
             days_diff = abs((tx_date - exp_due_date).days)
@@ -228,7 +394,7 @@ class ExpenseMatchingService:
             elif days_diff <= 3:
                 return self.DATE_WEIGHT * 0.9, f"Оплата близко к сроку (±{days_diff} дн.)"
             elif days_diff <= 7:
-                return self.DATE_WEIGHT * 0.7, f"Оплата в пределах недели от срока"
+                return self.DATE_WEIGHT * 0.7, "Оплата в пределах недели от срока"
 
         # Check request date
         days_after_request = (tx_date - exp_request_date).days
@@ -271,7 +437,7 @@ class ExpenseMatchingService:
 
             if len(common_words) >= 2:
                 return self.COUNTERPARTY_WEIGHT * 0.6, "Частичное совпадение названия"
-            elif len(common_words) >= 1 and len(common_words[0] if common_words else '') > 3:
+            elif len(common_words) >= 1 and len(next(iter(common_words))) > 3:
                 return self.COUNTERPARTY_WEIGHT * 0.3, "Есть общие слова в названии"
 
         return 0.0, None
@@ -339,8 +505,19 @@ class ExpenseMatchingService:
         if not expense:
             raise ValueError("Expense not found")
 
+        self._apply_link(transaction, expense, matching_score)
+        self.db.commit()
+        return True
+
+    def _apply_link(
+        self,
+        transaction: BankTransaction,
+        expense: Expense,
+        matching_score: Optional[float] = None
+    ) -> None:
+        """Привязать транзакцию к заявке и обновить оплату заявки (без commit)."""
         # Link transaction
-        transaction.expense_id = expense_id
+        transaction.expense_id = expense.id
         transaction.matching_score = Decimal(str(matching_score)) if matching_score else None
         transaction.status = BankTransactionStatusEnum.MATCHED
 
@@ -354,22 +531,177 @@ class ExpenseMatchingService:
         elif expense.amount_paid > 0:
             expense.status = ExpenseStatusEnum.PARTIALLY_PAID
 
-        self.db.commit()
-        return True
+    def best_match(
+        self,
+        transaction: BankTransaction,
+        index: ExpenseCandidateIndex,
+        threshold: float
+    ) -> Optional[Tuple[Expense, float, List[str]]]:
+        """Лучшая заявка из индекса со score >= threshold (или None)."""
+        best = None
+        for expense in index.candidates(
+            transaction,
+            amount_tolerance=self.AMOUNT_TOLERANCE,
+            date_window_days=self.DATE_TOLERANCE_DAYS * 3,
+            limit=self.CANDIDATE_LIMIT
+        ):
+            score, reasons = self.calculate_matching_score(transaction, expense)
+            if score >= threshold and (best is None or score > best[1]):
+                best = (expense, score, reasons)
+        return best
 
-    def auto_match_transactions(
+    def _match_greedy(
         self,
-        threshold: float = 70.0,
-        limit: int = 100
-    ) -> List[dict]:
+        transactions: List[BankTransaction],
+        index: ExpenseCandidateIndex,
+        threshold: float
+    ) -> List[Match]:
+        """Каждой транзакции по порядку - лучшая из оставшихся заявок."""
+        matches = []
+        for tx in transactions:
+            match = self.best_match(tx, index, threshold)
+            if not match:
+                continue
+
+            expense, score, reasons = match
+            self._apply_link(tx, expense, score)
+            index.refresh(expense)
+            matches.append((tx, expense, score, reasons))
+        return matches
+
+    def _match_optimal(
+        self,
+        transactions: List[BankTransaction],
+        index: ExpenseCandidateIndex,
+        threshold: float
+    ) -> List[Match]:
         """
-        Automatically match unlinked transactions with high confidence.
+        Назначение с максимальным суммарным score по пакету.
 
-        Returns:
-            List of matched pairs with scores
+        Разреженный граф: ребро (транзакция, заявка), если заявка - кандидат из
+        индекса, сумма помещается в остаток (с допуском) и score >= threshold.
+        Каждый раунд - задача о назначениях (одна транзакция на заявку); после
+        раунда ребра заявок с новым остатком пересчитываются, и заявка может
+        принять следующую частичную оплату в следующем раунде.
         """
-        # Get unlinked debit transactions
-        transactions = self.db.query(BankTransaction).filter(
+        capacity_factor = Decimal(str(1 + self.AMOUNT_TOLERANCE))
+        edges: Dict[Tuple[int, int], Tuple[float, List[str]]] = {}
+        expenses: Dict[int, Expense] = {}
+        positions_by_expense: Dict[int, Set[int]] = defaultdict(set)
+
+        def score_edge(position: int, expense: Expense) -> None:
+            tx = transactions[position]
+            if tx.amount > remaining_amount(expense) * capacity_factor:
+                return
+            score, reasons = self.calculate_matching_score(tx, expense)
+            if score >= threshold:
+                edges[(position, expense.id)] = (score, reasons)
+
+        for position, tx in enumerate(transactions):
+            for expense in index.candidates(
+                tx,
+                amount_tolerance=self.AMOUNT_TOLERANCE,
+                date_window_days=self.DATE_TOLERANCE_DAYS * 3,
+                limit=self.CANDIDATE_LIMIT
+            ):
+                expenses[expense.id] = expense
+                positions_by_expense[expense.id].add(position)
+                score_edge(position, expense)
+
+        matches = []
+        assigned_positions: Set[int] = set()
+        while edges:
+            assignment = self._solve_assignment(edges)
+            if not assignment:
+                break
+
+            touched = set()
+            for position, expense_id in assignment:
+                tx, expense = transactions[position], expenses[expense_id]
+                score, reasons = edges[(position, expense_id)]
+                self._apply_link(tx, expense, score)
+                index.refresh(expense)
+                matches.append((tx, expense, score, reasons))
+                assigned_positions.add(position)
+                touched.add(expense_id)
+
+            edges = {
+                key: value for key, value in edges.items()
+                if key[0] not in assigned_positions and key[1] not in touched
+            }
+            for expense_id in touched:
+                expense = expenses[expense_id]
+                if expense.status not in OPEN_EXPENSE_STATUSES:
+                    continue
+                for position in positions_by_expense[expense_id] - assigned_positions:
+                    score_edge(position, expense)
+
+        # Порядок результата - как в жадном режиме (по порядку транзакций)
+        position_of = {id(tx): position for position, tx in enumerate(transactions)}
+        matches.sort(key=lambda match: position_of[id(match[0])])
+        return matches
+
+    @staticmethod
+    def _solve_assignment(
+        edges: Dict[Tuple[int, int], Tuple[float, List[str]]]
+    ) -> List[Tuple[int, int]]:
+        """Назначение по связным компонентам графа (позиция транзакции, id заявки)."""
+        adjacency: Dict[tuple, List[tuple]] = defaultdict(list)
+        for position, expense_id in edges:
+            adjacency[('tx', position)].append(('expense', expense_id))
+            adjacency[('expense', expense_id)].append(('tx', position))
+
+        result = []
+        seen: Set[tuple] = set()
+        for start in adjacency:
+            if start in seen:
+                continue
+
+            # Компонента связности (обход в ширину)
+            component = [start]
+            seen.add(start)
+            for node in component:
+                for neighbour in adjacency[node]:
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        component.append(neighbour)
+
+            rows = sorted(node[1] for node in component if node[0] == 'tx')
+            columns = sorted(node[1] for node in component if node[0] == 'expense')
+            component_edges = [
+                (position, expense_id)
+                for position in rows
+                for _, expense_id in adjacency[('tx', position)]
+            ]
+
+            if len(rows) * len(columns) > MAX_ASSIGNMENT_CELLS:
+                # Слишком большая компонента - жадно по убыванию score
+                taken_rows: Set[int] = set()
+                taken_columns: Set[int] = set()
+                for position, expense_id in sorted(
+                    component_edges, key=lambda edge: edges[edge][0], reverse=True
+                ):
+                    if position not in taken_rows and expense_id not in taken_columns:
+                        taken_rows.add(position)
+                        taken_columns.add(expense_id)
+                        result.append((position, expense_id))
+                continue
+
+            row_index = {position: i for i, position in enumerate(rows)}
+            column_index = {expense_id: j for j, expense_id in enumerate(columns)}
+            weights = np.zeros((len(rows), len(columns)))
+            for position, expense_id in component_edges:
+                weights[row_index[position], column_index[expense_id]] = edges[(position, expense_id)][0]
+
+            result.extend(
+                (rows[i], columns[j]) for i, j in max_weight_assignment(weights)
+            )
+
+        return result
+
+    def unlinked_transactions_query(self):
+        """Непривязанные расходные транзакции - кандидаты для автосопоставления."""
+        return self.db.query(BankTransaction).filter(
             BankTransaction.is_active == True,
             BankTransaction.expense_id.is_(None),
             BankTransaction.transaction_type == BankTransactionTypeEnum.DEBIT,
@@ -378,27 +710,68 @@ class ExpenseMatchingService:
                 BankTransactionStatusEnum.CATEGORIZED,
                 BankTransactionStatusEnum.NEEDS_REVIEW
             ])
-        ).limit(limit).all()
+        )
 
-        matched = []
-        for tx in transactions:
-            suggestions = self.find_matching_expenses(tx, threshold=threshold, limit=1)
+    def match_batch(
+        self,
+        transactions: List[BankTransaction],
+        index: ExpenseCandidateIndex,
+        threshold: float,
+        mode: AutoMatchModeEnum = AutoMatchModeEnum.GREEDY
+    ) -> List[Match]:
+        """Сопоставить пакет транзакций (привязки применяются в сессии, без commit)."""
+        if mode == AutoMatchModeEnum.OPTIMAL:
+            return self._match_optimal(transactions, index, threshold)
+        return self._match_greedy(transactions, index, threshold)
+
+    @staticmethod
+    def match_to_dict(match: Match) -> dict:
+        tx, expense, score, reasons = match
+        return {
+            "transaction_id": tx.id,
+            "expense_id": expense.id,
+            "expense_number": expense.number,
+            "score": score,
+            "reasons": reasons
+        }
+
+    def auto_match_transactions(
+        self,
+        threshold: float = 70.0,
+        limit: int = 100,
+        commit_every: int = DEFAULT_COMMIT_BATCH,
+        mode: AutoMatchModeEnum = AutoMatchModeEnum.GREEDY
+    ) -> List[dict]:
+        """
+        Automatically match unlinked transactions with high confidence.
 
-            if suggestions and suggestions[0].matching_score >= threshold:
-                suggestion = suggestions[0]
+        Открытые заявки загружаются один раз в ExpenseCandidateIndex, транзакции
+        сопоставляются и записываются пакетами по commit_every. В режиме OPTIMAL
+        назначение внутри пакета максимизирует суммарный score.
 
-                self.link_transaction_to_expense(
-                    tx.id,
-                    suggestion.expense_id,
-                    suggestion.matching_score
-                )
+        Returns:
+            List of matched pairs with scores
+        """
+        transactions = self.unlinked_transactions_query().limit(limit).all()
+        if not transactions:
+            return []
 
-                matched.append({
-                    "transaction_id": tx.id,
-                    "expense_id": suggestion.expense_id,
-                    "expense_number": suggestion.expense_number,
-                    "score": suggestion.matching_score,
-                    "reasons": suggestion.match_reasons
-                })
+        index = ExpenseCandidateIndex.load(self.db)
+
+        # Промежуточные commit не должны сбрасывать загруженные заявки - иначе
+        # каждая заявка индекса перечитывается отдельным запросом
+        expire_on_commit = self.db.expire_on_commit
+        self.db.expire_on_commit = False
+        try:
+            matched = []
+            for start in range(0, len(transactions), commit_every):
+                batch = transactions[start:start + commit_every]
+                matched.extend(
+                    self.match_to_dict(match)
+                    for match in self.match_batch(batch, index, threshold, mode)
+                )
+                self.db.commit()
+        finally:
+            self.db.expire_on_commit = expire_on_commit
 
         return matched
@@ -0,0 +1,156 @@
+"""
+Инвертированный индекс ключевых слов назначения платежа (transaction_keywords).
+
+Строка индекса - пара (transaction_id, keyword), слова нормализуются общим
+токенизатором keyword_tokenizer.index_tokens(). Индекс поддерживается
+инкрементально, так же как дневные агрегаты (daily_rollup):
+- слушатели сессии собирают id новых транзакций и транзакций с измененным
+  payment_purpose (ORM add/update и массовые query.update());
+- перед commit слова этих транзакций перестраиваются (DELETE + INSERT).
+Удаленные транзакции убираются из индекса каскадом по внешнему ключу.
+
+Статистика ключевых слов и поиск похожих транзакций используют индекс как
+обычный GROUP BY / semi-join по (keyword, transaction_id) вместо разбора
+назначений платежа в Python.
+"""
+import logging
+from typing import Iterable, List, Set
+
+from sqlalchemy import delete, event, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import BankTransaction, TransactionKeyword
+from app.services.keyword_tokenizer import index_tokens
+
+logger = logging.getLogger(__name__)
+
+DIRTY_TRANSACTIONS_KEY = "keyword_index_dirty_transactions"
+REFRESH_CHUNK_TRANSACTIONS = 1000
+
+
+def mark_transactions_dirty(session: Session, transaction_ids: Iterable[int]) -> None:
+    """Пометить транзакции для переиндексации при ближайшем commit."""
+    dirty: Set[int] = session.info.setdefault(DIRTY_TRANSACTIONS_KEY, set())
+    dirty.update(tx_id for tx_id in transaction_ids if tx_id is not None)
+
+
+def refresh_keyword_index(session: Session, transaction_ids: Iterable[int]) -> int:
+    """
+    Перестроить слова указанных транзакций.
+
+    Returns:
+        Количество записанных пар (транзакция, слово).
+    """
+    ids = sorted(set(transaction_ids))
+    written = 0
+
+    for start in range(0, len(ids), REFRESH_CHUNK_TRANSACTIONS):
+        chunk = ids[start:start + REFRESH_CHUNK_TRANSACTIONS]
+
+        purposes = session.execute(
+            select(BankTransaction.id, BankTransaction.payment_purpose)
+            .where(BankTransaction.id.in_(chunk))
+        ).all()
+
+        rows = [
+            {"transaction_id": tx_id, "keyword": keyword}
+            for tx_id, purpose in purposes
+            for keyword in index_tokens(purpose)
+        ]
+
+        session.execute(
+            delete(TransactionKeyword).where(TransactionKeyword.transaction_id.in_(chunk))
+        )
+        if rows:
+            session.execute(insert(TransactionKeyword), rows)
+        written += len(rows)
+
+    return written
+
+
+def rebuild_keyword_index(session: Session) -> int:
+    """Полная переиндексация всех транзакций с назначением платежа."""
+    session.execute(delete(TransactionKeyword))
+
+    ids: List[int] = [
+        row[0] for row in session.query(BankTransaction.id).filter(
+            BankTransaction.payment_purpose.isnot(None)
+        ).order_by(BankTransaction.id).all()
+    ]
+    return refresh_keyword_index(session, ids)
+
+
+def _updates_purpose(statement) -> bool:
+    """Меняет ли массовый UPDATE колонку payment_purpose."""
+    keys = list(getattr(statement, "_values", None) or ())
+    keys.extend(key for key, _ in getattr(statement, "_ordered_values", None) or ())
+    return any(getattr(key, "key", key) == "payment_purpose" for key in keys)
+
+
+# ==================== Session listeners ====================
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_transactions(session: Session, flush_context) -> None:
+    """Собрать id новых транзакций и транзакций с измененным назначением платежа."""
+    if not settings.KEYWORD_INDEX_ENABLED:
+        return
+
+    ids = []
+    for obj in session.new:
+        if isinstance(obj, BankTransaction) and obj.payment_purpose:
+            ids.append(obj.id)
+
+    for obj in session.dirty:
+        if isinstance(obj, BankTransaction) and inspect(obj).attrs.payment_purpose.history.has_changes():
+            ids.append(obj.id)
+
+    if ids:
+        mark_transactions_dirty(session, ids)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_transactions(orm_execute_state) -> None:
+    """Собрать id для массовых UPDATE, меняющих payment_purpose."""
+    if not settings.KEYWORD_INDEX_ENABLED:
+        return
+    if not orm_execute_state.is_update:
+        return
+
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not BankTransaction:
+        return
+    if not _updates_purpose(orm_execute_state.statement):
+        return
+
+    affected = select(BankTransaction.id)
+    whereclause = orm_execute_state.statement.whereclause
+    if whereclause is not None:
+        affected = affected.where(whereclause)
+
+    session = orm_execute_state.session
+    mark_transactions_dirty(session, session.execute(affected).scalars().all())
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_dirty_transactions(session: Session) -> None:
+    """Переиндексировать затронутые транзакции в той же транзакции, что и изменения."""
+    if not settings.KEYWORD_INDEX_ENABLED:
+        return
+
+    session.flush()
+    ids = list(session.info.pop(DIRTY_TRANSACTIONS_KEY, ()))
+    if not ids:
+        return
+
+    try:
+        with session.begin_nested():
+            refresh_keyword_index(session, ids)
+    except Exception as e:
+        # Индекс не должен ломать основную запись - его можно перестроить позже
+        logger.warning(f"Keyword index refresh failed for {len(ids)} transactions: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_dirty_transactions(session: Session) -> None:
+    session.info.pop(DIRTY_TRANSACTIONS_KEY, None)
@@ -0,0 +1,103 @@
+"""
+Выделение ключевых слов из назначения платежа.
+
+Общий токенизатор для предложений правил (analyze_rule_suggestions), поиска
+похожих транзакций и индекса transaction_keywords: одинаковые стоп-слова и
+нормализация слова (нижний регистр, без знаков препинания по краям).
+"""
+from typing import Iterable, List, Optional
+
+# Предлоги, общие банковские термины, налоги, документы, месяцы
+STOP_WORDS = frozenset({
+    # Предлоги и союзы
+    'для', 'при', 'или', 'без', 'под', 'над', 'перед', 'после',
+    'через', 'между', 'среди', 'вместо', 'кроме', 'около', 'вдоль',
+    # Общие банковские термины
+    'оплата', 'плата', 'платеж', 'счет', 'счёт', 'счету', 'договор',
+    'договору', 'номер', 'дата', 'период', 'услуги', 'услуг',
+    'работы', 'работ', 'товар', 'товара', 'товаров', 'включая',
+    'также', 'всего', 'итого', 'сумма', 'сумму', 'рублей', 'рубль',
+    'копеек', 'копейка', 'безналичный', 'наличный', 'перевод',
+    'перечисление', 'возврат', 'аванс', 'предоплата', 'доплата',
+    'комиссия', 'комис', 'пополнение', 'списание', 'зачисление',
+    # НДС и налоги
+    'числе', 'число', 'включительно', 'облагается', 'ставка',
+    # Документы
+    'документ', 'основание', 'назначение', 'платежа',
+    # Даты
+    'январь', 'февраль', 'март', 'апрель', 'июнь', 'июль',
+    'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь',
+    # Банковские операции
+    'операции', 'операция', 'банк', 'банка', 'расчетный', 'расчётный',
+    'корреспондентский', 'транзакция', 'межбанк', 'межбанковский',
+})
+
+# Символы, которые срезаются с краев слова
+STRIP_CHARS = '.,;:!?()[]{}"\'-'
+
+# Минимальная длина ключевого слова
+MIN_KEYWORD_LENGTH = 5
+
+# Слова, попадающие в индекс transaction_keywords (стоп-слова не исключаются -
+# их отбрасывают запросы к индексу)
+INDEX_MIN_LENGTH = 3
+INDEX_MAX_LENGTH = 100
+
+
+def normalize_word(word: str) -> str:
+    """Нормализованная форма слова: нижний регистр, без пунктуации по краям."""
+    return word.lower().strip(STRIP_CHARS)
+
+
+def extract_keywords(
+    text: Optional[str],
+    min_length: int = MIN_KEYWORD_LENGTH
+) -> List[str]:
+    """
+    Уникальные ключевые слова текста в порядке появления.
+
+    Слова короче min_length и стоп-слова отбрасываются.
+    """
+    if not text:
+        return []
+
+    keywords: List[str] = []
+    seen = set()
+    for word in text.split():
+        keyword = normalize_word(word)
+        if len(keyword) >= min_length and keyword not in STOP_WORDS and keyword not in seen:
+            seen.add(keyword)
+            keywords.append(keyword)
+    return keywords
+
+
+def index_tokens(text: Optional[str]) -> List[str]:
+    """
+    Уникальные нормализованные слова текста для индекса transaction_keywords.
+
+    Длина от INDEX_MIN_LENGTH до INDEX_MAX_LENGTH, числа пропускаются.
+    """
+    if not text:
+        return []
+
+    tokens: List[str] = []
+    seen = set()
+    for word in text.split():
+        token = normalize_word(word)
+        if (
+            INDEX_MIN_LENGTH <= len(token) <= INDEX_MAX_LENGTH
+            and not token.isdigit()
+            and token not in seen
+        ):
+            seen.add(token)
+            tokens.append(token)
+    return tokens
+
+
+def count_keywords(texts: Iterable[Optional[str]], min_length: int = MIN_KEYWORD_LENGTH) -> dict:
+    """Сколько текстов содержит каждое ключевое слово."""
+    counter: dict = {}
+    for text in texts:
+        for keyword in extract_keywords(text, min_length):
+            counter[keyword] = counter.get(keyword, 0) + 1
+    return counter
@@ -0,0 +1,90 @@
+"""
+Стратегии подсчета строк для постраничных списков.
+
+COUNT(*) по отфильтрованному набору (особенно с ILIKE-поиском) часто дороже
+самой страницы. Клиент выбирает стратегию:
+- exact     - точный COUNT(*) (по умолчанию, прежнее поведение);
+- estimated - оценка планировщика PostgreSQL из EXPLAIN (без выполнения запроса);
+- cached    - точный COUNT(*), закэшированный по сигнатуре фильтров на короткий TTL.
+"""
+import hashlib
+import json
+import logging
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Query, Session
+
+from app.services.cache import cache, CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class CountModeEnum(str, Enum):
+    """Стратегия подсчета total для списков."""
+    EXACT = "exact"
+    ESTIMATED = "estimated"
+    CACHED = "cached"
+
+
+def filter_signature(prefix: str, filters: Dict[str, Any]) -> str:
+    """Стабильный ключ кэша по набору фильтров (None-значения не учитываются)."""
+    normalized = {k: v for k, v in filters.items() if v is not None}
+    payload = json.dumps(normalized, sort_keys=True, default=str)
+    digest = hashlib.sha1(payload.encode()).hexdigest()
+    return f"{prefix}:{digest}"
+
+
+def estimate_query_count(db: Session, query: Query) -> Optional[int]:
+    """
+    Оценка числа строк по плану PostgreSQL (EXPLAIN без ANALYZE).
+
+    Возвращает None, если оценка недоступна (не PostgreSQL или ошибка компиляции).
+    """
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return None
+
+    try:
+        compiled = query.statement.compile(
+            dialect=bind.dialect,
+            compile_kwargs={"literal_binds": True}
+        )
+        plan = db.connection().exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {compiled}"
+        ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except Exception as e:
+        logger.warning(f"Count estimate failed, falling back to exact count: {e}")
+        return None
+
+
+def count_query(
+    db: Session,
+    query: Query,
+    mode: CountModeEnum = CountModeEnum.EXACT,
+    cache_key: Optional[str] = None,
+) -> Tuple[int, bool]:
+    """
+    Подсчитать строки запроса выбранной стратегией.
+
+    Returns:
+        (total, is_exact) - is_exact=False для оценки планировщика и для значения,
+        взятого из кэша (оно могло устареть в пределах TTL).
+    """
+    if mode == CountModeEnum.ESTIMATED:
+        estimate = estimate_query_count(db, query)
+        if estimate is not None:
+            return estimate, False
+
+    if mode == CountModeEnum.CACHED and cache_key:
+        cached_total = cache.get(cache_key)
+        if cached_total is not None:
+            return int(cached_total), False
+        total = query.count()
+        cache.set(cache_key, total, ttl=CACHE_TTL["list_count"])
+        return total, True
+
+    return query.count(), True
@@ -0,0 +1,216 @@
+"""
+Фоновая повторная классификация транзакций после изменения правил.
+
+Кандидаты - активные транзакции в статусах NEW и NEEDS_REVIEW. Они читаются
+порциями по возрастанию id (keyset, без OFFSET), классифицируются пачкой через
+TransactionClassifier.classify_many() и записываются одним
+UPDATE ... FROM (VALUES ...) на порцию. Каждая порция - отдельная короткая
+транзакция, поэтому таблица не блокируется на весь прогон.
+
+Прогресс и последний обработанный id публикуются через task_manager
+(WebSocket /ws/tasks/{task_id}); прерванный прогон можно продолжить с
+last_id другой задачи.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db.models import BankTransaction, BankTransactionStatusEnum
+from app.db.session import SessionLocal
+from app.services.background_tasks import task_manager, TaskStatus
+from app.services.transaction_classifier import TransactionClassifier, apply_classification_results
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATUSES = [BankTransactionStatusEnum.NEW, BankTransactionStatusEnum.NEEDS_REVIEW]
+DEFAULT_BATCH_SIZE = 1000
+
+
+class ReclassificationService:
+    """Повторная классификация NEW/NEEDS_REVIEW транзакций фоновой задачей."""
+
+    TASK_TYPE_RECLASSIFY = "reclassify_transactions"
+
+    @classmethod
+    def start_reclassification(
+        cls,
+        statuses: Optional[List[BankTransactionStatusEnum]] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        resume_task_id: Optional[str] = None,
+        user_id: Optional[int] = None
+    ) -> str:
+        """
+        Запустить фоновую повторную классификацию.
+
+        Args:
+            statuses: Статусы кандидатов (по умолчанию NEW и NEEDS_REVIEW)
+            batch_size: Размер порции (строк на один UPDATE и commit)
+            resume_task_id: Продолжить с last_id предыдущей задачи
+            user_id: Кто запустил
+
+        Returns:
+            ID задачи
+        """
+        statuses = statuses or DEFAULT_STATUSES
+        start_after_id = 0
+
+        if resume_task_id:
+            previous = task_manager.get_task(resume_task_id)
+            if not previous or previous.task_type != cls.TASK_TYPE_RECLASSIFY:
+                raise ValueError(f"Reclassification task {resume_task_id} not found")
+            start_after_id = int(previous.metadata.get("last_id") or 0)
+            if previous.metadata.get("statuses"):
+                statuses = [BankTransactionStatusEnum(s) for s in previous.metadata["statuses"]]
+
+        task_id = task_manager.create_task(
+            task_type=cls.TASK_TYPE_RECLASSIFY,
+            total=0,
+            metadata={
+                "statuses": [s.value for s in statuses],
+                "batch_size": batch_size,
+                "resumed_from": resume_task_id,
+                "start_after_id": start_after_id,
+                "last_id": start_after_id,
+                "user_id": user_id,
+            },
+            user_id=user_id
+        )
+
+        task_manager.run_async_task(
+            task_id,
+            cls._reclassify_async,
+            statuses=statuses,
+            batch_size=batch_size,
+            start_after_id=start_after_id
+        )
+
+        return task_id
+
+    @staticmethod
+    def _candidates_query(db: Session, statuses: List[BankTransactionStatusEnum]):
+        return db.query(BankTransaction).filter(
+            BankTransaction.is_active == True,
+            BankTransaction.status.in_(statuses)
+        )
+
+    @staticmethod
+    def _changed(row: Dict[str, Any], result) -> bool:
+        """Есть ли что записывать (эвристика, совпавшая с текущим предложением, - нет)."""
+        category_id, _, _, is_rule_based = result
+        if not category_id:
+            return False
+        if is_rule_based:
+            return True
+        return not (
+            row['status'] == BankTransactionStatusEnum.NEEDS_REVIEW
+            and row['suggested_category_id'] == category_id
+        )
+
+    @classmethod
+    async def _reclassify_async(
+        cls,
+        task_id: str,
+        statuses: List[BankTransactionStatusEnum],
+        batch_size: int,
+        start_after_id: int
+    ) -> Dict[str, Any]:
+        """Async worker: порции по id → classify_many → UPDATE ... FROM VALUES → commit."""
+        db = SessionLocal()
+        try:
+            total = cls._candidates_query(db, statuses).filter(
+                BankTransaction.id > start_after_id
+            ).count()
+            task = task_manager.get_task(task_id)
+            if task:
+                task.total = max(total, 1)
+
+            classifier = TransactionClassifier(db)
+
+            last_id = start_after_id
+            processed = 0
+            categorized = 0
+            suggested = 0
+            cancelled = False
+
+            task_manager.update_progress(
+                task_id, 0, message=f"Найдено {total} транзакций для повторной классификации"
+            )
+
+            while True:
+                task = task_manager.get_task(task_id)
+                if task and task.status == TaskStatus.CANCELLED:
+                    logger.info(f"Reclassification {task_id} cancelled at id {last_id}")
+                    cancelled = True
+                    break
+
+                rows = [
+                    row._asdict() for row in cls._candidates_query(db, statuses).with_entities(
+                        BankTransaction.id,
+                        BankTransaction.status,
+                        BankTransaction.suggested_category_id,
+                        BankTransaction.payment_purpose,
+                        BankTransaction.counterparty_name,
+                        BankTransaction.counterparty_inn,
+                        BankTransaction.amount,
+                        BankTransaction.transaction_type,
+                        BankTransaction.business_operation,
+                    ).filter(
+                        BankTransaction.id > last_id
+                    ).order_by(BankTransaction.id).limit(batch_size).yield_per(batch_size)
+                ]
+                if not rows:
+                    break
+
+                results = classifier.classify_many(rows)
+                changed = [
+                    (row, result) for row, result in zip(rows, results)
+                    if cls._changed(row, result)
+                ]
+                batch_categorized = apply_classification_results(
+                    db,
+                    [{'id': row['id']} for row, _ in changed],
+                    [result for _, result in changed]
+                )
+                db.commit()
+
+                last_id = rows[-1]['id']
+                processed += len(rows)
+                categorized += batch_categorized
+                suggested += len(changed) - batch_categorized
+
+                task_manager.update_progress(
+                    task_id,
+                    processed,
+                    message=(
+                        f"Обработано {processed}/{total} - категоризировано: {categorized}, "
+                        f"на проверку: {suggested}"
+                    ),
+                    metadata={"last_id": last_id, "categorized": categorized, "suggested": suggested}
+                )
+
+                # Отдать управление event loop между порциями
+                await asyncio.sleep(0)
+
+            message = (
+                f"{'Остановлено' if cancelled else 'Завершено'}: обработано {processed}, "
+                f"категоризировано {categorized}, на проверку {suggested}"
+            )
+            logger.info(f"Reclassification {task_id}: {message} (last id {last_id})")
+
+            return {
+                "success": not cancelled,
+                "message": message,
+                "total_processed": processed,
+                "total_categorized": categorized,
+                "total_suggested": suggested,
+                "last_id": last_id,
+            }
+
+        except Exception:
+            db.rollback()
+            logger.exception("Reclassification failed")
+            raise
+        finally:
+            db.close()
@@ -0,0 +1,317 @@
+"""
+Общий для процесса скомпилированный набор правил категоризации.
+
+Раньше каждый TransactionClassifier(db) заново загружал все активные
+CategorizationRule и BusinessOperationMapping и строил автоматы поиска. Теперь
+набор правил компилируется один раз на процесс и переиспользуется всеми
+классификаторами, пока не изменится версия правил.
+
+Версия хранится в БД (rule_set_versions, одна строка), поэтому изменение правил
+видят все worker-процессы:
+- слушатели сессии замечают изменения CategorizationRule/BusinessOperationMapping
+  (ORM add/update/delete и массовые query.update()/delete());
+- перед commit счетчик версии увеличивается в той же транзакции;
+- после commit локальная копия сбрасывается сразу, остальные процессы
+  перестраивают набор при следующем обращении (сверка версии - один запрос по PK).
+
+Скомпилированный набор неизменяемый и не содержит ORM-объектов: правила
+хранятся как RuleEntry, поэтому их можно безопасно делить между сессиями и потоками.
+"""
+import logging
+import threading
+from decimal import Decimal
+from types import MappingProxyType
+from typing import List, Mapping, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+
+from app.db.models import (
+    BusinessOperationMapping, CategorizationRule, CategorizationRuleTypeEnum, RuleSetVersion
+)
+from app.services.rule_matcher import KeywordRuleMatcher, NameRuleMatcher
+
+logger = logging.getLogger(__name__)
+
+RULES_CHANGED_KEY = "rule_cache_rules_changed"
+RULES_BUMPED_KEY = "rule_cache_version_bumped"
+RULE_SET_VERSION_ID = 1
+
+_RULE_MODELS = (CategorizationRule, BusinessOperationMapping)
+
+
+class RuleEntry(NamedTuple):
+    """Снимок правила или маппинга, не привязанный к сессии."""
+    id: int
+    category_id: Optional[int]
+    confidence: Optional[Decimal]
+    counterparty_inn: Optional[str] = None
+    counterparty_name: Optional[str] = None
+    business_operation: Optional[str] = None
+    keyword: Optional[str] = None
+    priority: int = 0
+
+
+class CompiledRuleSet:
+    """
+    Неизменяемый набор активных правил с готовыми структурами поиска.
+
+    - business_operation_mappings: business_operation -> маппинг из 1С
+    - business_operations / inn: значение -> правило с наивысшим приоритетом
+    - names / keywords: правила по приоритету + автоматы name_matcher / keyword_matcher
+    """
+
+    def __init__(
+        self,
+        version: Optional[int],
+        rules: List[RuleEntry],
+        rule_types: List[CategorizationRuleTypeEnum],
+        mappings: List[RuleEntry]
+    ):
+        self.version = version
+        self._rule_entries = tuple(rules)
+        self._rule_types = tuple(rule_types)
+        self._mapping_entries = tuple(mappings)
+
+        business_operations = {}
+        inn = {}
+        names = []
+        keywords = []
+
+        # rules уже отсортированы по приоритету (desc)
+        for rule, rule_type in zip(rules, rule_types):
+            if rule_type == CategorizationRuleTypeEnum.BUSINESS_OPERATION and rule.business_operation:
+                business_operations.setdefault(rule.business_operation, rule)
+            elif rule_type == CategorizationRuleTypeEnum.COUNTERPARTY_INN and rule.counterparty_inn:
+                inn.setdefault(rule.counterparty_inn, rule)
+            elif rule_type == CategorizationRuleTypeEnum.COUNTERPARTY_NAME and rule.counterparty_name:
+                names.append(rule)
+            elif rule_type == CategorizationRuleTypeEnum.KEYWORD and rule.keyword:
+                keywords.append(rule)
+
+        self.business_operation_mappings: Mapping[str, RuleEntry] = MappingProxyType(
+            {m.business_operation: m for m in mappings}
+        )
+        self.business_operations: Mapping[str, RuleEntry] = MappingProxyType(business_operations)
+        self.inn: Mapping[str, RuleEntry] = MappingProxyType(inn)
+        self.names: Tuple[RuleEntry, ...] = tuple(names)
+        self.keywords: Tuple[RuleEntry, ...] = tuple(keywords)
+
+        # Правила по имени и ключевым словам - в автоматы (Aho–Corasick)
+        self.name_matcher = NameRuleMatcher(self.names, lambda rule: rule.counterparty_name)
+        self.keyword_matcher = KeywordRuleMatcher(self.keywords, lambda rule: rule.keyword)
+
+    @classmethod
+    def empty(cls) -> "CompiledRuleSet":
+        return cls(None, [], [], [])
+
+    def with_rule(self, rule: RuleEntry, rule_type: CategorizationRuleTypeEnum) -> "CompiledRuleSet":
+        """
+        Новый набор с дополнительным правилом (для предпросмотра, без версии).
+
+        Правило встает после всех правил с приоритетом не ниже своего - при равном
+        приоритете существующие правила выигрывают.
+        """
+        position = 0
+        for index, existing in enumerate(self._rule_entries):
+            if existing.priority >= rule.priority:
+                position = index + 1
+
+        rules = list(self._rule_entries)
+        rule_types = list(self._rule_types)
+        rules.insert(position, rule)
+        rule_types.insert(position, rule_type)
+        return CompiledRuleSet(None, rules, rule_types, list(self._mapping_entries))
+
+
+_compiled: Optional[CompiledRuleSet] = None
+_compile_lock = threading.Lock()
+
+
+def current_rule_version(db: Session) -> Optional[int]:
+    """Текущая версия правил из БД (None, если счетчик недоступен)."""
+    try:
+        return db.query(RuleSetVersion.version).filter(
+            RuleSetVersion.id == RULE_SET_VERSION_ID
+        ).scalar()
+    except Exception as e:
+        logger.warning(f"Failed to read rule set version: {e}")
+        return None
+
+
+def _compile(db: Session, version: Optional[int]) -> CompiledRuleSet:
+    """Загрузить активные правила двумя запросами и скомпилировать набор."""
+    rules = db.query(
+        CategorizationRule.id,
+        CategorizationRule.rule_type,
+        CategorizationRule.category_id,
+        CategorizationRule.confidence,
+        CategorizationRule.counterparty_inn,
+        CategorizationRule.counterparty_name,
+        CategorizationRule.business_operation,
+        CategorizationRule.keyword,
+        CategorizationRule.priority,
+    ).filter(
+        CategorizationRule.is_active == True,
+        CategorizationRule.category_id.isnot(None)
+    ).order_by(CategorizationRule.priority.desc()).all()
+
+    mappings = db.query(
+        BusinessOperationMapping.id,
+        BusinessOperationMapping.category_id,
+        BusinessOperationMapping.confidence,
+        BusinessOperationMapping.business_operation,
+    ).filter(
+        BusinessOperationMapping.is_active == True,
+        BusinessOperationMapping.category_id.isnot(None)
+    ).all()
+
+    return CompiledRuleSet(
+        version,
+        [
+            RuleEntry(
+                id=r.id,
+                category_id=r.category_id,
+                confidence=r.confidence,
+                counterparty_inn=r.counterparty_inn,
+                counterparty_name=r.counterparty_name,
+                business_operation=r.business_operation,
+                keyword=r.keyword,
+                priority=r.priority or 0,
+            )
+            for r in rules
+        ],
+        [r.rule_type for r in rules],
+        [
+            RuleEntry(
+                id=m.id,
+                category_id=m.category_id,
+                confidence=m.confidence,
+                business_operation=m.business_operation,
+            )
+            for m in mappings
+        ],
+    )
+
+
+def get_compiled_rules(db: Session) -> CompiledRuleSet:
+    """
+    Скомпилированный набор правил актуальной версии.
+
+    Перестраивается, только если версия в БД отличается от версии в памяти.
+    Если счетчик версии недоступен, набор строится без кэширования.
+    """
+    global _compiled
+
+    version = current_rule_version(db)
+    compiled = _compiled
+    if compiled is not None and version is not None and compiled.version == version:
+        return compiled
+
+    with _compile_lock:
+        compiled = _compiled
+        if compiled is not None and version is not None and compiled.version == version:
+            return compiled
+
+        try:
+            compiled = _compile(db, version)
+        except Exception as e:
+            # Классификатор должен работать и без правил (все транзакции останутся NEW)
+            logger.warning(f"Failed to compile categorization rules: {e}")
+            return CompiledRuleSet.empty()
+
+        if version is not None:
+            _compiled = compiled
+            logger.info(
+                f"Compiled rule set v{version}: {len(compiled.inn)} INN, {len(compiled.names)} name, "
+                f"{len(compiled.keywords)} keyword rules, {len(compiled.business_operation_mappings)} mappings"
+            )
+        return compiled
+
+
+def invalidate_compiled_rules() -> None:
+    """Сбросить набор правил текущего процесса."""
+    global _compiled
+    with _compile_lock:
+        _compiled = None
+
+
+def bump_rule_version(session: Session) -> None:
+    """Увеличить версию правил в текущей транзакции."""
+    updated = session.execute(
+        update(RuleSetVersion)
+        .where(RuleSetVersion.id == RULE_SET_VERSION_ID)
+        .values(version=RuleSetVersion.version + 1, updated_at=func.now())
+    ).rowcount
+    if not updated:
+        session.add(RuleSetVersion(id=RULE_SET_VERSION_ID, version=1))
+        session.flush()
+
+
+# ==================== Session listeners ====================
+
+def _affects_rules(obj, is_new: bool) -> bool:
+    if not isinstance(obj, _RULE_MODELS):
+        return False
+    # Неактивные заготовки (stub-маппинги импорта) в набор правил не попадают
+    if is_new and (not obj.is_active or obj.category_id is None):
+        return False
+    return True
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_rule_changes(session: Session, flush_context, instances) -> None:
+    """Заметить добавление/изменение/удаление правил и маппингов."""
+    if session.info.get(RULES_CHANGED_KEY):
+        return
+
+    changed = (
+        any(_affects_rules(obj, is_new=True) for obj in session.new)
+        or any(
+            _affects_rules(obj, is_new=False) and session.is_modified(obj)
+            for obj in session.dirty
+        )
+        or any(_affects_rules(obj, is_new=False) for obj in session.deleted)
+    )
+    if changed:
+        session.info[RULES_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_rule_changes(orm_execute_state) -> None:
+    """Заметить массовые UPDATE/DELETE по правилам и маппингам."""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in _RULE_MODELS:
+        orm_execute_state.session.info[RULES_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_version_on_rule_changes(session: Session) -> None:
+    """Увеличить версию правил в той же транзакции, что и изменения."""
+    session.flush()
+    if not session.info.pop(RULES_CHANGED_KEY, False):
+        return
+
+    session.info[RULES_BUMPED_KEY] = True
+    try:
+        with session.begin_nested():
+            bump_rule_version(session)
+    except Exception as e:
+        # Изменение правил не должно падать из-за счетчика; другие процессы
+        # увидят новые правила после следующего успешного увеличения версии
+        logger.warning(f"Rule set version bump failed: {e}")
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    if session.info.pop(RULES_BUMPED_KEY, False):
+        invalidate_compiled_rules()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rule_changes(session: Session) -> None:
+    session.info.pop(RULES_CHANGED_KEY, None)
+    session.info.pop(RULES_BUMPED_KEY, None)
@@ -0,0 +1,151 @@
+"""
+Мульти-шаблонный поиск правил категоризации (Aho–Corasick).
+
+Правила по ключевым словам и по имени контрагента компилируются один раз при
+загрузке кэша правил. Дальше поиск по тексту идет за один проход, а не за
+O(количество правил) проверок `keyword in text`.
+
+Семантика совпадает с линейным перебором в TransactionClassifier:
+- выигрывает первое подходящее правило в порядке приоритета (порядок списка);
+- ключевое слово ищется как подстрока назначения платежа (без учета регистра);
+- имя контрагента совпадает в обе стороны: имя правила содержится в имени
+  контрагента ИЛИ имя контрагента содержится в имени правила.
+"""
+from bisect import bisect_right
+from collections import deque
+from typing import Callable, Generic, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+_NO_MATCH = -1
+# Разделитель имен в склеенной строке для обратного поиска (не встречается в названиях)
+_NAME_SEPARATOR = "\x00"
+
+
+class AhoCorasickAutomaton:
+    """
+    Автомат Ахо–Корасик, возвращающий минимальный индекс совпавшего шаблона.
+
+    Индекс шаблона = позиция правила в списке по приоритету, поэтому минимальный
+    индекс - это правило, которое выиграло бы при линейном переборе.
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        # Узел: переходы, ссылка неудачи, лучший (минимальный) индекс шаблона
+        self._goto: List[dict] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[int] = [_NO_MATCH]
+
+        for index, pattern in enumerate(patterns):
+            if pattern:
+                self._add(pattern, index)
+        self._build()
+
+    def _add(self, pattern: str, index: int) -> None:
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(_NO_MATCH)
+            node = next_node
+
+        if self._best[node] == _NO_MATCH or index < self._best[node]:
+            self._best[node] = index
+
+    def _build(self) -> None:
+        """Ссылки неудачи (BFS) и протягивание лучшего индекса по ним."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(char, 0)
+                self._fail[child] = candidate if candidate != child else 0
+
+                inherited = self._best[self._fail[child]]
+                if inherited != _NO_MATCH and (
+                    self._best[child] == _NO_MATCH or inherited < self._best[child]
+                ):
+                    self._best[child] = inherited
+                queue.append(child)
+
+    def first_match(self, text: str) -> int:
+        """Минимальный индекс шаблона, входящего в text как подстрока, или -1."""
+        goto = self._goto
+        fail = self._fail
+        best_of = self._best
+
+        best = _NO_MATCH
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            candidate = best_of[node]
+            if candidate != _NO_MATCH and (best == _NO_MATCH or candidate < best):
+                best = candidate
+                if best == 0:
+                    break
+        return best
+
+
+class KeywordRuleMatcher(Generic[T]):
+    """Первое по приоритету правило, ключевое слово которого входит в текст."""
+
+    def __init__(self, rules: Sequence[T], get_keyword: Callable[[T], str]):
+        self._rules = list(rules)
+        self._automaton = AhoCorasickAutomaton(
+            [get_keyword(rule).lower() for rule in self._rules]
+        )
+
+    def match(self, text: str) -> Optional[T]:
+        if not self._rules or not text:
+            return None
+        index = self._automaton.first_match(text.lower())
+        return self._rules[index] if index != _NO_MATCH else None
+
+
+class NameRuleMatcher(Generic[T]):
+    """
+    Первое по приоритету правило с двунаправленным вхождением имени.
+
+    Прямое направление (имя правила в имени контрагента) - автомат Ахо–Корасик.
+    Обратное (имя контрагента в имени правила) - один str.find по склеенной
+    строке имен правил: первое вхождение приходится на правило с минимальным индексом.
+    """
+
+    def __init__(self, rules: Sequence[T], get_name: Callable[[T], str]):
+        self._rules = list(rules)
+        names = [get_name(rule).lower() for rule in self._rules]
+
+        self._automaton = AhoCorasickAutomaton(names)
+
+        self._joined = _NAME_SEPARATOR.join(names)
+        self._offsets: List[int] = []
+        offset = 0
+        for name in names:
+            self._offsets.append(offset)
+            offset += len(name) + len(_NAME_SEPARATOR)
+
+    def match(self, name: str) -> Optional[T]:
+        if not self._rules:
+            return None
+
+        name_lower = name.lower()
+        best = self._automaton.first_match(name_lower)
+
+        if _NAME_SEPARATOR not in name_lower:
+            position = self._joined.find(name_lower)
+            if position != -1:
+                reverse = bisect_right(self._offsets, position) - 1
+                if best == _NO_MATCH or reverse < best:
+                    best = reverse
+
+        return self._rules[best] if best != _NO_MATCH else None
@@ -0,0 +1,160 @@
+"""
+Предпросмотр правила категоризации (dry run) до его сохранения.
+
+1. Счетчики по всем активным транзакциям, подходящим под условие правила, -
+   один агрегирующий запрос по индексам:
+   - ИНН и бизнес-операция - равенство по btree-индексам;
+   - имя контрагента и ключевое слово - ILIKE по trgm-индексам
+     (ix_bank_tx_counterparty_name_trgm, ix_bank_tx_payment_purpose_trgm).
+2. Проверка приоритета на последних evaluate_limit подходящих транзакциях:
+   классификатор с набором правил, в который добавлен кандидат
+   (CompiledRuleSet.with_rule), показывает, где правило действительно сработает,
+   а где решение примет маппинг 1С или правило с большим приоритетом.
+
+Имя контрагента в классификаторе совпадает в обе стороны; обратное направление
+(имя контрагента содержится в имени правила) индексом не обслуживается и в
+счетчики не входит.
+"""
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.db.models import BankTransaction, CategorizationRuleTypeEnum
+from app.schemas.categorization_rule import CategorizationRuleCreate
+from app.services.rule_cache import RuleEntry, get_compiled_rules
+from app.services.transaction_classifier import TransactionClassifier
+from app.services.transaction_search import contains_filter
+
+# id кандидата в наборе правил (у сохраненных правил id > 0)
+CANDIDATE_RULE_ID = -1
+
+OUTCOME_NEW = "new"
+OUTCOME_CONFLICT = "conflict"
+OUTCOME_SAME = "same"
+OUTCOME_SHADOWED = "shadowed"
+
+
+def rule_match_value(rule: CategorizationRuleCreate) -> Optional[str]:
+    """Значение, по которому правило сопоставляется с транзакцией."""
+    return {
+        CategorizationRuleTypeEnum.COUNTERPARTY_INN: rule.counterparty_inn,
+        CategorizationRuleTypeEnum.COUNTERPARTY_NAME: rule.counterparty_name,
+        CategorizationRuleTypeEnum.BUSINESS_OPERATION: rule.business_operation,
+        CategorizationRuleTypeEnum.KEYWORD: rule.keyword,
+    }.get(rule.rule_type)
+
+
+def rule_match_condition(rule_type: CategorizationRuleTypeEnum, value: str) -> ColumnElement:
+    """Условие WHERE: транзакции, подходящие под правило (по индексам)."""
+    if rule_type == CategorizationRuleTypeEnum.COUNTERPARTY_INN:
+        return BankTransaction.counterparty_inn == value
+    if rule_type == CategorizationRuleTypeEnum.BUSINESS_OPERATION:
+        return BankTransaction.business_operation == value
+    if rule_type == CategorizationRuleTypeEnum.COUNTERPARTY_NAME:
+        return contains_filter(BankTransaction.counterparty_name, value)
+    return contains_filter(BankTransaction.payment_purpose, value)
+
+
+def preview_rule(
+    db: Session,
+    rule: CategorizationRuleCreate,
+    sample_size: int = 20,
+    evaluate_limit: int = 2000
+) -> Dict[str, Any]:
+    """
+    Оценить влияние правила на существующие транзакции.
+
+    Raises:
+        ValueError: если у правила не задано значение для его типа
+    """
+    value = (rule_match_value(rule) or "").strip()
+    if not value:
+        raise ValueError(f"Rule of type {rule.rule_type.value} has no match value")
+
+    T = BankTransaction
+    matched = db.query(T).filter(
+        T.is_active == True,
+        rule_match_condition(rule.rule_type, value)
+    )
+
+    totals = matched.with_entities(
+        func.count(T.id).label('matched'),
+        func.count(T.id).filter(T.category_id.is_(None)).label('uncategorized'),
+        func.count(T.id).filter(T.category_id == rule.category_id).label('same'),
+        func.count(T.id).filter(
+            T.category_id.isnot(None), T.category_id != rule.category_id
+        ).label('conflicting'),
+    ).one()
+
+    rows = [
+        row._asdict() for row in matched.with_entities(
+            T.id,
+            T.transaction_date,
+            T.amount,
+            T.counterparty_name,
+            T.counterparty_inn,
+            T.payment_purpose,
+            T.business_operation,
+            T.transaction_type,
+            T.status,
+            T.category_id,
+        ).order_by(T.transaction_date.desc(), T.id.desc()).limit(evaluate_limit).all()
+    ]
+
+    candidate = RuleEntry(
+        id=CANDIDATE_RULE_ID,
+        category_id=rule.category_id,
+        confidence=rule.confidence,
+        counterparty_inn=rule.counterparty_inn,
+        counterparty_name=rule.counterparty_name,
+        business_operation=rule.business_operation,
+        keyword=rule.keyword,
+        priority=rule.priority,
+    )
+    classifier = TransactionClassifier(
+        db, rules=get_compiled_rules(db).with_rule(candidate, rule.rule_type)
+    )
+    results = classifier.classify_many(rows, record_history=False)
+
+    counts = {OUTCOME_NEW: 0, OUTCOME_CONFLICT: 0, OUTCOME_SAME: 0, OUTCOME_SHADOWED: 0}
+    affected: List[Dict[str, Any]] = []
+    others: List[Dict[str, Any]] = []
+
+    for row, (category_id, _, _, is_rule_based) in zip(rows, results):
+        if not is_rule_based or category_id != rule.category_id:
+            outcome = OUTCOME_SHADOWED
+        elif row['category_id'] is None:
+            outcome = OUTCOME_NEW
+        elif row['category_id'] == rule.category_id:
+            outcome = OUTCOME_SAME
+        else:
+            outcome = OUTCOME_CONFLICT
+        counts[outcome] += 1
+
+        item = {
+            'id': row['id'],
+            'transaction_date': row['transaction_date'],
+            'amount': row['amount'],
+            'counterparty_name': row['counterparty_name'],
+            'counterparty_inn': row['counterparty_inn'],
+            'payment_purpose': row['payment_purpose'],
+            'status': getattr(row['status'], 'value', row['status']),
+            'current_category_id': row['category_id'],
+            'outcome': outcome,
+        }
+        (affected if outcome in (OUTCOME_NEW, OUTCOME_CONFLICT) else others).append(item)
+
+    return {
+        'matched_count': totals.matched,
+        'uncategorized_count': totals.uncategorized,
+        'same_category_count': totals.same,
+        'conflicting_count': totals.conflicting,
+        'evaluated_count': len(rows),
+        'would_categorize_count': counts[OUTCOME_NEW],
+        'would_conflict_count': counts[OUTCOME_CONFLICT],
+        'shadowed_count': counts[OUTCOME_SHADOWED],
+        # Сначала транзакции, которые правило изменит
+        'sample': (affected + others)[:sample_size],
+    }
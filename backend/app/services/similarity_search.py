@@ -0,0 +1,201 @@
+"""
+Поиск похожих транзакций для /bank-transactions/{id}/similar.
+
+Два шага, оба ограничены по объему независимо от размера таблицы:
+
+1. Кандидаты - несколько небольших запросов по индексам, каждый не больше
+   candidate_limit строк (только активные некатегоризированные транзакции того
+   же типа, без банковских комиссий):
+   - тот же ИНН контрагента (btree);
+   - похожее имя контрагента и похожее назначение платежа - KNN-поиск pg_trgm
+     (ORDER BY column <-> value LIMIT n) по частичным GiST-индексам
+     ix_bank_tx_counterparty_name_gist_trgm и ix_bank_tx_payment_purpose_gist_trgm
+     (активные без категории): индекс отдает строки в порядке сходства, и
+     сканирование останавливается на LIMIT. Порог сходства здесь не задается -
+     с фильтром '%' сканирование продолжалось бы до конца индекса, если
+     похожих строк меньше LIMIT; слабых кандидатов отсекает ранжирование.
+   Триграммы хранятся в самих индексах и обновляются PostgreSQL при
+   импорте/изменении строки - отдельной таблицы сигнатур не нужно.
+   В остальных СУБД (SQLite в тестах) - ILIKE по имени и индекс
+   transaction_keywords по значимым словам назначения.
+2. Ранжирование в Python по той же триграммной мере, что у pg_trgm:
+   - counterparty: 1.0 при совпадении ИНН, иначе сходство имен;
+   - purpose: сходство назначений платежа;
+   - score = 0.6 * max + 0.3 * min (если у исходной транзакции есть оба
+     признака, иначе 0.9 * признак) + 0.1 за ту же хозяйственную операцию.
+   В ответ попадают кандидаты со score >= similarity_threshold, лучшие первыми.
+"""
+import re
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from sqlalchemy import Float, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.db.models import BankTransaction, TransactionKeyword
+from app.services.keyword_tokenizer import extract_keywords
+from app.services.transaction_search import is_postgresql
+
+# Паттерны банковских комиссий и служебных операций - не предлагаются как похожие
+COMMISSION_PATTERNS = (
+    'комис%',
+    'пополнение по операции сбп%',
+    'плата за пакет%',
+    'плата за обслуживание%',
+    'плата за предоставление услуги%',
+    'плата за пополнение%',
+    'погашение задолженности по договору%',
+    'межбанки%',
+    'sms-банк%',
+    'sms банк%',
+    'смс-банк%',
+    'смс банк%',
+)
+
+# Строк из каждого источника кандидатов
+DEFAULT_CANDIDATE_LIMIT = 300
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+_CANDIDATE_COLUMNS = (
+    BankTransaction.id,
+    BankTransaction.counterparty_inn,
+    BankTransaction.counterparty_name,
+    BankTransaction.payment_purpose,
+    BankTransaction.business_operation,
+)
+
+
+def trigrams(text: Optional[str]) -> FrozenSet[str]:
+    """Триграммы текста так же, как в pg_trgm: слова в нижнем регистре с отступами."""
+    if not text:
+        return frozenset()
+    result = set()
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(result)
+
+
+def trigram_similarity(left: FrozenSet[str], right: FrozenSet[str]) -> float:
+    """Сходство двух наборов триграмм (как similarity() в pg_trgm)."""
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def _base_conditions(source: BankTransaction) -> list:
+    conditions = [
+        BankTransaction.is_active == True,
+        BankTransaction.id != source.id,
+        BankTransaction.category_id.is_(None),
+        BankTransaction.transaction_type == source.transaction_type,
+    ]
+    # NULL в payment_purpose не исключается
+    for pattern in COMMISSION_PATTERNS:
+        conditions.append(or_(
+            BankTransaction.payment_purpose.is_(None),
+            ~BankTransaction.payment_purpose.ilike(pattern)
+        ))
+    return conditions
+
+
+def _candidate_queries(db: Session, source: BankTransaction, candidate_limit: int) -> list:
+    base = select(*_CANDIDATE_COLUMNS).where(*_base_conditions(source))
+    queries = []
+
+    if source.counterparty_inn:
+        queries.append(
+            base.where(BankTransaction.counterparty_inn == source.counterparty_inn)
+            .order_by(BankTransaction.transaction_date.desc())
+            .limit(candidate_limit)
+        )
+
+    name = (source.counterparty_name or "").strip()
+    purpose = (source.payment_purpose or "").strip()
+
+    if is_postgresql(db):
+        for column, value in (
+            (BankTransaction.counterparty_name, name),
+            (BankTransaction.payment_purpose, purpose),
+        ):
+            if value:
+                # '<->' - триграммное расстояние (1 - similarity), KNN по GiST-индексу
+                queries.append(
+                    base.where(column.isnot(None))
+                    .order_by(column.op('<->', return_type=Float)(value))
+                    .limit(candidate_limit)
+                )
+        return queries
+
+    if name:
+        name_conditions = [BankTransaction.counterparty_name.ilike(name)]
+        first_word = name.split()[0]
+        if len(first_word) >= 3:
+            name_conditions.append(BankTransaction.counterparty_name.ilike(f"{first_word}%"))
+        queries.append(base.where(or_(*name_conditions)).limit(candidate_limit))
+
+    keywords = extract_keywords(purpose, min_length=6)[:3]
+    if keywords:
+        queries.append(
+            base.where(BankTransaction.id.in_(
+                select(TransactionKeyword.transaction_id)
+                .where(TransactionKeyword.keyword.in_(keywords))
+                .group_by(TransactionKeyword.transaction_id)
+                .having(func.count() == len(keywords))
+            )).limit(candidate_limit)
+        )
+    return queries
+
+
+def find_similar_transactions(
+    db: Session,
+    source: BankTransaction,
+    similarity_threshold: float = 0.5,
+    limit: int = 100,
+    candidate_limit: int = DEFAULT_CANDIDATE_LIMIT
+) -> List[Tuple[int, float]]:
+    """
+    Похожие транзакции для source.
+
+    Returns:
+        [(transaction_id, score), ...] со score >= similarity_threshold,
+        по убыванию score (не больше limit)
+    """
+    candidates: Dict[int, object] = {}
+    for query in _candidate_queries(db, source, candidate_limit):
+        for row in db.execute(query):
+            candidates.setdefault(row.id, row)
+
+    if not candidates:
+        return []
+
+    source_name = trigrams(source.counterparty_name)
+    source_purpose = trigrams(source.payment_purpose)
+    has_counterparty = bool(source.counterparty_inn or source_name)
+    has_purpose = bool(source_purpose)
+
+    scored = []
+    for row in candidates.values():
+        signals = []
+        if has_counterparty:
+            if source.counterparty_inn and row.counterparty_inn == source.counterparty_inn:
+                signals.append(1.0)
+            else:
+                signals.append(trigram_similarity(source_name, trigrams(row.counterparty_name)))
+        if has_purpose:
+            signals.append(trigram_similarity(source_purpose, trigrams(row.payment_purpose)))
+
+        if len(signals) == 2:
+            score = 0.6 * max(signals) + 0.3 * min(signals)
+        elif signals:
+            score = 0.9 * signals[0]
+        else:
+            score = 0.0
+        if source.business_operation and row.business_operation == source.business_operation:
+            score += 0.1
+
+        if score >= similarity_threshold:
+            scored.append((row.id, round(score, 4)))
+
+    scored.sort(key=lambda item: (-item[1], -item[0]))
+    return scored[:limit]
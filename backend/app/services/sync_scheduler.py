@@ -73,13 +73,24 @@ class SyncScheduler:
         # No previous sync, run now
         return True
 
+    def _is_full_sync_due(self, settings: SyncSettings) -> bool:
+        """Check if the next sync must be a full reconciliation sweep (not incremental)."""
+        if not settings.last_full_sync_at:
+            return True
+        hours_since_full_sync = (datetime.utcnow() - settings.last_full_sync_at).total_seconds() / 3600
+        return hours_since_full_sync >= settings.full_sync_interval_hours
+
     async def _run_sync(self, settings: SyncSettings) -> None:
         """Run the sync task."""
         from app.services.background_tasks import task_manager, TaskStatus
 
         db = self._get_db()
         try:
-            logger.info(f"Starting scheduled 1C sync (days_back={settings.sync_days_back})")
+            full_sync = self._is_full_sync_due(settings)
+            logger.info(
+                f"Starting scheduled 1C sync (days_back={settings.sync_days_back}, "
+                f"mode={'full' if full_sync else 'incremental'})"
+            )
 
             # Update sync settings
             try:
@@ -87,7 +98,10 @@ class SyncScheduler:
                 if db_settings:
                     db_settings.last_sync_started_at = datetime.utcnow()
                     db_settings.last_sync_status = "IN_PROGRESS"
-                    db_settings.last_sync_message = "Автоматическая синхронизация запущена"
+                    db_settings.last_sync_message = (
+                        "Автоматическая синхронизация запущена"
+                        + ("" if full_sync else " (инкрементальная)")
+                    )
                     db.commit()
                 else:
                     logger.warning("SyncSettings record not found, skipping update")
@@ -105,13 +119,14 @@ class SyncScheduler:
                 date_from=date_from,
                 date_to=date_to,
                 auto_classify=settings.auto_classify,
-                user_id=None  # System-initiated
+                user_id=None,  # System-initiated
+                incremental=not full_sync
             )
 
             logger.info(f"Scheduled sync started with task_id: {task_id}")
 
             # Monitor task completion in background
-            asyncio.create_task(self._monitor_task_completion(task_id))
+            asyncio.create_task(self._monitor_task_completion(task_id, full_sync=full_sync))
 
         except Exception as e:
             logger.exception("Failed to start scheduled sync")
@@ -128,8 +143,12 @@ class SyncScheduler:
         finally:
             db.close()
 
-    async def _monitor_task_completion(self, task_id: str) -> None:
-        """Monitor task and update SyncSettings when completed."""
+    async def _monitor_task_completion(self, task_id: str, full_sync: bool = False) -> None:
+        """
+        Monitor task and update SyncSettings when completed.
+
+        full_sync: успешная полная сверка откладывает следующую на full_sync_interval_hours.
+        """
         from app.services.background_tasks import task_manager, TaskStatus
 
         max_wait_time = 3600  # 1 hour max
@@ -155,6 +174,8 @@ class SyncScheduler:
 
                         if task.status == TaskStatus.COMPLETED:
                             db_settings.last_sync_status = "SUCCESS"
+                            if full_sync:
+                                db_settings.last_full_sync_at = db_settings.last_sync_completed_at
                             if task.result and isinstance(task.result, dict):
                                 # Format result message
                                 tx = task.result.get('transactions', {})
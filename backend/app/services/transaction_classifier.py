@@ -8,18 +8,32 @@ Transaction Classifier - Rule-based only
 
 Если правила нет - транзакция остаётся без категории (status = NEW)
 """
-from typing import Optional, Tuple, List, Dict
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Optional, Sequence, Set, Tuple, List, Dict, Union
 from decimal import Decimal
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import func, or_, select, update
 
 from app.db.models import (
     BankTransaction,
+    BankTransactionStatusEnum,
+    BankTransactionTypeEnum,
     BudgetCategory,
-    BusinessOperationMapping,
-    CategorizationRule,
-    CategorizationRuleTypeEnum,
+    SyncSettings,
 )
+from app.services.bulk_update import bulk_update_by_id
+from app.services.rule_cache import CompiledRuleSet, get_compiled_rules
+
+ClassificationResult = Tuple[Optional[int], float, str, bool]
+
+
+def _field(item: Union[BankTransaction, Dict[str, Any]], name: str) -> Any:
+    """Поле транзакции из ORM-объекта или словаря."""
+    if isinstance(item, dict):
+        return item.get(name)
+    return getattr(item, name, None)
 
 
 class TransactionClassifier:
@@ -56,63 +70,17 @@ class TransactionClassifier:
         'обслуживание карты',
     ]
 
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, rules: Optional[CompiledRuleSet] = None):
         self.db = db
-        # Кэшируем все правила категоризации при инициализации
-        self._rules_cache = self._load_rules_cache()
-
-    def _load_rules_cache(self) -> Dict[str, List]:
-        """
-        Загружает все активные правила категоризации в память для быстрого доступа.
-        Это значительно ускоряет классификацию, избегая повторных SQL-запросов.
-        """
-        cache = {
-            'business_operations': {},  # Dict[business_operation, rule]
-            'inn': {},                   # Dict[inn, rule]
-            'names': [],                 # List[rule] - для частичного совпадения
-            'keywords': [],              # List[rule] - для поиска по ключевым словам
-        }
-
-        try:
-            # Загружаем все активные правила одним запросом
-            all_rules = self.db.query(CategorizationRule).filter(
-                CategorizationRule.is_active == True,
-                CategorizationRule.category_id.isnot(None)
-            ).order_by(CategorizationRule.priority.desc()).all()
-
-            for rule in all_rules:
-                if rule.rule_type == CategorizationRuleTypeEnum.BUSINESS_OPERATION and rule.business_operation:
-                    # Для бизнес-операций берем правило с наивысшим приоритетом
-                    if rule.business_operation not in cache['business_operations']:
-                        cache['business_operations'][rule.business_operation] = rule
-
-                elif rule.rule_type == CategorizationRuleTypeEnum.COUNTERPARTY_INN and rule.counterparty_inn:
-                    # Для ИНН берем правило с наивысшим приоритетом
-                    if rule.counterparty_inn not in cache['inn']:
-                        cache['inn'][rule.counterparty_inn] = rule
-
-                elif rule.rule_type == CategorizationRuleTypeEnum.COUNTERPARTY_NAME and rule.counterparty_name:
-                    cache['names'].append(rule)
-
-                elif rule.rule_type == CategorizationRuleTypeEnum.KEYWORD and rule.keyword:
-                    cache['keywords'].append(rule)
-
-            # Также загружаем BusinessOperationMapping одним запросом
-            mappings = self.db.query(BusinessOperationMapping).filter(
-                BusinessOperationMapping.is_active == True,
-                BusinessOperationMapping.category_id.isnot(None)
-            ).all()
-
-            cache['business_operation_mappings'] = {
-                m.business_operation: m for m in mappings
-            }
-
-        except Exception as e:
-            # Если не удалось загрузить кэш, логируем ошибку
-            # но не падаем - методы смогут работать без кэша
-            print(f"Warning: Failed to load rules cache: {e}")
-
-        return cache
+        # Общий для процесса скомпилированный набор правил (перестраивается
+        # только при изменении версии правил, см. rule_cache); rules - явный
+        # набор, например с кандидатом для предпросмотра правила
+        self._rules = rules if rules is not None else get_compiled_rules(db)
+        # Индекс исторических категорий по ИНН строится лениво (см. _match_historical)
+        self._historical_index = None
+        self._historical_inns: Set[str] = set()  # ИНН, загруженные в индекс частично
+        self._historical_complete = False         # индекс загружен по всем ИНН
+        self._category_names: Dict[int, str] = {}
 
     def classify(
         self,
@@ -182,13 +150,60 @@ class TransactionClassifier:
         # No rule matched - return None (transaction stays uncategorized)
         return None, 0.0, "Нет подходящего правила категоризации", False
 
+    def classify_many(
+        self,
+        items: Sequence[Union[BankTransaction, Dict[str, Any]]],
+        record_history: bool = True
+    ) -> List[ClassificationResult]:
+        """
+        Классифицировать пачку транзакций.
+
+        Принимает объекты BankTransaction или словари с теми же полями
+        (payment_purpose, counterparty_name, counterparty_inn, amount,
+        transaction_type, business_operation). Результаты - в порядке входа,
+        в том же формате, что у classify().
+
+        Маппинги и правила уже лежат в кэше (словари и автоматы), а исторический
+        индекс догружается одним запросом по всем ИНН пачки. Если record_history,
+        транзакции, категоризированные правилом, сразу учитываются в истории -
+        как при последовательных вызовах classify() с record_categorization().
+        """
+        if not items:
+            return []
+
+        if not self._historical_complete:
+            self._load_historical_index(
+                inns={_field(item, 'counterparty_inn') for item in items}
+            )
+
+        results: List[ClassificationResult] = []
+        for item in items:
+            result = self.classify(
+                payment_purpose=_field(item, 'payment_purpose'),
+                counterparty_name=_field(item, 'counterparty_name'),
+                counterparty_inn=_field(item, 'counterparty_inn'),
+                amount=_field(item, 'amount'),
+                transaction_type=_field(item, 'transaction_type'),
+                business_operation=_field(item, 'business_operation')
+            )
+            category_id, _, _, is_rule_based = result
+            if record_history and category_id and is_rule_based:
+                self.record_categorization(
+                    _field(item, 'counterparty_inn'),
+                    _field(item, 'transaction_type'),
+                    category_id
+                )
+            results.append(result)
+
+        return results
+
     def _match_business_operation(
         self,
         business_operation: str
     ) -> Optional[Tuple[int, float, str, bool]]:
         """Match by BusinessOperationMapping (ХозяйственнаяОперация from 1C) - RULE"""
         # Проверяем кэш BusinessOperationMapping
-        mapping = self._rules_cache.get('business_operation_mappings', {}).get(business_operation)
+        mapping = self._rules.business_operation_mappings.get(business_operation)
 
         if mapping and mapping.category_id:
             confidence = float(mapping.confidence) if mapping.confidence else self.CONFIDENCE_BUSINESS_OP
@@ -200,7 +215,7 @@ class TransactionClassifier:
             )
 
         # Если не нашли в BusinessOperationMapping, проверяем CategorizationRule из кэша
-        rule = self._rules_cache.get('business_operations', {}).get(business_operation)
+        rule = self._rules.business_operations.get(business_operation)
 
         if rule and rule.category_id:
             confidence = float(rule.confidence) if rule.confidence else self.CONFIDENCE_BUSINESS_OP
@@ -219,7 +234,7 @@ class TransactionClassifier:
     ) -> Optional[Tuple[int, float, str, bool]]:
         """Match by CategorizationRule with INN - RULE"""
         # Ищем в кэше (уже отсортированы по приоритету)
-        rule = self._rules_cache.get('inn', {}).get(counterparty_inn)
+        rule = self._rules.inn.get(counterparty_inn)
 
         if rule:
             confidence = float(rule.confidence) if rule.confidence else self.CONFIDENCE_RULE_INN
@@ -236,22 +251,18 @@ class TransactionClassifier:
         counterparty_name: str
     ) -> Optional[Tuple[int, float, str, bool]]:
         """Match by CategorizationRule with counterparty name (partial match) - RULE"""
-        name_lower = counterparty_name.lower()
+        # Check if rule name is contained in counterparty name or vice versa
+        # (первое по приоритету правило, поиск - скомпилированным автоматом)
+        rule = self._rules.name_matcher.match(counterparty_name)
 
-        # Используем кэш (правила уже отсортированы по приоритету)
-        rules = self._rules_cache.get('names', [])
-
-        for rule in rules:
-            rule_name = rule.counterparty_name.lower()
-            # Check if rule name is contained in counterparty name or vice versa
-            if rule_name in name_lower or name_lower in rule_name:
-                confidence = float(rule.confidence) if rule.confidence else self.CONFIDENCE_RULE_NAME
-                return (
-                    rule.category_id,
-                    confidence,
-                    f"Правило по имени контрагента: '{rule.counterparty_name}'",
-                    True  # is_rule_based
-                )
+        if rule:
+            confidence = float(rule.confidence) if rule.confidence else self.CONFIDENCE_RULE_NAME
+            return (
+                rule.category_id,
+                confidence,
+                f"Правило по имени контрагента: '{rule.counterparty_name}'",
+                True  # is_rule_based
+            )
         return None
 
     def _match_rule_by_keyword(
@@ -259,21 +270,17 @@ class TransactionClassifier:
         payment_purpose: str
     ) -> Optional[Tuple[int, float, str, bool]]:
         """Match by CategorizationRule with keyword in payment purpose - RULE"""
-        purpose_lower = payment_purpose.lower()
-
-        # Используем кэш (правила уже отсортированы по приоритету)
-        rules = self._rules_cache.get('keywords', [])
+        # Первое по приоритету правило, ключевое слово которого входит в назначение
+        rule = self._rules.keyword_matcher.match(payment_purpose)
 
-        for rule in rules:
-            keyword = rule.keyword.lower()
-            if keyword in purpose_lower:
-                confidence = float(rule.confidence) if rule.confidence else self.CONFIDENCE_RULE_KEYWORD
-                return (
-                    rule.category_id,
-                    confidence,
-                    f"Правило по ключевому слову: '{rule.keyword}'",
-                    True  # is_rule_based
-                )
+        if rule:
+            confidence = float(rule.confidence) if rule.confidence else self.CONFIDENCE_RULE_KEYWORD
+            return (
+                rule.category_id,
+                confidence,
+                f"Правило по ключевому слову: '{rule.keyword}'",
+                True  # is_rule_based
+            )
         return None
 
     def _detect_bank_commission(
@@ -300,18 +307,38 @@ class TransactionClassifier:
                 )
         return None
 
-    def _match_historical(
-        self,
-        counterparty_inn: str,
-        transaction_type: Optional[str] = None
-    ) -> Optional[Tuple[int, float, str, bool]]:
+    def preload_historical_index(self) -> None:
+        """Загрузить исторический индекс по всем ИНН (импорт большого числа транзакций)."""
+        self._load_historical_index()
+
+    def _load_historical_index(self, inns: Optional[Iterable[Optional[str]]] = None) -> None:
         """
-        Match by historical data - same INN was categorized before - AI HEURISTIC.
-        Now also considers transaction_type to avoid mismatches
-        (e.g., bank commissions vs payments from the same bank).
+        Строит индекс исторических категорий одним GROUP BY запросом:
+        (counterparty_inn, transaction_type) -> {category_id: count}.
+
+        Ключ с transaction_type=None хранит сумму по всем типам
+        (для вызовов без типа транзакции).
+
+        Без inns индекс строится по всем ИНН. С inns - догружаются только
+        ИНН, которых еще нет в индексе (пакетная классификация).
         """
-        # Build query with optional transaction_type filter
+        if inns is None:
+            self._historical_index = None
+
+        if self._historical_index is None:
+            self._historical_index: Dict[Tuple[str, Optional[str]], Dict[int, int]] = defaultdict(
+                lambda: defaultdict(int)
+            )
+            self._historical_inns = set()
+
+        if inns is not None:
+            inns = {inn for inn in inns if inn} - self._historical_inns
+            if not inns:
+                return
+
         query = self.db.query(
+            BankTransaction.counterparty_inn,
+            BankTransaction.transaction_type,
             BankTransaction.category_id,
             BudgetCategory.name,
             func.count(BankTransaction.id).label('count')
@@ -319,31 +346,94 @@ class TransactionClassifier:
             BudgetCategory,
             BankTransaction.category_id == BudgetCategory.id
         ).filter(
-            BankTransaction.counterparty_inn == counterparty_inn,
+            BankTransaction.counterparty_inn.isnot(None),
             BankTransaction.category_id.isnot(None),
             BankTransaction.is_active == True,
             # Only use approved or manually categorized transactions
             BankTransaction.status.in_(['APPROVED', 'CATEGORIZED'])
         )
+        if inns is not None:
+            query = query.filter(BankTransaction.counterparty_inn.in_(inns))
+
+        rows = query.group_by(
+            BankTransaction.counterparty_inn,
+            BankTransaction.transaction_type,
+            BankTransaction.category_id,
+            BudgetCategory.name
+        ).all()
+
+        if inns is None:
+            self._historical_complete = True
+        else:
+            self._historical_inns.update(inns)
+
+        for row in rows:
+            transaction_type = self._type_key(row.transaction_type)
+            self._historical_index[(row.counterparty_inn, transaction_type)][row.category_id] += row.count
+            self._historical_index[(row.counterparty_inn, None)][row.category_id] += row.count
+            self._category_names[row.category_id] = row.name
+
+    @staticmethod
+    def _type_key(transaction_type) -> Optional[str]:
+        """DEBIT/CREDIT как строка (принимает enum или строку)."""
+        if transaction_type is None:
+            return None
+        return getattr(transaction_type, 'value', transaction_type)
+
+    def record_categorization(
+        self,
+        counterparty_inn: Optional[str],
+        transaction_type,
+        category_id: Optional[int]
+    ) -> None:
+        """
+        Учесть в историческом индексе транзакцию, категоризированную в текущем прогоне
+        (статус CATEGORIZED/APPROVED), чтобы следующие транзакции того же ИНН ее видели.
+        """
+        if not counterparty_inn or not category_id or self._historical_index is None:
+            return
+        if not self._historical_complete and counterparty_inn not in self._historical_inns:
+            # ИНН еще не загружен - транзакция попадет в индекс при его загрузке
+            return
+
+        self._historical_index[(counterparty_inn, self._type_key(transaction_type))][category_id] += 1
+        self._historical_index[(counterparty_inn, None)][category_id] += 1
+        if category_id not in self._category_names:
+            category = self.db.query(BudgetCategory.name).filter(BudgetCategory.id == category_id).first()
+            self._category_names[category_id] = category.name if category else ''
+
+    def _match_historical(
+        self,
+        counterparty_inn: str,
+        transaction_type: Optional[str] = None
+    ) -> Optional[Tuple[int, float, str, bool]]:
+        """
+        Match by historical data - same INN was categorized before - AI HEURISTIC.
+        Now also considers transaction_type to avoid mismatches
+        (e.g., bank commissions vs payments from the same bank).
+
+        Если индекс не загружен целиком (preload_historical_index), ИНН
+        догружается отдельно - одиночный запрос не сканирует всю историю.
+        """
+        if not self._historical_complete and counterparty_inn not in self._historical_inns:
+            self._load_historical_index([counterparty_inn])
 
         # IMPORTANT: Filter by transaction_type if provided
         # This prevents mixing DEBIT (expenses) and CREDIT (income) categories
-        if transaction_type:
-            query = query.filter(BankTransaction.transaction_type == transaction_type)
+        type_key = self._type_key(transaction_type) if transaction_type else None
+        counts = self._historical_index.get((counterparty_inn, type_key))
+        if not counts:
+            return None
 
-        result = query.group_by(
-            BankTransaction.category_id,
-            BudgetCategory.name
-        ).order_by(
-            func.count(BankTransaction.id).desc()
-        ).first()
+        # Самая частая категория (при равенстве - с меньшим id)
+        category_id, count = min(counts.items(), key=lambda item: (-item[1], item[0]))
 
-        if result and result.count >= self.MIN_HISTORICAL_TRANSACTIONS:
+        if count >= self.MIN_HISTORICAL_TRANSACTIONS:
             type_note = f" (тип: {transaction_type})" if transaction_type else ""
             return (
-                result.category_id,
+                category_id,
                 self.CONFIDENCE_HISTORICAL,
-                f"Исторические данные: ИНН {counterparty_inn}{type_note} → '{result.name}' ({result.count} транзакций)",
+                f"Исторические данные: ИНН {counterparty_inn}{type_note} → '{self._category_names.get(category_id, '')}' ({count} транзакций)",
                 False  # is_rule_based = False (AI heuristic)
             )
         return None
@@ -388,88 +478,219 @@ class TransactionClassifier:
         return unique[:top_n]
 
 
+def apply_classification_results(
+    db: Session,
+    transactions: Sequence[Union[BankTransaction, Dict[str, Any]]],
+    results: Sequence[ClassificationResult]
+) -> int:
+    """
+    Записать результаты classify_many() в транзакции.
+
+    Логика та же, что при поштучном применении:
+    - правило (is_rule_based=True) → category_id, CATEGORIZED;
+    - эвристика → suggested_category_id, NEEDS_REVIEW;
+    - без категории → транзакция не меняется.
+
+    Новые (еще не записанные) объекты получают значения в памяти и уходят в
+    INSERT при flush. Уже сохраненные строки (объекты с id или словари с 'id')
+    обновляются одним UPDATE ... FROM (VALUES ...), состояние ORM-объектов
+    синхронизируется без повторной записи.
+
+    Returns:
+        Количество транзакций, категоризированных правилом.
+    """
+    categorized = 0
+    persisted_rows: List[Dict[str, Any]] = []
+    persisted_objects: List[Tuple[BankTransaction, Dict[str, Any]]] = []
+
+    for transaction, (category_id, confidence, _, is_rule_based) in zip(transactions, results):
+        if not category_id:
+            continue
+
+        changes: Dict[str, Any] = {'category_confidence': Decimal(str(confidence))}
+        if is_rule_based:
+            changes['category_id'] = category_id
+            changes['status'] = BankTransactionStatusEnum.CATEGORIZED
+            categorized += 1
+        else:
+            changes['suggested_category_id'] = category_id
+            changes['status'] = BankTransactionStatusEnum.NEEDS_REVIEW
+
+        transaction_id = _field(transaction, 'id')
+        if transaction_id is None:
+            if isinstance(transaction, dict):
+                transaction.update(changes)
+            else:
+                for key, value in changes.items():
+                    setattr(transaction, key, value)
+            continue
+
+        persisted_rows.append({'id': transaction_id, **changes})
+        if not isinstance(transaction, dict):
+            persisted_objects.append((transaction, changes))
+
+    if persisted_rows:
+        # Одинаковый набор колонок для всех строк VALUES; NULL - оставить текущее значение
+        columns = ['category_id', 'suggested_category_id', 'category_confidence', 'status']
+        for row in persisted_rows:
+            row.setdefault('category_id', None)
+            row.setdefault('suggested_category_id', None)
+
+        bulk_update_by_id(
+            db, BankTransaction, persisted_rows, columns,
+            keep_existing_on_null=['category_id', 'suggested_category_id']
+        )
+
+        for transaction, changes in persisted_objects:
+            for key, value in changes.items():
+                set_committed_value(transaction, key, value)
+
+    return categorized
+
+
 class RegularPaymentDetector:
-    """Detect regular payments (subscriptions, rent, etc.)"""
+    """
+    Detect regular payments (subscriptions, rent, etc.)
+
+    Обнаружение - один запрос: интервалы между платежами контрагента через
+    LAG() OVER (PARTITION BY counterparty_inn ORDER BY transaction_date),
+    среднее и stddev_pop интервалов по ИНН, затем группы (ИНН, имя, категория)
+    по расходным транзакциям. Платеж регулярный, если разброс интервалов меньше
+    30% среднего.
+
+    Инкрементальный режим пересматривает только ИНН, неотмеченные транзакции
+    которых добавлены или изменены после предыдущего запуска
+    (SyncSettings.last_regular_payments_run_at).
+    """
+
+    MIN_TRANSACTIONS = 3
+    MAX_INTERVAL_DEVIATION = 0.3
+    # Запас для транзакций, которые были незакоммичены в момент предыдущего запуска
+    INCREMENTAL_OVERLAP = timedelta(hours=1)
 
     def __init__(self, db: Session):
         self.db = db
 
-    def detect_patterns(self) -> List[Dict]:
-        """Detect regular payment patterns"""
-        patterns = []
-
-        # Group by counterparty INN
-        transactions_by_inn = self.db.query(
-            BankTransaction.counterparty_inn,
-            BankTransaction.counterparty_name,
-            BankTransaction.category_id,
-            func.count(BankTransaction.id).label('count'),
-            func.avg(BankTransaction.amount).label('avg_amount'),
-            func.max(BankTransaction.transaction_date).label('last_date')
-        ).filter(
-            BankTransaction.counterparty_inn.isnot(None),
-            BankTransaction.is_active == True,
-            BankTransaction.transaction_type == 'DEBIT'
+    def _patterns_query(self, touched_since: Optional[datetime] = None):
+        """SELECT групп регулярных платежей (ИНН, имя, категория) со статистикой."""
+        T = BankTransaction
+
+        inn_filter = [T.counterparty_inn.isnot(None), T.is_active == True]
+        if touched_since is not None:
+            inn_filter.append(T.counterparty_inn.in_(
+                # UPDATE отметки сам сдвигает updated_at (onupdate), поэтому
+                # уже отмеченные транзакции ИНН в пересмотр не возвращают
+                select(T.counterparty_inn).where(
+                    T.counterparty_inn.isnot(None),
+                    T.is_regular_payment == False,
+                    or_(T.created_at >= touched_since, T.updated_at >= touched_since)
+                ).distinct()
+            ))
+
+        previous_date = func.lag(T.transaction_date).over(
+            partition_by=T.counterparty_inn, order_by=T.transaction_date
+        )
+        intervals = select(
+            T.counterparty_inn.label('inn'),
+            func.date_part('day', T.transaction_date - previous_date).label('interval_days'),
+        ).where(*inn_filter).subquery('intervals')
+
+        avg_interval = func.avg(intervals.c.interval_days)
+        stats = select(
+            intervals.c.inn,
+            avg_interval.label('avg_interval'),
+        ).group_by(intervals.c.inn).having(
+            func.count(intervals.c.interval_days) >= self.MIN_TRANSACTIONS - 1,
+            func.stddev_pop(intervals.c.interval_days) < avg_interval * self.MAX_INTERVAL_DEVIATION
+        ).subquery('interval_stats')
+
+        transaction_count = func.count(T.id)
+        return select(
+            T.counterparty_inn,
+            T.counterparty_name,
+            T.category_id,
+            BudgetCategory.name.label('category_name'),
+            transaction_count.label('count'),
+            func.avg(T.amount).label('avg_amount'),
+            func.max(T.transaction_date).label('last_date'),
+            stats.c.avg_interval,
+        ).join(
+            stats, stats.c.inn == T.counterparty_inn
+        ).outerjoin(
+            BudgetCategory, BudgetCategory.id == T.category_id
+        ).where(
+            T.is_active == True,
+            T.transaction_type == BankTransactionTypeEnum.DEBIT
         ).group_by(
-            BankTransaction.counterparty_inn,
-            BankTransaction.counterparty_name,
-            BankTransaction.category_id
+            T.counterparty_inn,
+            T.counterparty_name,
+            T.category_id,
+            BudgetCategory.name,
+            stats.c.avg_interval,
         ).having(
-            func.count(BankTransaction.id) >= 3
+            transaction_count >= self.MIN_TRANSACTIONS
+        )
+
+    def detect_patterns(self, touched_since: Optional[datetime] = None) -> List[Dict]:
+        """Detect regular payment patterns"""
+        rows = self.db.execute(
+            self._patterns_query(touched_since).order_by(
+                BankTransaction.counterparty_inn, BankTransaction.counterparty_name
+            )
         ).all()
 
-        for group in transactions_by_inn:
-            dates = self.db.query(BankTransaction.transaction_date).filter(
-                BankTransaction.counterparty_inn == group.counterparty_inn,
-                BankTransaction.is_active == True
-            ).order_by(BankTransaction.transaction_date).all()
-
-            if len(dates) < 3:
-                continue
-
-            date_list = [d.transaction_date for d in dates]
-            intervals = []
-            for i in range(1, len(date_list)):
-                delta = (date_list[i] - date_list[i-1]).days
-                intervals.append(delta)
-
-            avg_interval = sum(intervals) / len(intervals)
-            interval_std = (sum((x - avg_interval) ** 2 for x in intervals) / len(intervals)) ** 0.5
-
-            # If interval is consistent (low variance), it's a regular payment
-            if interval_std < avg_interval * 0.3:
-                category = None
-                if group.category_id:
-                    category = self.db.query(BudgetCategory).filter(
-                        BudgetCategory.id == group.category_id
-                    ).first()
-
-                patterns.append({
-                    'counterparty_inn': group.counterparty_inn,
-                    'counterparty_name': group.counterparty_name,
-                    'category_id': group.category_id,
-                    'category_name': category.name if category else None,
-                    'avg_amount': float(group.avg_amount),
-                    'frequency_days': int(avg_interval),
-                    'last_payment_date': group.last_date.isoformat(),
-                    'transaction_count': group.count,
-                    'is_monthly': 25 <= avg_interval <= 35,
-                    'is_quarterly': 85 <= avg_interval <= 95,
-                })
+        patterns = []
+        for row in rows:
+            avg_interval = float(row.avg_interval)
+            patterns.append({
+                'counterparty_inn': row.counterparty_inn,
+                'counterparty_name': row.counterparty_name,
+                'category_id': row.category_id,
+                'category_name': row.category_name,
+                'avg_amount': float(row.avg_amount),
+                'frequency_days': int(avg_interval),
+                'last_payment_date': row.last_date.isoformat(),
+                'transaction_count': row.count,
+                'is_monthly': 25 <= avg_interval <= 35,
+                'is_quarterly': 85 <= avg_interval <= 95,
+            })
 
         return patterns
 
-    def mark_regular_payments(self) -> int:
-        """Mark transactions as regular payments"""
-        patterns = self.detect_patterns()
-        marked_count = 0
-
-        for pattern in patterns:
-            updated = self.db.query(BankTransaction).filter(
-                BankTransaction.counterparty_inn == pattern['counterparty_inn'],
-                BankTransaction.is_active == True
-            ).update({'is_regular_payment': True})
-            marked_count += updated
+    def mark_regular_payments(self, incremental: bool = False) -> int:
+        """
+        Mark transactions as regular payments (один UPDATE ... FROM).
+
+        Args:
+            incremental: Пересмотреть только ИНН, затронутые после прошлого запуска
+
+        Returns:
+            Количество вновь отмеченных транзакций
+        """
+        sync_settings = self.db.query(SyncSettings).filter(SyncSettings.id == 1).first()
+        started_at = self.db.query(func.now()).scalar()
+
+        touched_since = None
+        if incremental and sync_settings and sync_settings.last_regular_payments_run_at:
+            touched_since = sync_settings.last_regular_payments_run_at - self.INCREMENTAL_OVERLAP
+
+        regular = self._patterns_query(touched_since).with_only_columns(
+            BankTransaction.counterparty_inn
+        ).distinct().subquery('regular_inns')
+
+        marked_count = self.db.execute(
+            update(BankTransaction)
+            .where(
+                BankTransaction.counterparty_inn == regular.c.counterparty_inn,
+                BankTransaction.is_active == True,
+                BankTransaction.is_regular_payment == False
+            )
+            .values(is_regular_payment=True)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        if sync_settings:
+            sync_settings.last_regular_payments_run_at = started_at
 
         self.db.commit()
         return marked_count
@@ -0,0 +1,78 @@
+"""
+Поиск по банковским транзакциям.
+
+В PostgreSQL подстрочный поиск ILIKE '%term%' по counterparty_name,
+counterparty_inn, payment_purpose и document_number обслуживается GIN-индексами
+pg_trgm (см. миграцию add_bank_tx_trigram_search), а релевантность считается
+через word_similarity(). В остальных СУБД (SQLite в тестах) используется тот же
+ILIKE без индексов и упрощенный ранг на CASE-выражениях.
+"""
+from typing import Optional
+
+from sqlalchemy import or_, case, func
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.db.models import BankTransaction
+
+# Поля, по которым ищет параметр search
+SEARCH_COLUMNS = (
+    BankTransaction.counterparty_name,
+    BankTransaction.counterparty_inn,
+    BankTransaction.payment_purpose,
+    BankTransaction.document_number,
+)
+
+LIKE_ESCAPE = "\\"
+
+
+def _escape_like(value: str) -> str:
+    """Экранирует спецсимволы LIKE, чтобы '%' и '_' в запросе искались буквально."""
+    return (
+        value.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2)
+        .replace("%", f"{LIKE_ESCAPE}%")
+        .replace("_", f"{LIKE_ESCAPE}_")
+    )
+
+
+def is_postgresql(db: Session) -> bool:
+    """True, если сессия работает с PostgreSQL."""
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def contains_filter(column, value: str) -> ColumnElement:
+    """column ILIKE '%value%' с экранированием (обслуживается trgm-индексом)."""
+    return column.ilike(f"%{_escape_like(value)}%", escape=LIKE_ESCAPE)
+
+
+def build_search_filter(search: str) -> ColumnElement:
+    """Условие WHERE для поиска по подстроке во всех полях поиска."""
+    term = search.strip()
+    return or_(*[contains_filter(column, term) for column in SEARCH_COLUMNS])
+
+
+def build_search_rank(db: Session, search: str) -> Optional[ColumnElement]:
+    """
+    Выражение релевантности (больше - лучше) для ORDER BY.
+
+    PostgreSQL: максимум word_similarity() по полям поиска (pg_trgm).
+    Прочие СУБД: точное совпадение ИНН/номера документа > начало названия > вхождение.
+    """
+    term = search.strip()
+    if not term:
+        return None
+
+    if is_postgresql(db):
+        return func.greatest(*[
+            func.coalesce(func.word_similarity(term, column), 0.0)
+            for column in SEARCH_COLUMNS
+        ])
+
+    escaped = _escape_like(term)
+    return case(
+        (BankTransaction.counterparty_inn == term, 3),
+        (BankTransaction.document_number == term, 3),
+        (BankTransaction.counterparty_name.ilike(f"{escaped}%", escape=LIKE_ESCAPE), 2),
+        (build_search_filter(term), 1),
+        else_=0,
+    )
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: linear rule scan vs Aho–Corasick matcher (keyword and name rules)"""
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.rule_matcher import KeywordRuleMatcher, NameRuleMatcher
+
+RULES_COUNT = 3000
+TEXTS_COUNT = 5000
+SEED = 42
+
+WORDS = [
+    "оплата", "счет", "договор", "аренда", "поставка", "товар", "услуги", "связь",
+    "интернет", "электроэнергия", "транспорт", "доставка", "ремонт", "обслуживание",
+    "лицензия", "подписка", "реклама", "консультация", "выставка", "материалы",
+    "ооо", "ао", "ип", "торговый", "дом", "сервис", "групп", "логистик", "строй", "техно",
+]
+
+
+def random_phrase(rng: random.Random, min_words: int, max_words: int) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words) + f" {rng.randint(1, 99999)}"
+
+
+def linear_keyword(rules, text):
+    """Прежняя реализация _match_rule_by_keyword."""
+    purpose_lower = text.lower()
+    for rule in rules:
+        if rule.keyword.lower() in purpose_lower:
+            return rule
+    return None
+
+
+def linear_name(rules, name):
+    """Прежняя реализация _match_rule_by_name."""
+    name_lower = name.lower()
+    for rule in rules:
+        rule_name = rule.counterparty_name.lower()
+        if rule_name in name_lower or name_lower in rule_name:
+            return rule
+    return None
+
+
+def bench(label, func, items):
+    start = time.perf_counter()
+    results = [func(item) for item in items]
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<14} {elapsed * 1000:9.1f} мс  ({elapsed / len(items) * 1e6:7.1f} мкс/операция)")
+    return results, elapsed
+
+
+def main():
+    rng = random.Random(SEED)
+
+    keyword_rules = [
+        SimpleNamespace(id=i, keyword=random_phrase(rng, 1, 2).upper())
+        for i in range(RULES_COUNT)
+    ]
+    name_rules = [
+        SimpleNamespace(id=i, counterparty_name=random_phrase(rng, 2, 3))
+        for i in range(RULES_COUNT)
+    ]
+    # Часть текстов гарантированно содержит правило
+    purposes = [
+        random_phrase(rng, 8, 20) + (f" {rng.choice(keyword_rules).keyword}" if i % 3 == 0 else "")
+        for i in range(TEXTS_COUNT)
+    ]
+    names = [
+        rng.choice(name_rules).counterparty_name.upper() if i % 3 == 0 else random_phrase(rng, 2, 3)
+        for i in range(TEXTS_COUNT)
+    ]
+
+    print(f"\n=== Бенчмарк сопоставления правил: {RULES_COUNT} правил, {TEXTS_COUNT} текстов ===\n")
+
+    start = time.perf_counter()
+    keyword_matcher = KeywordRuleMatcher(keyword_rules, lambda r: r.keyword)
+    name_matcher = NameRuleMatcher(name_rules, lambda r: r.counterparty_name)
+    print(f"Компиляция автоматов: {(time.perf_counter() - start) * 1000:.1f} мс\n")
+
+    print("Ключевые слова:")
+    linear_kw, linear_kw_time = bench("линейно", lambda t: linear_keyword(keyword_rules, t), purposes)
+    ac_kw, ac_kw_time = bench("Aho–Corasick", keyword_matcher.match, purposes)
+
+    print("Имена контрагентов:")
+    linear_nm, linear_nm_time = bench("линейно", lambda n: linear_name(name_rules, n), names)
+    ac_nm, ac_nm_time = bench("Aho–Corasick", name_matcher.match, names)
+
+    same = linear_kw == ac_kw and linear_nm == ac_nm
+    print(f"\nРезультаты совпадают: {'✓' if same else '✗'}")
+    print(f"Ускорение: ключевые слова x{linear_kw_time / ac_kw_time:.1f}, "
+          f"имена x{linear_nm_time / ac_nm_time:.1f}\n")
+
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
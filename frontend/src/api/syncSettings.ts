@@ -8,6 +8,7 @@ export interface SyncSettings {
   sync_time_minute: number | null
   auto_classify: boolean
   sync_days_back: number
+  full_sync_interval_hours: number
   auto_sync_expenses_enabled: boolean
   sync_expenses_interval_hours: number
   // FTP import settings
@@ -26,6 +27,7 @@ export interface SyncSettings {
   last_sync_completed_at: string | null
   last_sync_status: 'SUCCESS' | 'FAILED' | 'IN_PROGRESS' | null
   last_sync_message: string | null
+  last_full_sync_at: string | null
   created_at: string
   updated_at: string
 }
@@ -37,6 +39,7 @@ export interface SyncSettingsUpdate {
   sync_time_minute?: number | null
   auto_classify?: boolean
   sync_days_back?: number
+  full_sync_interval_hours?: number
   auto_sync_expenses_enabled?: boolean
   sync_expenses_interval_hours?: number
   // FTP import settings
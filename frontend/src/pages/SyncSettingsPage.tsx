@@ -94,6 +94,7 @@ const SyncSettingsPage: React.FC = () => {
         sync_time_minute: data.sync_time_minute,
         auto_classify: data.auto_classify,
         sync_days_back: data.sync_days_back,
+        full_sync_interval_hours: data.full_sync_interval_hours,
         auto_sync_expenses_enabled: data.auto_sync_expenses_enabled,
         sync_expenses_interval_hours: data.sync_expenses_interval_hours,
         // FTP settings
@@ -122,6 +123,7 @@ const SyncSettingsPage: React.FC = () => {
         sync_time_minute: values.sync_time_minute,
         auto_classify: values.auto_classify,
         sync_days_back: values.sync_days_back,
+        full_sync_interval_hours: values.full_sync_interval_hours,
         auto_sync_expenses_enabled: values.auto_sync_expenses_enabled,
         sync_expenses_interval_hours: values.sync_expenses_interval_hours,
         // FTP settings
@@ -282,6 +284,7 @@ const SyncSettingsPage: React.FC = () => {
                 sync_time_minute: 0,
                 auto_classify: true,
                 sync_days_back: 30,
+                full_sync_interval_hours: 24,
                 auto_sync_expenses_enabled: false,
                 sync_expenses_interval_hours: 24,
                 ftp_import_enabled: false,
@@ -358,6 +361,20 @@ const SyncSettingsPage: React.FC = () => {
                 />
               </Form.Item>
 
+              <Form.Item
+                name="full_sync_interval_hours"
+                label="Полная сверка раз в N часов"
+                rules={[{ required: true, message: 'Укажите интервал' }]}
+                tooltip="Между полными сверками за N дней автоматическая синхронизация загружает только новые документы 1С"
+              >
+                <InputNumber
+                  min={1}
+                  max={720}
+                  style={{ width: '200px' }}
+                  suffix="ч."
+                />
+              </Form.Item>
+
               <Form.Item
                 name="auto_classify"
                 label="Автоматическая категоризация"